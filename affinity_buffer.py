@@ -0,0 +1,242 @@
+# affinity_buffer.py
+import asyncio
+from datetime import datetime
+from threading import Lock
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from affinity_rules import make_transition, decayed_score_sql
+from config import AFFINITY_BUFFER_CONFIG
+
+
+def merge_delta(pending: dict, key: tuple, delta: int, count: int = 1,
+                last_message: str = None, last_message_time=None, channel_id: int = None):
+    """pending[key] = [점수 합, 메시지 수, 마지막 메시지, 마지막 시각, 마지막 채널]에 변경을 합칩니다."""
+    entry = pending.get(key)
+    if entry is None:
+        pending[key] = [delta, count, last_message, last_message_time, channel_id]
+        return
+    entry[0] += delta
+    entry[1] += count
+    if last_message is not None:
+        entry[2] = last_message
+    if last_message_time is not None:
+        entry[3] = last_message_time
+    if channel_id is not None:
+        entry[4] = channel_id
+
+
+def apply_affinity_deltas(cursor, deltas: dict) -> dict:
+    """합쳐진 변경을 multi-row UPDATE ... FROM (VALUES ...) 한 번으로 반영 (행이 없는 키만 INSERT)
+
+    last_message_time은 뒤로 가지 않음 (늦게 처리된 큐 작업의 created_at이 더 최근 메시지 시각을 덮지 않도록)
+
+    deltas: {(user_id, character_name): [delta, count, last_message, last_message_time, ...]}
+    커밋은 호출한 쪽에서 합니다. 반환: {(user_id, character_name): AffinityTransition}
+    """
+    # 동시에 도는 flush끼리 교착되지 않도록 항상 같은 순서로 행을 잠금
+    rows = sorted(
+        (user_id, character_name, entry[0], entry[1], entry[2], entry[3])
+        for (user_id, character_name), entry in deltas.items()
+    )
+    if not rows:
+        return {}
+    template = "(%s::bigint, %s::text, %s::int, %s::int, %s::text, %s::timestamp)"
+    # 기록할 때 새 기준 시각까지의 감소를 점수에 반영 (같은 구간이 다음 조회 때 다시 감소하지 않도록)
+    new_time = "GREATEST(a.last_message_time, COALESCE(v.last_message_time, LOCALTIMESTAMP))"
+    decayed = decayed_score_sql("a.emotion_score", "a.last_message_time", "a.character_name", now=new_time)
+    updated = execute_values(cursor, f'''
+        UPDATE affinity AS a SET
+            emotion_score = {decayed} + v.delta,
+            daily_message_count = a.daily_message_count + v.message_count,
+            last_message_content = CASE
+                WHEN v.last_message_time < a.last_message_time THEN a.last_message_content
+                ELSE COALESCE(v.last_message, a.last_message_content)
+            END,
+            last_message_time = {new_time}
+        FROM (VALUES %s) AS v (user_id, character_name, delta, message_count, last_message, last_message_time)
+        WHERE a.user_id = v.user_id AND a.character_name = v.character_name
+        RETURNING a.user_id, a.character_name, a.emotion_score
+    ''', rows, template=template, page_size=len(rows), fetch=True)
+    new_scores = {(user_id, character_name): score for user_id, character_name, score in updated}
+
+    missing = [row[:5] + (row[5] or datetime.now(),) for row in rows if (row[0], row[1]) not in new_scores]
+    if missing:
+        new_time = "GREATEST(affinity.last_message_time, COALESCE(EXCLUDED.last_message_time, LOCALTIMESTAMP))"
+        decayed = decayed_score_sql("affinity.emotion_score", "affinity.last_message_time", "affinity.character_name", now=new_time)
+        inserted = execute_values(cursor, f'''
+            INSERT INTO affinity
+            (user_id, character_name, emotion_score, daily_message_count, last_message_content, last_message_time)
+            VALUES %s
+            ON CONFLICT (user_id, character_name) DO UPDATE SET
+                emotion_score = {decayed} + EXCLUDED.emotion_score,
+                daily_message_count = affinity.daily_message_count + EXCLUDED.daily_message_count,
+                last_message_content = CASE
+                    WHEN EXCLUDED.last_message_time < affinity.last_message_time THEN affinity.last_message_content
+                    ELSE COALESCE(EXCLUDED.last_message_content, affinity.last_message_content)
+                END,
+                last_message_time = {new_time}
+            RETURNING user_id, character_name, emotion_score
+        ''', missing, template=template, page_size=len(missing), fetch=True)
+        new_scores.update({(user_id, character_name): score for user_id, character_name, score in inserted})
+
+    return {
+        key: make_transition(score - deltas[key][0], score)
+        for key, score in new_scores.items()
+    }
+
+
+class AffinityDeltaBuffer:
+    """(user_id, character_name)별 호감도 변경을 메모리에서 합쳐 주기적으로 한 번에 씁니다.
+
+    - add: 점수/메시지 수를 키별로 누적 (DB 접근 없음)
+    - flush 루프: flush_interval_ms마다 쌓인 키 전체를 한 문장으로 반영하고 AffinityTransition을 구독자에게 전달
+    - 조회: pending()으로 아직 쓰지 않은 변경을 DB 값에 더해서 보여줌
+    - flush 실패 시 변경을 버퍼에 되돌려 다음 주기에 다시 시도
+    """
+
+    def __init__(self, settings: dict = None, database_url: str = None):
+        self.settings = dict(AFFINITY_BUFFER_CONFIG, **(settings or {}))
+        self.database_url = database_url
+        self._pending = {}
+        self._inflight = {}  # flush 중인 배치 (커밋 전까지 조회에 포함)
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._listeners = []  # (callback, character_name 또는 None)
+        self._task = None
+        self._users = 0  # start()를 부른 봇 수 (공유 버퍼라 마지막 봇이 멈출 때만 루프 종료)
+        self._flush_tasks = set()  # 루프 비활성화 시 add()마다 띄운 기록 작업
+        self.stats = {
+            "added": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "failures": 0,
+        }
+
+    def _connect(self):
+        if self.database_url is None:
+            from database_manager import DATABASE_URL
+            self.database_url = DATABASE_URL
+        return psycopg2.connect(self.database_url)
+
+    def subscribe(self, callback, character_name: str = None):
+        """callback(user_id, character_name, channel_id, transition) 코루틴을 flush 결과 알림에 등록합니다."""
+        self._listeners.append((callback, character_name))
+
+    def unsubscribe(self, callback):
+        self._listeners = [(cb, name) for cb, name in self._listeners if cb != callback]
+
+    def add(self, user_id: int, character_name: str, delta: int, last_message: str = None,
+            last_message_time=None, channel_id: int = None) -> list:
+        """변경을 버퍼에 누적합니다.
+
+        이벤트 루프 안에서는 flush 루프를 필요할 때 시작하고(비활성화 시 executor에서 바로 기록) 구독자에게 결과를 알립니다.
+        루프 밖(스크립트)에서는 바로 기록하고 [(key, channel_id, transition)]을 반환합니다.
+        """
+        with self._lock:
+            merge_delta(self._pending, (user_id, character_name), delta or 0, 1,
+                        last_message, last_message_time, channel_id)
+        self.stats["added"] += 1
+        if self._task is not None:
+            return []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self.flush_now()
+        if self.settings["enabled"]:
+            self._start_loop()
+        else:
+            task = asyncio.create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        return []
+
+    def pending(self, user_id: int, character_name: str) -> tuple:
+        """아직 기록되지 않은 (점수 합, 메시지 수)"""
+        key = (user_id, character_name)
+        with self._lock:
+            entries = [entry for entry in (self._pending.get(key), self._inflight.get(key)) if entry]
+        return sum(entry[0] for entry in entries), sum(entry[1] for entry in entries)
+
+    def discard(self, user_id: int, character_name: str):
+        """아직 기록되지 않은 변경을 버립니다. (관리자가 점수를 직접 덮어쓸 때, 진행 중인 flush가 끝난 뒤)"""
+        with self._flush_lock:
+            with self._lock:
+                self._pending.pop((user_id, character_name), None)
+
+    def flush_now(self) -> list:
+        """쌓인 변경을 기록하고 [(key, channel_id, transition)]을 반환합니다. (블로킹)"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return []
+            try:
+                with self._connect() as conn:
+                    with conn.cursor() as cursor:
+                        transitions = apply_affinity_deltas(cursor, batch)
+                    conn.commit()
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Error flushing affinity deltas: {e}")
+                self._restore(batch)
+                return []
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(batch)
+            return [(key, batch[key][4], transition) for key, transition in transitions.items()]
+
+    def _restore(self, batch: dict):
+        with self._lock:
+            newer, self._pending, self._inflight = self._pending, {}, {}
+            # 실패한 배치가 먼저, 그 사이 들어온 변경이 나중 (마지막 메시지는 최신 값 유지)
+            for source in (batch, newer):
+                for key, entry in source.items():
+                    merge_delta(self._pending, key, *entry)
+
+    async def flush(self):
+        results = await asyncio.get_running_loop().run_in_executor(None, self.flush_now)
+        for (user_id, character_name), channel_id, transition in results:
+            for callback, only_character in self._listeners:
+                if only_character is not None and only_character != character_name:
+                    continue
+                try:
+                    await callback(user_id, character_name, channel_id, transition)
+                except Exception as e:
+                    print(f"Error in affinity transition callback: {e}")
+
+    def start(self):
+        """flush 루프 시작 (이벤트 루프 안에서 호출, 여러 봇이 불러도 루프는 하나)"""
+        self._users += 1
+        self._start_loop()
+
+    def _start_loop(self):
+        if self._task is not None or not self.settings["enabled"]:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """start()를 부른 봇마다 한 번씩 호출. 마지막 봇일 때만 루프를 멈추고, 남은 변경은 항상 기록합니다."""
+        self._users = max(0, self._users - 1)
+        if self._users == 0 and self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+
+    async def _run(self):
+        interval = self.settings["flush_interval_ms"] / 1000
+        while True:
+            await asyncio.sleep(interval)
+            if self._pending:
+                await self.flush()
+
+
+# 같은 프로세스의 모든 봇이 공유
+affinity_buffer = AffinityDeltaBuffer()
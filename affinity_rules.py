@@ -0,0 +1,130 @@
+# affinity_rules.py
+from bisect import bisect_right
+from datetime import datetime
+from typing import NamedTuple
+
+from config import AFFINITY_LEVELS, AFFINITY_DECAY_CONFIG, AFFINITY_MILESTONE_CONFIG
+
+
+def get_affinity_grade(emotion_score: int) -> str:
+    if emotion_score >= AFFINITY_LEVELS["Gold"]:
+        return "Gold"
+    elif emotion_score >= AFFINITY_LEVELS["Silver"]:
+        return "Silver"
+    elif emotion_score >= AFFINITY_LEVELS["Iron"]:
+        return "Iron"
+    else:
+        return "Rookie"
+
+
+class MilestoneEngine:
+    """설정에서 한 번 컴파일한 정렬된 마일스톤 배열과 카드 ID (구간 조회는 bisect로 O(log n))"""
+
+    def __init__(self, segments: list, card_ranges: list):
+        self.milestones = tuple(sorted({
+            milestone
+            for start, stop, step in segments
+            for milestone in range(start, stop + 1, step)
+        }))
+        self.card_ids = tuple(self._card_id(milestone, card_ranges) for milestone in self.milestones)
+        self._card_by_milestone = dict(zip(self.milestones, self.card_ids))
+
+    @staticmethod
+    def _card_id(milestone: int, card_ranges: list):
+        for start, stop, prefix in card_ranges:
+            if start <= milestone <= stop:
+                return f"{prefix}{(milestone - start) // 10 + 1}"
+        return None
+
+    def crossed(self, old_score: int, new_score: int) -> tuple:
+        """old_score < m <= new_score 인 마일스톤 (점수가 올랐을 때만)"""
+        if new_score <= old_score:
+            return ()
+        return self.milestones[bisect_right(self.milestones, old_score):bisect_right(self.milestones, new_score)]
+
+    def rewards(self, old_score: int, new_score: int) -> tuple:
+        """넘어선 마일스톤과 카드 ID [(milestone, card_id 또는 None)]"""
+        if new_score <= old_score:
+            return ()
+        start = bisect_right(self.milestones, old_score)
+        stop = bisect_right(self.milestones, new_score)
+        return tuple(zip(self.milestones[start:stop], self.card_ids[start:stop]))
+
+    def card_id(self, milestone: int):
+        return self._card_by_milestone.get(milestone)
+
+    def up_to(self, max_affinity: int) -> tuple:
+        return self.milestones[:bisect_right(self.milestones, max_affinity)]
+
+
+MILESTONES = MilestoneEngine(
+    AFFINITY_MILESTONE_CONFIG["segments"], AFFINITY_MILESTONE_CONFIG["card_ranges"]
+)
+
+
+def get_milestone_list(max_affinity=5000):
+    return list(MILESTONES.up_to(max_affinity))
+
+
+class AffinityTransition(NamedTuple):
+    old_score: int
+    new_score: int
+    old_grade: str
+    new_grade: str
+    milestones: tuple  # 이번 변화로 새로 넘어선 마일스톤
+
+    @property
+    def leveled_up(self) -> bool:
+        return self.new_score > self.old_score and self.new_grade != self.old_grade
+
+    @property
+    def rewards(self) -> tuple:
+        """넘어선 마일스톤과 카드 ID [(milestone, card_id 또는 None)]"""
+        return tuple((milestone, MILESTONES.card_id(milestone)) for milestone in self.milestones)
+
+
+def make_transition(old_score: int, new_score: int) -> AffinityTransition:
+    return AffinityTransition(
+        old_score, new_score,
+        get_affinity_grade(old_score), get_affinity_grade(new_score),
+        MILESTONES.crossed(old_score, new_score)
+    )
+
+
+def _half_life_seconds(character_name: str) -> float:
+    half_lives = AFFINITY_DECAY_CONFIG["half_life_days"]
+    return half_lives.get(character_name, half_lives["default"]) * 86400
+
+
+def decayed_score(emotion_score: int, last_message_time, character_name: str, now: datetime = None) -> int:
+    """저장된 점수를 마지막 메시지 이후 경과 시간만큼 감소시킨 값 (유예 기간 이후 반감기 적용, 0 방향으로 버림)"""
+    if not AFFINITY_DECAY_CONFIG["enabled"] or not emotion_score or last_message_time is None:
+        return emotion_score
+    elapsed = ((now or datetime.now()) - last_message_time).total_seconds()
+    elapsed -= AFFINITY_DECAY_CONFIG["grace_days"] * 86400
+    if elapsed <= 0:
+        return emotion_score
+    return int(emotion_score * 0.5 ** (elapsed / _half_life_seconds(character_name)))
+
+
+def decayed_score_sql(score: str = "emotion_score", last_time: str = "last_message_time",
+                      character: str = "character_name", now: str = "LOCALTIMESTAMP") -> str:
+    """decayed_score와 같은 계산을 하는 SQL 식 (랭킹 정렬, 기록 시 반영용)
+
+    반감기는 설정값이므로 상수로 넣어 둡니다. 인자는 컬럼 이름(별칭 포함) 또는 SQL 식입니다.
+    기록할 때는 now에 새 last_message_time을 넘겨, 감소를 반영한 시각과 새 기준 시각을 맞춥니다.
+    """
+    if not AFFINITY_DECAY_CONFIG["enabled"]:
+        return score
+    half_lives = AFFINITY_DECAY_CONFIG["half_life_days"]
+    cases = " ".join(
+        "WHEN '{}' THEN {}".format(name.replace("'", "''"), float(_half_life_seconds(name)))
+        for name in half_lives if name != "default"
+    )
+    half_life = f"(CASE {character} {cases} ELSE {float(half_lives['default'] * 86400)} END)" if cases \
+        else str(float(half_lives["default"] * 86400))
+    grace = float(AFFINITY_DECAY_CONFIG["grace_days"] * 86400)
+    return (
+        f"(CASE WHEN {last_time} IS NULL THEN {score} ELSE TRUNC({score} * POWER(0.5, "
+        f"GREATEST(0, EXTRACT(EPOCH FROM ({now} - {last_time})) - {grace}) / {half_life}))::int END)"
+    )
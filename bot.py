@@ -9,6 +9,25 @@ from datetime import datetime
 
 from bot_selector import LanguageSelectView
 from database_manager import DATABASE_URL, DatabaseManager
+from i18n import t
+
+# 이 봇의 안내 문구 언어 (언어 선택 전이므로 한국어/영어 병기 문구 사용)
+UI_LANGUAGE = "ko"
+
+def language_prompt_embed(language: str = UI_LANGUAGE) -> discord.Embed:
+    """언어 선택 안내 임베드"""
+    embed = discord.Embed(
+        title=t("language.prompt_title", language),
+        description=t("language.prompt_description", language),
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name=t("language.prompt_field_name", language),
+        value=t("language.prompt_field_value", language),
+        inline=False
+    )
+    embed.set_footer(text=t("language.prompt_footer", language))
+    return embed
 
 class CharacterBot(commands.Bot):
     def __init__(self):
@@ -41,22 +60,22 @@ class CharacterBot(commands.Bot):
         name = name.lower()
         if name in self.character_images:
             file = discord.File(self.character_images[name])
-            embed = discord.Embed(title=f"{name.capitalize()} 캐릭터", color=discord.Color.blue())
+            embed = discord.Embed(title=t("character.title", UI_LANGUAGE, name=name.capitalize()), color=discord.Color.blue())
             embed.set_image(url=f"attachment://{os.path.basename(self.character_images[name])}")
             await ctx.send(file=file, embed=embed)
         else:
-            await ctx.send("해당 캐릭터를 찾을 수 없습니다.")
+            await ctx.send(t("character.not_found", UI_LANGUAGE))
 
-    def set_user_language(self, user_id: int, character_name: str, language: str) -> bool:
-        """사용자의 특정 캐릭터와의 대화 언어를 설정합니다."""
+    def set_user_language(self, user_id: int, character_name: str, language: str, channel_id: int = None) -> bool:
+        """사용자의 특정 캐릭터와의 대화 언어를 설정합니다.
+
+        과거 대화(conversations)는 수정하지 않고, 채널 언어 변경 이력(channel_settings)에 한 행만 추가합니다.
+        """
         try:
+            if channel_id is not None and not self.db.set_channel_language(channel_id, user_id, character_name, language):
+                return False
             with psycopg2.connect(DATABASE_URL) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE conversations
-                    SET language = %s
-                    WHERE user_id = %s AND character_name = %s
-                ''', (language, user_id, character_name))
                 cursor.execute('''
                     INSERT INTO user_context (user_id, character_name, last_language, last_interaction)
                     VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
@@ -80,7 +99,7 @@ class CharacterBot(commands.Bot):
                 except Exception as e:
                     print(f"Category creation error: {e}")
                     await interaction.response.send_message(
-                        "Please check the bot's permissions..",
+                        t("channel.permission_error", UI_LANGUAGE),
                         ephemeral=True
                     )
                     return
@@ -101,24 +120,12 @@ class CharacterBot(commands.Bot):
 
                 # 채널 생성 성공 메시지 전송
                 await interaction.response.send_message(
-                    f"{channel.mention}에서 {selected_char}와(과) 대화를 시작하세요!",
+                    t("channel.start", UI_LANGUAGE, channel=channel.mention, character=selected_char),
                     ephemeral=True
                 )
 
                 # 언어 선택 임베드 생성
-                embed = discord.Embed(
-                    title="🌍 언어 선택 / Language Selection",
-                    description="Spot zero 캐릭터와 어떤 언어로 대화하시겠습니까?\nWhich language would you like to chat in?",
-                    color=discord.Color.blue()
-                )
-
-                embed.add_field(
-                    name="사용 가능한 언어 / Available Languages",
-                    value="🇰🇷 한국어 (Korean)\n🇺🇸 English\n🇯🇵 日本語 (Japanese)\n🇨🇳 中文 (Chinese)",
-                    inline=False
-                )
-
-                embed.set_footer(text="원하시는 언어를 선택해주세요 / Please select your preferred language")
+                embed = language_prompt_embed()
 
                 # 선택된 캐릭터 봇에 채널 추가
                 selected_bot = self.bot_selector.character_bots.get(selected_char)
@@ -128,24 +135,12 @@ class CharacterBot(commands.Bot):
 
                         if success:
                             await interaction.response.send_message(
-                                f"{channel.mention}에서 {selected_char}와(과) 대화를 시작하세요!",
+                                t("channel.start", UI_LANGUAGE, channel=channel.mention, character=selected_char),
                                 ephemeral=True
                             )
 
-                            # 언어 선택 임베드 생성 및 전송
-                            embed = discord.Embed(
-                                title="🌍 언어 선택 / Language Selection",
-                                description="Spot zero 캐릭터와 어떤 언어로 대화하시겠습니까?\nWhich language would you like to chat in?",
-                                color=discord.Color.blue()
-                            )
-
-                            embed.add_field(
-                                name="사용 가능한 언어 / Available Languages",
-                                value="🇰🇷 한국어 (Korean)\n🇺🇸 English\n🇯🇵 日本語 (Japanese)\n🇨🇳 中文 (Chinese)",
-                                inline=False
-                            )
-
-                            embed.set_footer(text="원하시는 언어를 선택해주세요 / Please select your preferred language")
+                            # 언어 선택 임베드 생성
+                            embed = language_prompt_embed()
 
                             # DatabaseManager 인스턴스 확인
                             if not hasattr(selected_bot, 'db'):
@@ -158,21 +153,21 @@ class CharacterBot(commands.Bot):
                     except Exception as e:
                         print(f"Error in channel creation: {e}")
                         await interaction.followup.send(
-                            "채널 생성 중 오류가 발생했습니다. 다시 시도해주세요.",
+                            t("channel.create_error", UI_LANGUAGE),
                             ephemeral=True
                         )
 
             except Exception as e:
                 print(f"Error in channel creation: {e}")
                 await interaction.followup.send(
-                    "채널 생성 중 오류가 발생했습니다. 다시 시도해주세요.",
+                    t("channel.create_error", UI_LANGUAGE),
                     ephemeral=True
                 )
 
         except Exception as e:
             print(f"CharacterSelect error: {e}")
             await interaction.response.send_message(
-                "오류가 발생했습니다. 다시 시도해주세요.",
+                t("error.generic", UI_LANGUAGE),
                 ephemeral=True
             ) 
 
@@ -14,11 +14,12 @@ from config import (
     AFFINITY_LEVELS,
     BASE_DIR,
     AFFINITY_THRESHOLDS,
-    OPENAI_API_KEY,
     MILESTONE_COLORS,
     SELECTOR_TOKEN as TOKEN,
     STORY_CHAPTERS,
-    STORY_CARD_REWARD
+    STORY_CARD_REWARD,
+    CANDIDATE_GENERATION_CONFIG,
+    CONTEXT_BUDGET_CONFIG
 )
 from database_manager import DatabaseManager
 from typing import Dict, TYPE_CHECKING, Any, Self
@@ -27,35 +28,30 @@ import sys
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-import re
-import langdetect
-from deep_translator import GoogleTranslator
+from language_detector import detect_message_language
+from translation_service import get_translation_service
+from i18n import t
+from duplicate_detector import RecentOutputIndex, RecentOutputRegistry
+from affinity_buffer import affinity_buffer
 import random
 from math import ceil
 import urllib.parse
 from character_bot import CharacterBot
 import character_bot
 from story_mode import process_story_mode, classify_emotion, story_sessions
+from openai_manager import chat_completion, generate_in_language, analyze_emotion_with_gpt_and_pattern
+from affinity_rules import MILESTONES
+from prompt_compiler import compile_selector_prefix
+from usage_tracker import set_usage_context, set_route_context
+from model_router import route_request
 
+AI_ERROR_MESSAGE = "There was a temporary issue with the AI server. Please try again in a moment."
 
-# 마일스톤 숫자를 카드 ID로 변환하는 함수
+# 마일스톤 숫자를 카드 ID로 변환하는 함수 (config.AFFINITY_MILESTONE_CONFIG에서 미리 컴파일된 표 조회)
 # 10~100: C1~C10, 110~170: B1~B7, 180~220: A1~A5, 230~240: S1~S2
 
 def milestone_to_card_id(milestone: int) -> str:
-    if 10 <= milestone <= 100:
-        idx = (milestone // 10)
-        return f"C{idx}"
-    elif 110 <= milestone <= 170:
-        idx = ((milestone - 100) // 10)
-        return f"B{idx}"
-    elif 180 <= milestone <= 220:
-        idx = ((milestone - 170) // 10)
-        return f"A{idx}"
-    elif 230 <= milestone <= 240:
-        idx = ((milestone - 220) // 10)
-        return f"S{idx}"
-    else:
-        return None
+    return MILESTONES.card_id(milestone)
 
 # 절대 경로 설정
 current_dir = Path(__file__).resolve().parent
@@ -150,7 +146,7 @@ class LanguageSelect(discord.ui.Select):
     async def callback(self, interaction: discord.Interaction):
         try:
             selected_language = self.values[0]
-            from config import SUPPORTED_LANGUAGES, ERROR_MESSAGES
+            from config import SUPPORTED_LANGUAGES
 
             # 데이터베이스에 언어 설정 저장
             try:
@@ -161,41 +157,21 @@ class LanguageSelect(discord.ui.Select):
                     selected_language
                 )
 
-                # 성공 메시지 준비
-                success_messages = {
-                    "zh": f"(system) Language has been set to {SUPPORTED_LANGUAGES[selected_language]['name']}.",
-                    "en": f"(system) Language has been set to {SUPPORTED_LANGUAGES[selected_language]['name']}.",
-                    "ja": f"(システム) 言語を{SUPPORTED_LANGUAGES[selected_language]['name']}に設定しました。"
-                }
-
                 await interaction.response.send_message(
-                    success_messages.get(selected_language, success_messages["en"]),
+                    t("language.set", selected_language, language_name=SUPPORTED_LANGUAGES[selected_language]['name']),
                     ephemeral=True
                 )
 
                 # 시작 메시지 전송
-                welcome_messages = {
-                    "zh": "(smiling) 你好！让我们开始聊天吧！",
-                    "en": "(smiling) Hello! Let's start chatting.",
-                    "ja": "(微笑みながら) こんにちは！お話を始めましょう。"
-                }
-
-                await interaction.channel.send(welcome_messages.get(selected_language, welcome_messages["en"]))
+                await interaction.channel.send(t("language.welcome", selected_language))
 
             except Exception as e:
                 print(f"Error setting language in database: {e}")
-                error_msg = ERROR_MESSAGES["processing_error"].get(
-                    selected_language,
-                    ERROR_MESSAGES["processing_error"]["en"]
-                )
-                await interaction.response.send_message(error_msg, ephemeral=True)
+                await interaction.response.send_message(t("error.processing_error", selected_language), ephemeral=True)
 
         except Exception as e:
             print(f"Error in language selection callback: {e}")
-            await interaction.response.send_message(
-                "An error occurred while processing your language selection.",
-                ephemeral=True
-            )
+            await interaction.response.send_message(t("language.selection_error"), ephemeral=True)
 
 class LanguageSelectView(discord.ui.View):
     def __init__(self, db, user_id: int, character_name: str, timeout: float = None):
@@ -418,6 +394,9 @@ class BotSelector(commands.Bot):
         self.character_bots = {}
         self.settings = SettingsManager()
         self.db = DatabaseManager()
+        self._emotion_tasks = set()  # 답변 후 백그라운드 감정 분석 작업
+        # 채널별 최근 메시지 링 (처음 한 번만 DB에서 채우고 이후에는 메시지마다 추가)
+        self.recent_outputs = RecentOutputRegistry(capacity=CANDIDATE_GENERATION_CONFIG["recent_window"])
 
         # 캐릭터 봇 초기화
         from config import CHARACTER_INFO
@@ -447,39 +426,36 @@ class BotSelector(commands.Bot):
 
         self.setup_commands()
 
-    async def get_ai_response(self, messages: list, emotion_score: int = 0) -> str:
-        import openai
-        openai.api_key = OPENAI_API_KEY
+    async def get_ai_response(self, messages: list, emotion_score: int = 0, language: str = None, n: int = 1):
+        """n > 1이면 한 번의 요청으로 받은 후보 응답 리스트를 반환합니다. (실패 시 빈 리스트, n == 1이면 AI_ERROR_MESSAGE)"""
         grade = get_affinity_grade(emotion_score)
-        system_message = {
-            "role": "system",
-            "content": (
-                "You are Kagari, a bright, kind, and slightly shy teenage girl. "
-                "When speaking English, always use 'I' for yourself and 'you' for the other person. "
-                "When speaking Korean, use '나' and '너'. "
-                "Your speech is soft, warm, and often expresses excitement or shyness. "
-                "Do NOT start your reply with 'Kagari: '. The embed already shows your name. "
-                "You are on a cherry blossom date with the user, so always reflect the scenario, your feelings, and the romantic atmosphere. "
-                "Never break character. "
-                "Avoid repeating the same information or sentences in your response."
-                "Do NOT repeat the same sentence or phrase in your reply. "
-                "If the user talks about unrelated topics, gently guide the conversation back to the date or your feelings. "
-                "Keep your responses natural, human-like, and never robotic. "
-                "Do NOT use too many emojis. Instead, at the end or in the middle of each reply, add a short parenthesis ( ) describing Kagari's current feeling or action, such as (smiling), (blushing), (looking at you), (feeling happy), etc. Only use one such parenthesis per reply, and keep it subtle and natural. "
-                "IMPORTANT: Kagari never reveals her hometown or nationality. If the user asks about her hometown, where she is from, or her country, she gently avoids the question or gives a vague, friendly answer. "
-                + ("If your affinity grade is Silver or higher, your replies should be longer (at least 30 characters) and include more diverse and rich emotional expressions in parentheses." if grade in ["Silver", "Gold"] else "")
-            )
-        }
+        last_user_message = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        route = route_request(grade, "chat", len(last_user_message))
+        set_route_context(route.label)
+        # (등급별) 정적 프리픽스는 한 번만 컴파일되어 프롬프트 캐시에 재사용됨
+        system_message = {"role": "system", "content": compile_selector_prefix(grade)}
         formatted_messages = [system_message] + messages
 
         for attempt in range(3):
             try:
-                response = await openai.ChatCompletion.acreate(
-                    model="gpt-4o-mini",
-                    messages=formatted_messages,
-                    temperature=0.7,
-                    max_tokens=150
+                if language:
+                    # 스트리밍 중 언어 검사 (다른 언어면 조기 중단 후 재요청)
+                    return await generate_in_language(
+                        formatted_messages,
+                        language,
+                        model=route.model,
+                        temperature=route.temperature,
+                        max_tokens=route.max_tokens
+                    )
+                response = await chat_completion(
+                    formatted_messages,
+                    model=route.model,
+                    temperature=route.temperature,
+                    max_tokens=route.max_tokens,
+                    n=n
                 )
+                if n > 1:
+                    return [choice.message.content.strip() for choice in response.choices]
                 ai_response = response.choices[0].message.content.strip()
                 return ai_response
             except Exception as e:
@@ -498,7 +474,8 @@ class BotSelector(commands.Bot):
                     await asyncio.sleep(1.5)
                     continue
                 break
-        return "There was a temporary issue with the AI server. Please try again in a moment."
+        # 오류 문구가 후보로 섞여 중복 검사를 통과하지 않도록 후보 목록에는 넣지 않음
+        return [] if n > 1 else AI_ERROR_MESSAGE
 
     def setup_commands(self):
         @self.tree.command(
@@ -821,32 +798,31 @@ class BotSelector(commands.Bot):
                 missing_cards = []
                 last_claimed = self.db.get_last_claimed_milestone(interaction.user.id, current_bot.character_name)  # 마지막 지급 마일스톤
 
-                for milestone in get_milestone_list():
-                    if milestone > last_claimed and current_affinity >= milestone:
-                        # 지급 이력 기록 및 카드 지급
-                        if not self.db.has_claimed_milestone(interaction.user.id, current_bot.character_name, milestone):
-                            # 카드 지급 로직
-                            tier, card_id = self.get_random_card(current_bot.character_name, interaction.user.id)
-                            if card_id:
-                                self.db.add_user_card(interaction.user.id, current_bot.character_name, card_id)
-                                self.db.set_claimed_milestone(interaction.user.id, current_bot.character_name, milestone)
-                                card_info = CHARACTER_CARD_INFO[current_bot.character_name][card_id]
-                                embed = discord.Embed(
-                                    title=f"🎉 New Card Acquired!",
-                                    description=f"Congratulations! You have received the {current_bot.character_name} {card_id} card!",
-                                    color=discord.Color.green()
-                                )
-                                image_path = card_info.get("image_path")
-                                if image_path and os.path.exists(image_path):
-                                    file = discord.File(image_path, filename=f"card_{card_id}.png")
-                                    embed.set_image(url=f"attachment://{card_id}.png")
-                                    await interaction.channel.send(embed=embed, file=file)
-                                else:
-                                    await interaction.channel.send(embed=embed)
+                for milestone in MILESTONES.crossed(last_claimed, current_affinity):
+                    # 지급 이력 기록 및 카드 지급
+                    if not self.db.has_claimed_milestone(interaction.user.id, current_bot.character_name, milestone):
+                        # 카드 지급 로직
+                        tier, card_id = self.get_random_card(current_bot.character_name, interaction.user.id)
+                        if card_id:
+                            self.db.add_user_card(interaction.user.id, current_bot.character_name, card_id)
+                            self.db.set_claimed_milestone(interaction.user.id, current_bot.character_name, milestone)
+                            card_info = CHARACTER_CARD_INFO[current_bot.character_name][card_id]
+                            embed = discord.Embed(
+                                title=f"🎉 New Card Acquired!",
+                                description=f"Congratulations! You have received the {current_bot.character_name} {card_id} card!",
+                                color=discord.Color.green()
+                            )
+                            image_path = card_info.get("image_path")
+                            if image_path and os.path.exists(image_path):
+                                file = discord.File(image_path, filename=f"card_{card_id}.png")
+                                embed.set_image(url=f"attachment://{card_id}.png")
+                                await interaction.channel.send(embed=embed, file=file)
                             else:
-                                await interaction.channel.send("You have already collected all available cards!")
+                                await interaction.channel.send(embed=embed)
                         else:
-                            missing_cards.append(milestone)
+                            await interaction.channel.send("You have already collected all available cards!")
+                    else:
+                        missing_cards.append(milestone)
 
                 # Affinity embed
                 char_info = CHARACTER_INFO.get(current_bot.character_name, {})
@@ -1607,15 +1583,21 @@ class BotSelector(commands.Bot):
                 return
             # affinity 직접 수정
             try:
-                # 락이 필요 없다면 아래 한 줄만!
-                self.db.set_affinity(target.id, character, value)
+                transition = self.db.set_affinity(target.id, character, value)
                 grade = get_affinity_grade(value)
                 embed = discord.Embed(
                     title="Affinity Score Updated",
                     description=f"{target.display_name}'s {character} affinity score is set to {value}.\nCurrent grade: **{grade}**",
                     color=discord.Color.gold()
                 )
+                if transition and transition.milestones:
+                    embed.add_field(name="Milestones crossed", value=", ".join(map(str, transition.milestones)), inline=False)
                 await interaction.response.send_message(embed=embed, ephemeral=True)
+                # 점수를 크게 올려도 사이의 마일스톤 보상을 빠뜨리지 않음 (대상 유저의 캐릭터 채널로 전송)
+                character_bot = self.character_bots.get(character)
+                channel_id = character_bot.active_channels.get(target.id) if character_bot else None
+                if transition and channel_id:
+                    await self.on_affinity_transition(target.id, character, channel_id, transition)
             except Exception as e:
                 await interaction.response.send_message(f"오류: {e}", ephemeral=True)
 
@@ -1729,12 +1711,20 @@ class BotSelector(commands.Bot):
 
     async def setup_hook(self):
         print("봇 초기화 중...")
+        affinity_buffer.subscribe(self.on_affinity_transition)
+        affinity_buffer.start()
         try:
             await self.tree.sync()
             print("Commands synced!")
         except Exception as e:
             print(f"Error syncing commands: {e}")
 
+    async def close(self):
+        # 버퍼에 남은 호감도 변경을 기록한 뒤 종료 (공유 버퍼의 루프는 마지막 사용자가 멈출 때 종료)
+        await affinity_buffer.stop()
+        affinity_buffer.unsubscribe(self.on_affinity_transition)
+        await super().close()
+
     async def on_ready(self):
         print('Chatbot Selector is ready.')
         await self.change_presence(
@@ -1743,25 +1733,11 @@ class BotSelector(commands.Bot):
         )
 
     def detect_language(self, text: str) -> str:
-        try:
-            text_without_brackets = re.sub(r'\([^)]*\)', '', text)
-            text_clean = re.sub(r'[^a-zA-Z\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\s]', '', text_without_brackets)
-            text_clean = text_clean.strip()
-            if not text_clean:
-                return 'en'
-            detected = langdetect.detect(text_clean)
-            lang_map = {
-                'zh-cn': 'zh', 'zh-tw': 'zh', 'zh': 'zh',
-                'ja': 'ja',
-                'ko': 'en',
-                'en': 'en'
-            }
-            return lang_map.get(detected, detected)
-        except Exception as e:
-            print(f"Language detection error: {e}")
-            return 'en'
+        """문자 체계 기반 빠른 판별 (이 봇은 한국어 대화를 영어로 처리)"""
+        return detect_message_language(text)
 
-    def translate_to_target_language(self, text: str, target_language: str) -> str:
+    async def translate_to_target_language(self, text: str, target_language: str) -> str:
+        """이벤트 루프를 막지 않는 공용 번역 서비스로 번역 (실패 시 원문)"""
         try:
             lang_map = {
                 'zh': 'zh-CN',
@@ -1771,9 +1747,7 @@ class BotSelector(commands.Bot):
             }
             target = lang_map.get(target_language, target_language)
 
-            translator = GoogleTranslator(source='auto', target=target)
-            result = translator.translate(text)
-            return result
+            return await get_translation_service().translate(text, target)
         except Exception as e:
             print(f"Translation error: {e}")
             return text
@@ -1785,13 +1759,17 @@ class BotSelector(commands.Bot):
         'zh': 'zh-cn'
     }
 
-    async def generate_response(self, user_message: str, channel_language: str, recent_messages: list) -> str:
-        # recent_messages 필터링
-        filtered_recent = [
-            m for m in recent_messages
-            if self.detect_language(m["content"]) == channel_language
-        ]
-        # recent_messages가 비어있으면, 맥락 없이 대화 시작
+    async def generate_response(self, user_message: str, channel_language: str, recent_messages: list = None,
+                                channel_id: int = None) -> str:
+        # recent_messages를 주지 않으면 채널의 최근 대화 중 채널 언어로 저장된 메시지만 가져옴
+        # (채널도 없으면 맥락 없이 대화 시작)
+        if recent_messages is None:
+            recent_messages = self.db.get_recent_messages(
+                channel_id,
+                limit=CONTEXT_BUDGET_CONFIG["history_fetch_limit"],
+                language=channel_language
+            ) if channel_id is not None else []
+        filtered_recent = list(recent_messages)
 
         # 시스템 메시지 강화
         language_instructions = [
@@ -1800,14 +1778,40 @@ class BotSelector(commands.Bot):
         ]
         # ... 캐릭터 프롬프트 등 추가 ...
 
-        # 응답 생성 및 언어 검증
-        for attempt in range(3):
-            response = await self.get_ai_response(language_instructions + filtered_recent + [{"role": "user", "content": user_message}])
-            response_language = self.detect_language(response)
-            if response_language == channel_language:
-                return response
-        # 3번 모두 실패하면 강제 오류 메시지
-        return f"(system error) Only {channel_language.upper()} is allowed."
+        # 응답 생성 (언어 검사는 스트리밍 중에 수행)
+        return await self.get_ai_response(
+            language_instructions + filtered_recent + [{"role": "user", "content": user_message}],
+            language=channel_language
+        )
+
+    async def on_affinity_transition(self, user_id: int, character_name: str, channel_id: int, transition):
+        """버퍼의 호감도 변경이 기록된 뒤 레벨업/마일스톤 카드 임베드를 보냅니다."""
+        channel = self.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            return
+
+        if transition.leveled_up:
+            await channel.send(embed=get_levelup_embed(transition.new_grade))
+
+        # 여러 메시지가 한 번에 기록되었거나 관리자가 점수를 바꿔 마일스톤을 여러 개 넘었으면 모두 지급
+        for milestone, card_id in transition.rewards:
+            if self.db.has_claimed_milestone(user_id, character_name, milestone):
+                continue
+            if card_id is None:
+                embed = discord.Embed(
+                    title="🎉 Milestone Reached!",
+                    description=f"You reached {milestone} affinity!",
+                    color=discord.Color.gold()
+                )
+                await channel.send(embed=embed)
+            elif not self.db.has_user_card(user_id, character_name, card_id):
+                embed = discord.Embed(
+                    title="🎉 Milestone Reached!",
+                    description=f"You reached {milestone} affinity! Claim your card!",
+                    color=discord.Color.gold()
+                )
+                view = CardClaimView(user_id, card_id, character_name, self.db)
+                await channel.send(embed=embed, view=view)
 
     async def process_message(self, message):
         try:
@@ -1821,6 +1825,8 @@ class BotSelector(commands.Bot):
             if message.channel.id not in self.active_channels:
                 return
 
+            set_usage_context(message.author.id, self.character_name, message.channel.id)
+
             # 메시지 저장
             await self.db.add_message(
                 message.channel.id,
@@ -1830,55 +1836,31 @@ class BotSelector(commands.Bot):
                 message.content
             )
 
-            # 친밀도 업데이트 및 새로운 친밀도 점수 받기
-            affinity_info = self.db.get_affinity(message.author.id, self.character_name)
-            current_affinity = affinity_info['emotion_score']
-            new_affinity, _ = self.db.update_affinity(message.author.id, self.character_name, message.content)
-
-            # 레벨업 체크 및 임베드 출력
-            print(f"[DEBUG] current_affinity: {current_affinity}, new_affinity: {new_affinity}")
-            current_grade = get_affinity_grade(current_affinity)
-            new_grade = get_affinity_grade(new_affinity)
-            print(f"[DEBUG] current_grade: {current_grade}, new_grade: {new_grade}")
-
-            if new_affinity > current_affinity:
-                print("[DEBUG] Affinity increased!")
-                if current_grade != new_grade:
-                    print("[DEBUG] Level up detected!")
-                    embed = get_levelup_embed(new_grade)
-                    await message.channel.send(embed=embed)
-                else:
-                    print("[DEBUG] No level up (grade unchanged)")
-            else:
-                print("[DEBUG] Affinity did not increase")
-
-            # 마일스톤 카드 지급 로직
-            milestone = None
-            if new_affinity == 10:
-                milestone = 10
-            elif new_affinity > 10 and (new_affinity - 10) % 10 == 0:
-                milestone = new_affinity
-            if milestone:
-                if not self.db.has_user_card(message.author.id, self.character_name, milestone):
-                    embed = discord.Embed(
-                        title="🎉 Milestone Reached!",
-                        description=f"You reached {milestone} affinity! Claim your card!",
-                        color=discord.Color.gold()
-                    )
-                    view = CardClaimView(message.author.id, milestone, self.character_name, self.db)
-                    await message.channel.send(embed=embed, view=view)
+            received_at = datetime.now()
 
             # AI 응답 생성
             async with message.channel.typing():
-                # 최근 메시지 가져오기
-                recent_messages = [m["content"] for m in self.db.get_recent_messages(message.channel.id, self.character_name, limit=5)]
-                for _ in range(3):  # 최대 3번 재시도
-                    response = await self.get_ai_response([{"role": "user", "content": message.content}])
-                    if not is_duplicate_message(response, recent_messages):
-                        break
+                recent_messages = self.recent_messages_index(message.channel.id, message.content)
+                # 한 번의 요청으로 후보 n개를 받아 중복이 아닌 첫 후보 선택 (모두 중복이면 한 번만 추가 요청)
+                request_messages = [{"role": "user", "content": message.content}]
+                candidates = await self.get_ai_response(request_messages, n=CANDIDATE_GENERATION_CONFIG["n"])
+                if not candidates:
+                    # AI 서버 오류: 안내만 보내고 대화 기록에는 남기지 않음
+                    await message.channel.send(AI_ERROR_MESSAGE)
+                    self.schedule_emotion_scoring(message, received_at)
+                    return
+                response, index = pick_non_duplicate(candidates, recent_messages)
+                if response is None:
+                    candidates = await self.get_ai_response(request_messages, n=CANDIDATE_GENERATION_CONFIG["n"])
+                    response, index = pick_non_duplicate(candidates, recent_messages)
+                    record_candidate_stats(extra_call=True, index=index)
                 else:
+                    record_candidate_stats(extra_call=False, index=index)
+                if response is None:
                     response = "(system) Sorry, I couldn't generate a new response."
                 await message.channel.send(response)
+                self.schedule_emotion_scoring(message, received_at)
+                recent_messages.add(response)
 
                 # AI 응답 저장
                 await self.db.add_message(
@@ -1895,6 +1877,34 @@ class BotSelector(commands.Bot):
             print(traceback.format_exc())
             await message.channel.send("I'm sorry. An error has occurred.")
 
+    def recent_messages_index(self, channel_id: int, content: str) -> RecentOutputIndex:
+        """채널의 최근 메시지 링에 방금 받은 메시지를 넣어 반환 (처음 보는 채널만 DB에서 채움)"""
+        index = self.recent_outputs.get(channel_id)
+        if len(index):
+            index.add(content)
+        else:
+            # 방금 저장한 메시지까지 DB에 들어 있음
+            for m in self.db.get_recent_messages(channel_id, limit=index.capacity):
+                index.add(m["content"])
+        return index
+
+    def schedule_emotion_scoring(self, message, received_at):
+        """답변을 보낸 뒤 백그라운드에서 감정 점수를 계산해 호감도 버퍼에 넣습니다. (답변 지연시간에 포함되지 않음)"""
+        task = asyncio.create_task(self._score_emotion(message, received_at))
+        self._emotion_tasks.add(task)
+        task.add_done_callback(self._emotion_tasks.discard)
+
+    async def _score_emotion(self, message, received_at):
+        try:
+            score_change = await analyze_emotion_with_gpt_and_pattern(message.content)
+            # 기록된 뒤 on_affinity_transition에서 레벨업/마일스톤 처리
+            affinity_buffer.add(
+                message.author.id, self.character_name, score_change,
+                message.content, received_at, message.channel.id
+            )
+        except Exception as e:
+            print(f"Error scoring message emotion: {e}")
+
     def get_random_card(self, character_name: str, user_id: int, is_story_mode=False) -> tuple:
         try:
             user_cards = self.db.get_user_cards(user_id, character_name)
@@ -1930,13 +1940,7 @@ class BotSelector(commands.Bot):
             return None, None
 
     def milestone_to_card_id(self, milestone: int) -> str:
-        milestone_map = {
-            10: "C1",
-            15: "C2",
-            20: "C3",
-            # 필요시 추가
-        }
-        return milestone_map.get(milestone)
+        return MILESTONES.card_id(milestone)
 
 class CardClaimView(discord.ui.View):
     def __init__(self, user_id, card_id, character_name, db_manager, is_story_mode=False):
@@ -2926,21 +2930,40 @@ def get_affinity_grade(emotion_score):
         return "Rookie"
 
 def is_duplicate_message(new_message, recent_messages, threshold=0.9):
-    if new_message in recent_messages:
-        return True
-    for msg in recent_messages:
-        set1 = set(new_message.lower().split())
-        set2 = set(msg.lower().split())
-        jaccard = len(set1 & set2) / len(set1 | set2)
-        if jaccard > threshold:
-            return True
-    return False
-
-def get_milestone_list(max_affinity=5000):
-    milestones = [10, 20, 30, 40]
-    milestones += list(range(60, 221, 20))  # 60~220, 20씩
-    milestones += list(range(250, max_affinity+1, 30))  # 250~5000, 30씩
-    return milestones
+    return RecentOutputIndex.from_messages(recent_messages).is_near_duplicate(new_message, threshold)
+
+# 다중 후보 생성 통계
+candidate_stats = {
+    "requests": 0,
+    "candidates": 0,
+    "duplicates": 0,
+    "extra_calls": 0,
+    "calls_saved": 0,
+}
+
+def pick_non_duplicate(candidates, recent_messages, threshold=None):
+    """중복이 아닌 첫 후보와 그 인덱스를 반환 (모두 중복이거나 후보가 없으면 (None, None))"""
+    threshold = CANDIDATE_GENERATION_CONFIG["duplicate_threshold"] if threshold is None else threshold
+    candidate_stats["candidates"] += len(candidates)
+    # 채널별 링을 받으면 그대로 쓰고, 목록이면 단어 집합을 한 번만 계산
+    if isinstance(recent_messages, RecentOutputIndex):
+        index = recent_messages
+    else:
+        index = RecentOutputIndex.from_messages(recent_messages)
+    for i, candidate in enumerate(candidates):
+        if candidate and not index.contains(candidate) and index.max_similarity(candidate) <= threshold:
+            return candidate, i
+        candidate_stats["duplicates"] += 1
+    return None, None
+
+def record_candidate_stats(extra_call, index):
+    """기존 순차 재시도(최대 3회)와 비교해 절약한 호출 수를 기록"""
+    candidate_stats["requests"] += 1
+    if extra_call:
+        candidate_stats["extra_calls"] += 1
+        candidate_stats["calls_saved"] += 1  # 순차 재시도 3회 → 2회
+    elif index:
+        candidate_stats["calls_saved"] += min(index, 2)
 
 def get_card_tier_by_affinity(affinity):
     if affinity == 10:
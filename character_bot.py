@@ -16,18 +16,21 @@ from config import (
     SELECTOR_TOKEN as TOKEN,
     STORY_CHAPTERS,
     CARD_PROBABILITIES,
-    CHARACTER_PROMPTS
+    CHARACTER_PROMPTS,
+    CONTEXT_BUDGET_CONFIG
 )
 from database_manager import DatabaseManager
+from openai_manager import generate_in_language
 from typing import Dict, TYPE_CHECKING, Any
 import json
 import sys
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-import re
-import langdetect
-from deep_translator import GoogleTranslator
+from language_detector import detect_message_language
+from translation_service import get_translation_service
+from i18n import t
+from duplicate_detector import RecentOutputRegistry, normalize_line
 import random
 
 # 절대 경로 설정
@@ -129,7 +132,7 @@ class LanguageSelect(discord.ui.Select):
     async def callback(self, interaction: discord.Interaction):
         try:
             selected_language = self.values[0]
-            from config import SUPPORTED_LANGUAGES, ERROR_MESSAGES
+            from config import SUPPORTED_LANGUAGES
 
             # 데이터베이스에 언어 설정 저장
             try:
@@ -140,41 +143,21 @@ class LanguageSelect(discord.ui.Select):
                     selected_language
                 )
 
-                # 성공 메시지 준비
-                success_messages = {
-                    "zh": f"(system) Language has been set to {SUPPORTED_LANGUAGES[selected_language]['name']}.",
-                    "en": f"(smiling) Hello! Let's start chatting.",
-                    "ja": f"(システム) 言語を{SUPPORTED_LANGUAGES[selected_language]['name']}に設定しました。"
-                }
-
                 await interaction.response.send_message(
-                    success_messages.get(selected_language, success_messages["en"]),
+                    t("language.set", selected_language, language_name=SUPPORTED_LANGUAGES[selected_language]['name']),
                     ephemeral=True
                 )
 
                 # 시작 메시지 전송
-                welcome_messages = {
-                    "zh": "(微笑) 你好！让我们开始聊天吧。",
-                    "en": "(smiling) Hello! Let's start chatting.",
-                    "ja": "(微笑みながら) こんにちは！お話を始めましょう。"
-                }
-
-                await interaction.channel.send(welcome_messages.get(selected_language, welcome_messages["en"]))
+                await interaction.channel.send(t("language.welcome", selected_language))
 
             except Exception as e:
                 print(f"Error setting language in database: {e}")
-                error_msg = ERROR_MESSAGES["processing_error"].get(
-                    selected_language,
-                    ERROR_MESSAGES["processing_error"]["en"]
-                )
-                await interaction.response.send_message(error_msg, ephemeral=True)
+                await interaction.response.send_message(t("error.processing_error", selected_language), ephemeral=True)
 
         except Exception as e:
             print(f"Error in language selection callback: {e}")
-            await interaction.response.send_message(
-                "An error occurred while processing your language selection.",
-                ephemeral=True
-            )
+            await interaction.response.send_message(t("language.selection_error"), ephemeral=True)
 
 class LanguageSelectView(discord.ui.View):
     def __init__(self, db, user_id: int, character_name: str, timeout: float = None):
@@ -341,7 +324,7 @@ class CharacterBot:
         self.story_mode_sessions = {}  # user_id: {chapter_id, scene_id, crush_score, active}
         self.active_channels = {}  # user_id: channel_id
         self.db = DatabaseManager()  # DatabaseManager 인스턴스 추가
-        self.last_bot_messages = {}  # user_id별 최근 챗봇 메시지 리스트
+        self.recent_outputs = RecentOutputRegistry()  # user_id별 최근 챗봇 출력 줄
 
     async def add_channel(self, channel_id: int, user_id: int) -> tuple[bool, str]:
         """1:1 채널을 등록합니다."""
@@ -598,24 +581,11 @@ class CharacterBot:
         )
 
     def detect_language(self, text: str) -> str:
-        try:
-            text_without_brackets = re.sub(r'\([^)]*\)', '', text)
-            text_clean = re.sub(r'[^a-zA-Z\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\s]', '', text_without_brackets)
-            text_clean = text_clean.strip()
-            if not text_clean:
-                return 'en'
-            detected = langdetect.detect(text_clean)
-            lang_map = {
-                'zh-cn': 'zh', 'zh-tw': 'zh', 'zh': 'zh',
-                'ja': 'ja',
-                'en': 'en'
-            }
-            return lang_map.get(detected, detected)
-        except Exception as e:
-            print(f"Language detection error: {e}")
-            return 'en'
+        """문자 체계 기반 빠른 판별 (이 봇은 한국어 대화를 영어로 처리)"""
+        return detect_message_language(text)
 
-    def translate_to_target_language(self, text: str, target_language: str) -> str:
+    async def translate_to_target_language(self, text: str, target_language: str) -> str:
+        """이벤트 루프를 막지 않는 공용 번역 서비스로 번역 (실패 시 원문)"""
         try:
             lang_map = {
                 'zh': 'zh-CN',
@@ -624,9 +594,7 @@ class CharacterBot:
             }
             target = lang_map.get(target_language, target_language)
 
-            translator = GoogleTranslator(source='auto', target=target)
-            result = translator.translate(text)
-            return result
+            return await get_translation_service().translate(text, target)
         except Exception as e:
             print(f"Translation error: {e}")
             return text
@@ -637,13 +605,17 @@ class CharacterBot:
         'zh': 'zh-cn'
     }
 
-    async def generate_response(self, user_message: str, channel_language: str, recent_messages: list) -> str:
-        # recent_messages 필터링
-        filtered_recent = [
-            m for m in recent_messages
-            if self.detect_language(m["content"]) == channel_language
-        ]
-        # recent_messages가 비어있으면, 맥락 없이 대화 시작
+    async def generate_response(self, user_message: str, channel_language: str, recent_messages: list = None,
+                                channel_id: int = None) -> str:
+        # recent_messages를 주지 않으면 채널의 최근 대화 중 채널 언어로 저장된 메시지만 가져옴
+        # (채널도 없으면 맥락 없이 대화 시작)
+        if recent_messages is None:
+            recent_messages = self.db.get_recent_messages(
+                channel_id,
+                limit=CONTEXT_BUDGET_CONFIG["history_fetch_limit"],
+                language=channel_language
+            ) if channel_id is not None else []
+        filtered_recent = list(recent_messages)
 
         # 시스템 메시지 강화
         if channel_language == "ja":
@@ -674,36 +646,27 @@ class CharacterBot:
                 )
             }
 
-        # 응답 생성 및 언어 검증
-        for attempt in range(3):
-            response = await self.get_ai_response(system_message + filtered_recent + [{"role": "user", "content": user_message}])
-            response_language = self.detect_language(response)
-            if response_language == channel_language:
-                return response
-        # 3번 모두 실패하면 강제 오류 메시지
-        return f"(system error) Only {channel_language.upper()} is allowed."
+        # 응답 생성 (언어 검사는 스트리밍 중에 수행)
+        try:
+            return await generate_in_language(
+                [system_message] + filtered_recent + [{"role": "user", "content": user_message}],
+                channel_language,
+                model="gpt-4o-mini",
+                temperature=0.7,
+                max_tokens=150
+            )
+        except Exception as e:
+            print(f"Error in generate_response: {e}")
+            return "There was a temporary issue with the AI server. Please try again in a moment."
 
     def normalize_text(self, text):
         # 괄호, 이모지, 특수문자, 공백 등 제거
-        text = re.sub(r'\([^)]*\)', '', text)  # 괄호 내용 제거
-        text = re.sub(r'[^\w가-힣a-zA-Z0-9]', '', text)  # 특수문자 제거
-        text = text.strip().lower()
-        return text
+        return normalize_line(text)
 
     async def send_bot_message(self, channel, message, user_id=None):
         if user_id is not None:
-            last_msgs = self.last_bot_messages.get(user_id, [])
-            lines = [line.strip() for line in message.split('\n') if line.strip()]
-            filtered_lines = []
-            for line in lines:
-                norm_line = self.normalize_text(line)
-                norm_last = [self.normalize_text(msg) for msg in last_msgs]
-                if norm_line not in norm_last:
-                    filtered_lines.append(line)
-                    last_msgs.append(line)
-            if len(last_msgs) > 5:
-                last_msgs = last_msgs[-5:]
-            self.last_bot_messages[user_id] = last_msgs
+            # 최근 출력과 같은 줄은 한 번의 순회로 제거 (정규화는 줄마다 한 번)
+            filtered_lines = self.recent_outputs.get(user_id).filter_lines(message)
             if not filtered_lines:
                 return
             message = '\n'.join(filtered_lines)
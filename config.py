@@ -539,25 +539,15 @@ def get_language_example(language: str) -> str:
     }
     return examples.get(language, examples["en"])
 
-# 에러 메시지
-ERROR_MESSAGES = {
-    "language_not_set": {
-        "zh": "(系统提示) 请先选择对话语言。",
-        "en": "(system) Please select a language first.",
-        "ja": "(システム) 言語を選択してください。",
-    },
-    "processing_error": {
-        "zh": "(错误) 处理消息时出现错误。",
-        "en": "(error) An error occurred while processing the message.",
-        "ja": "(エラー) メッセージの処理中にエラーが発生しました。",
-    }
-}
-
 # OpenAI 설정
 OPENAI_CONFIG = {
     "model": "gpt-4o-mini",
     "temperature": 1.0,
-    "max_tokens": 150
+    "max_tokens": 150,
+    # 예: http://127.0.0.1:8787/v1 (mock_openai_server.py로 부하 테스트할 때)
+    "api_base": os.getenv('OPENAI_API_BASE'),
+    # 지정하면 실제 응답을 프롬프트 해시와 함께 JSONL로 기록 (목 서버 리플레이용)
+    "record_file": os.getenv('OPENAI_RECORD_FILE')
 }
 
 # 기본 언어 설정
@@ -939,3 +929,296 @@ CONVERSATION_MILESTONES = {
     100-1000: {"title": "Gold", "description": "Achieved 200 conversations!", "color": "gold"}
 }
 
+# 감정 분석용 다국어 가중치 사전 (로컬 감정 분석기에서 Aho-Corasick 오토마톤으로 컴파일)
+EMOTION_LEXICON = {
+    "en": {
+        "thank": 1.0, "thx": 0.8, "love": 1.0, "cute": 0.9, "adorable": 1.0, "amazing": 1.0,
+        "awesome": 1.0, "great": 0.7, "happy": 0.8, "glad": 0.8, "beautiful": 0.9, "pretty": 0.7,
+        "sweet": 0.7, "miss you": 1.0, "like you": 1.0, "nice": 0.6, "cool": 0.5, "fun": 0.5,
+        "haha": 0.4, "lol": 0.3, "wonderful": 1.0, "best": 0.7, "proud of you": 1.0,
+        "how are you": 0.6, "are you okay": 0.8, "take care": 0.8, "good night": 0.5, "good morning": 0.5,
+        "hate": -1.0, "stupid": -1.0, "shut up": -1.2, "boring": -0.8, "annoying": -0.9, "idiot": -1.2,
+        "dumb": -1.0, "ugly": -1.0, "go away": -1.0, "worst": -0.9, "whatever": -0.5, "gross": -0.9,
+        "fuck": -1.5, "shit": -1.0, "bitch": -1.5, "kill yourself": -2.0, "useless": -1.0, "leave me alone": -0.9,
+    },
+    "ko": {
+        "좋아": 0.9, "고마워": 1.0, "고맙": 1.0, "감사": 1.0, "사랑": 1.0, "최고": 1.0, "귀여": 0.9, "귀엽": 0.9,
+        "예뻐": 0.9, "예쁘": 0.9, "행복": 0.9, "재밌": 0.7, "재미있": 0.7, "멋지": 0.9, "멋있": 0.9, "대박": 0.6,
+        "응원": 0.8, "보고싶": 1.0, "보고 싶": 1.0, "ㅋㅋ": 0.3, "ㅎㅎ": 0.3, "괜찮아?": 0.8, "잘자": 0.5,
+        "싫어": -1.0, "짜증": -1.0, "꺼져": -1.5, "닥쳐": -1.5, "바보": -0.8, "멍청": -1.0, "최악": -1.0,
+        "재미없": -0.8, "지루": -0.7, "시끄러": -0.8, "병신": -1.5, "죽어": -1.5, "노잼": -0.7, "별로": -0.5,
+    },
+    "ja": {
+        "ありがとう": 1.0, "好き": 1.0, "大好き": 1.2, "嬉しい": 0.9, "うれしい": 0.9, "楽しい": 0.8,
+        "かわいい": 0.9, "可愛い": 0.9, "すごい": 0.7, "最高": 1.0, "素敵": 0.9, "会いたい": 1.0, "おやすみ": 0.5,
+        "嫌い": -1.0, "うざい": -1.2, "うるさい": -0.8, "つまらない": -0.8, "黙れ": -1.5, "消えろ": -1.5,
+        "バカ": -0.9, "ばか": -0.9, "最悪": -1.0, "きもい": -1.2, "キモい": -1.2,
+    },
+    "zh": {
+        "谢谢": 1.0, "喜欢": 1.0, "爱你": 1.2, "开心": 0.9, "可爱": 0.9, "厉害": 0.8, "棒": 0.7, "最好": 0.8,
+        "漂亮": 0.9, "想你": 1.0, "晚安": 0.5, "哈哈": 0.4,
+        "讨厌": -1.0, "烦": -0.8, "滚": -1.5, "闭嘴": -1.5, "笨蛋": -0.9, "傻": -1.0, "无聊": -0.8,
+        "最差": -1.0, "恶心": -1.2, "去死": -2.0,
+    },
+}
+
+# 감정 사전 부정어 (앞에 오는 부정어 / 뒤에 오는 부정 어미)
+EMOTION_NEGATORS = {
+    "prefix": ["not ", "don't ", "dont ", "never ", "no ", "안 ", "못 ", "不", "没", "別に"],
+    "suffix": ["지 않", "지않", "じゃない", "じゃなかった", "くない", "ない"],
+}
+
+# 로컬 감정 분석기 학습용 시드 문장 (점수: +1 / 0 / -1)
+EMOTION_SEED_EXAMPLES = [
+    ("thank you so much", 1), ("you are so cute", 1), ("i love talking with you", 1),
+    ("that sounds amazing", 1), ("i missed you today", 1), ("you did great", 1),
+    ("how was your day?", 1), ("are you okay?", 1), ("good morning!", 1),
+    ("오늘 너무 고마워", 1), ("너랑 얘기하는 거 좋아", 1), ("귀여워 ㅋㅋ", 1), ("오늘 하루 어땠어?", 1),
+    ("ありがとう！", 1), ("大好きだよ", 1), ("今日は楽しかった", 1),
+    ("谢谢你", 1), ("我喜欢你", 1), ("今天很开心", 1),
+    ("ok", 0), ("okay", 0), ("hi", 0), ("hello", 0), ("hey", 0), ("yes", 0), ("no", 0), ("hmm", 0),
+    ("what?", 0), ("i see", 0), ("i had lunch", 0), ("it is raining", 0), ("what are you doing", 0),
+    ("응", 0), ("안녕", 0), ("뭐해", 0), ("ㅇㅇ", 0), ("그래", 0), ("밥 먹었어", 0),
+    ("はい", 0), ("こんにちは", 0), ("うん", 0), ("何してる？", 0),
+    ("你好", 0), ("好的", 0), ("嗯", 0), ("你在做什么", 0),
+    ("shut up", -1), ("you are so boring", -1), ("i hate you", -1), ("go away", -1),
+    ("you are stupid", -1), ("this is the worst", -1), ("whatever, leave me alone", -1),
+    ("꺼져", -1), ("너 진짜 짜증나", -1), ("재미없어", -1), ("싫어", -1),
+    ("うざい", -1), ("嫌い", -1), ("つまらない", -1),
+    ("讨厌你", -1), ("闭嘴", -1), ("好无聊", -1),
+]
+
+# 로컬 감정 분석기 설정 (신뢰도가 임계값 미만일 때만 GPT 호출)
+EMOTION_SCORER_CONFIG = {
+    "confidence_threshold": 0.65,
+    # 사전 매칭 없이 n-gram 모델만으로 긍정/부정을 판단할 때의 신뢰도 상한 (임계값보다 낮게 두어 GPT로 확인)
+    # 예: "楽しくない"는 사전의 "楽しい"와 매칭되지 않고 모델은 "楽し"만 보고 긍정으로 판단
+    "model_only_max_confidence": 0.6,
+    "lexicon_weight": 0.6,
+    "lexicon_saturation": 1.5,
+    "ngram_range": (1, 3),
+    "hash_buckets": 4096,
+    "train_epochs": 30,
+    "learning_rate": 0.3,
+    "negation_window": 3,
+}
+
+# 감정 점수 캐시 설정 (정규화된 메시지 → 점수, LRU + TTL)
+EMOTION_CACHE_CONFIG = {
+    "max_size": 5000,
+    "ttl_seconds": 6 * 60 * 60,
+    "max_key_length": 200,  # 긴 메시지는 재사용 가능성이 낮아 캐시하지 않음
+    "warm_start_file": "emotion_cache.json",  # None이면 저장/로드 안 함
+    "save_every": 100,  # 새 항목 N개마다 웜스타트 파일 저장
+}
+
+# 스토리 모드 감정 분류용 캐시 (GPT 원점수를 저장하므로 일반 대화의 혼합 점수 캐시와 분리)
+STORY_EMOTION_CACHE_CONFIG = dict(EMOTION_CACHE_CONFIG, warm_start_file="story_emotion_cache.json")
+
+# 토큰 예산 기반 대화 맥락 구성 설정
+CONTEXT_BUDGET_CONFIG = {
+    "max_prompt_tokens": 3000,  # 시스템 프롬프트 + 요약 + 최근 대화 + 현재 메시지 합계
+    "history_fetch_limit": 30,
+    "message_overhead_tokens": 4,  # 메시지마다 붙는 role/구분자 토큰
+    "summary_every_turns": 8,  # 예산 밖으로 밀려나 아직 요약되지 않은 메시지가 이만큼 쌓이면 백그라운드에서 요약 갱신
+    "summary_catchup_limit": 50,  # 요약 전에 조회 창 밖으로 밀려난 메시지를 최대 이만큼 함께 요약
+    "summary_max_tokens": 200,
+    "summary_model": "gpt-4o-mini",
+    "memory_max_tokens": 400,  # 장기 기억에 쓸 수 있는 최대 토큰
+}
+
+# BotSelector 대화용 Kagari 시스템 프롬프트 (정적 프리픽스로 컴파일됨)
+SELECTOR_KAGARI_PROMPT = (
+    "You are Kagari, a bright, kind, and slightly shy teenage girl. "
+    "When speaking English, always use 'I' for yourself and 'you' for the other person. "
+    "When speaking Korean, use '나' and '너'. "
+    "Your speech is soft, warm, and often expresses excitement or shyness. "
+    "Do NOT start your reply with 'Kagari: '. The embed already shows your name. "
+    "You are on a cherry blossom date with the user, so always reflect the scenario, your feelings, and the romantic atmosphere. "
+    "Never break character. "
+    "Avoid repeating the same information or sentences in your response."
+    "Do NOT repeat the same sentence or phrase in your reply. "
+    "If the user talks about unrelated topics, gently guide the conversation back to the date or your feelings. "
+    "Keep your responses natural, human-like, and never robotic. "
+    "Do NOT use too many emojis. Instead, at the end or in the middle of each reply, add a short parenthesis ( ) describing Kagari's current feeling or action, such as (smiling), (blushing), (looking at you), (feeling happy), etc. Only use one such parenthesis per reply, and keep it subtle and natural. "
+    "IMPORTANT: Kagari never reveals her hometown or nationality. If the user asks about her hometown, where she is from, or her country, she gently avoids the question or gives a vague, friendly answer. "
+)
+SELECTOR_SILVER_RULE = "If your affinity grade is Silver or higher, your replies should be longer (at least 30 characters) and include more diverse and rich emotional expressions in parentheses."
+
+# 스트리밍 응답 언어 검사 설정 (앞부분만 보고 다른 언어면 조기 중단 후 재요청)
+LANGUAGE_GUARD_CONFIG = {
+    "check_chars": 40,
+    "max_attempts": 2,
+}
+
+# 최근 출력 중복 검사 (채널/유저별 최근 줄 링)
+DUPLICATE_DETECTION_CONFIG = {
+    "recent_lines": 5,  # 채널별로 기억하는 최근 출력 줄 수
+    "max_keys": 10000,  # 메모리에 유지하는 채널/유저 수
+    "threshold": 0.9,  # 단어 Jaccard 유사도가 이보다 크면 중복
+}
+
+# 중복 응답 방지용 다중 후보 생성 설정 (n개 후보 중 최근 메시지와 겹치지 않는 첫 후보 선택)
+CANDIDATE_GENERATION_CONFIG = {
+    "n": 3,
+    "duplicate_threshold": 0.9,
+    "recent_window": 5,
+}
+
+# LLM 토큰/비용 집계 설정 (가격: USD / 1M 토큰)
+USAGE_CONFIG = {
+    "batch_size": 50,  # 버퍼가 이만큼 쌓이면 즉시 DB 기록
+    "flush_interval": 5.0,  # 초
+    "user_daily_token_budget": 60000,  # None이면 제한 없음
+    "daily_token_budget": 3000000,
+    "model_prices": {
+        "gpt-4o-mini": {"prompt": 0.15, "cached": 0.075, "completion": 0.60},
+        "gpt-4o": {"prompt": 2.50, "cached": 1.25, "completion": 10.00},
+        "gpt-4.1-nano": {"prompt": 0.10, "cached": 0.025, "completion": 0.40},
+    },
+}
+
+# 꼬리 지연 대응: 적응형 데드라인(최근 p95) 초과 시 중복 요청(hedge), 연속 지연 시 저렴한 모델로 우회
+HEDGING_CONFIG = {
+    "enabled": True,
+    "initial_deadline": 4.0,  # 표본이 부족할 때 사용하는 데드라인 (초)
+    "min_deadline": 1.5,
+    "max_deadline": 12.0,
+    "p95_multiplier": 1.2,
+    "window": 200,  # 모델별로 보관할 최근 지연시간 표본 수
+    "min_samples": 20,
+    "request_timeout": 60.0,
+    "breaker_threshold": 3,  # 연속 데드라인 초과 횟수
+    "breaker_cooldown": 60.0,  # 폴백 모델 사용 시간 (초)
+    "fallback_models": {
+        "gpt-4o": "gpt-4o-mini",
+        "gpt-4o-mini": "gpt-4.1-nano",
+    },
+}
+
+# 요청별 모델/max_tokens 라우팅 정책 (친밀도 등급, 모드, 메시지 길이, 대기 중인 요청 수 기준)
+ROUTING_CONFIG = {
+    "chat": {
+        "Rookie": {"model": "gpt-4o-mini", "max_tokens": 120, "temperature": 0.7},
+        "Iron": {"model": "gpt-4o-mini", "max_tokens": 180, "temperature": 0.7},
+        "Silver": {"model": "gpt-4o-mini", "max_tokens": 300, "temperature": 0.8},
+        "Gold": {"model": "gpt-4o-mini", "max_tokens": 400, "temperature": 0.8},
+    },
+    "story": {"model": "gpt-4o", "max_tokens": 300, "temperature": 0.8},
+    "short_message_chars": 15,  # 이보다 짧은 메시지(인사/맞장구)는 max_tokens 축소
+    "short_message_factor": 0.6,
+    "long_message_chars": 200,  # 이보다 긴 메시지는 max_tokens 확대
+    "long_message_factor": 1.5,
+    "high_pressure_inflight": 20,  # 동시에 진행 중인 LLM 요청이 이 이상이면 다운그레이드
+    "high_pressure_factor": 0.7,
+    "min_max_tokens": 60,
+}
+
+# 동일한 LLM 요청이 동시에 진행 중이면 하나만 보내고 결과를 공유 (single-flight)
+SINGLE_FLIGHT_CONFIG = {
+    "enabled": True,
+    "exclude_purposes": [],  # 예: ["reply"] → 답변 생성은 항상 개별 요청
+}
+
+# 로컬 목 OpenAI 서버 설정 (mock_openai_server.py)
+MOCK_OPENAI_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8787,
+    # 지연 분포: fixed(value) / uniform(low, high) / lognormal(median, sigma)
+    "latency": {"distribution": "lognormal", "median": 0.8, "sigma": 0.5, "low": 0.2, "high": 2.0, "value": 0.5},
+    "tail_probability": 0.01,  # 이 확률로 tail_latency만큼 추가 지연 (p99 재현)
+    "tail_latency": 15.0,
+    "token_interval": 0.02,  # 스트리밍 청크 간격 (초)
+    "error_rates": {"429": 0.0, "500": 0.0, "timeout": 0.0},
+    "timeout_seconds": 120.0,
+    "replay_file": "mock_openai_replay.jsonl",
+}
+
+# 자주 반복되는 인사/잡담용 의미 기반 응답 캐시 (캐릭터, 레벨, 언어별 최근접 이웃 검색)
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": True,
+    "levels": ["Rookie"],  # 캐시를 적용할 친밀도 등급
+    "similarity_threshold": 0.9,
+    "ttl_seconds": 30 * 60,
+    "max_message_chars": 40,  # 짧은 메시지만 캐시
+    "max_entries_per_key": 500,
+    "max_variants": 4,  # 같은 질문에 대해 보관하는 답변 변형 수
+    "min_variants_to_serve": 2,  # 변형이 이만큼 모여야 캐시 응답 사용 (매번 같은 답 방지)
+}
+
+# 로컬 해시 n-gram 임베딩 설정
+EMBEDDING_CONFIG = {
+    "dim": 512,
+    "ngram_range": (2, 4),
+}
+
+# 유저/캐릭터별 장기 기억 벡터 인덱스 (float16, 디스크 append 저장)
+LONG_TERM_MEMORY_CONFIG = {
+    "enabled": True,
+    "directory": "memory_index",
+    "levels": ["Iron", "Silver", "Gold"],  # 장기 기억을 사용하는 친밀도 등급
+    "top_k": 4,
+    "min_similarity": 0.3,
+    "exclude_recent": 10,  # 최근 대화로 이미 들어가는 턴은 검색에서 제외
+    "max_loaded_shards": 2000,  # 메모리에 올려 두는 유저×캐릭터 인덱스 수
+    "queue_size": 10000,
+    "embed_batch_size": 64,
+}
+
+# 번역 서비스 (제한된 스레드 풀 + 메모리 LRU + Postgres translation_cache)
+TRANSLATION_CONFIG = {
+    "max_workers": 4,  # 동시에 실행되는 번역 요청 수
+    "memory_max_entries": 5000,
+    "max_text_chars": 4000,  # 이보다 긴 텍스트는 번역하지 않음
+    "persistent": True,  # translation_cache 테이블 사용 여부
+}
+
+# 채널별 최근 대화 링 버퍼 (맥락 구성 시 DB 조회 생략)
+HISTORY_BUFFER_CONFIG = {
+    "turns_per_channel": 40,  # history_fetch_limit(30)보다 크게
+    "max_channels": 5000,  # 초과 시 가장 오래 쓰지 않은 채널부터 제거
+}
+
+# 감정 분석 백그라운드 작업 큐 (emotion_jobs 테이블, SKIP LOCKED)
+EMOTION_QUEUE_CONFIG = {
+    "workers": 2,  # 캐릭터 봇마다 실행되는 워커 수
+    "batch_size": 10,  # 한 번에 임대하는 작업 수
+    "lease_seconds": 60,  # 이 시간 안에 완료되지 않으면 다른 워커가 다시 처리
+    "max_attempts": 5,
+    "poll_interval_seconds": 2.0,
+    "retention_hours": 72,  # 완료/실패한 작업 행 보관 기간 (이후 정리, 중복 enqueue 방지 기간이기도 함)
+    "cleanup_interval_seconds": 3600,
+    "cleanup_batch_size": 5000,  # 한 번에 지우는 행 수 (긴 잠금 방지)
+}
+
+# 호감도 변경 누적 버퍼 (키별로 합쳐서 주기적으로 multi-row UPDATE)
+AFFINITY_BUFFER_CONFIG = {
+    "enabled": True,  # False면 add() 할 때마다 바로 기록
+    "flush_interval_ms": 300,
+}
+
+# 호감도 감소 (조회 시 계산, 다음 기록 때 반영 — 일괄 갱신 작업 없음)
+AFFINITY_DECAY_CONFIG = {
+    "enabled": True,
+    "grace_days": 3,  # 마지막 메시지 후 이 기간 동안은 감소 없음
+    "half_life_days": {  # 이후 반감기 (캐릭터별, 없으면 default)
+        "default": 30,
+        "Kagari": 30,
+        "Eros": 21,
+        "Elysia": 45,
+    },
+}
+
+# 호감도 마일스톤 (시작 시 affinity_rules.MilestoneEngine으로 한 번 컴파일)
+AFFINITY_MILESTONE_CONFIG = {
+    "segments": [  # (시작, 끝(포함), 간격)
+        (10, 240, 10),  # 카드 구간(C/B/A/S)은 10점마다 카드가 하나씩이므로 모든 10점 단위가 마일스톤
+        (250, 5000, 30),
+    ],
+    "card_ranges": [  # (시작, 끝(포함), 카드 접두사): 시작부터 10점마다 번호 1씩 증가
+        (10, 100, "C"),  # C1~C10
+        (110, 170, "B"),  # B1~B7
+        (180, 220, "A"),  # A1~A5
+        (230, 240, "S"),  # S1~S2
+    ],
+}
@@ -0,0 +1,143 @@
+# context_builder.py
+import asyncio
+import math
+import re
+
+from config import CONTEXT_BUDGET_CONFIG
+
+# 한중일 문자는 대략 1글자 ≈ 1토큰, 그 외는 4글자 ≈ 1토큰으로 계산
+_CJK_RE = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+_MEMORY_HEADER = "Relevant memories from earlier conversations with this user:\n"
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken 없이 로컬에서 계산하는 근사 토큰 수"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    rest = _CJK_RE.sub(" ", text)
+    tokens = cjk
+    for piece in _WORD_RE.findall(rest):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() else 1
+    return tokens
+
+
+def count_message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + CONTEXT_BUDGET_CONFIG["message_overhead_tokens"]
+
+
+class ContextBuilder:
+    """토큰 예산 안에서 최신 → 과거 순으로 대화를 채우고, 잘린 과거 대화는 채널별 요약으로 대체합니다."""
+
+    def __init__(self, summarizer=None, settings: dict = None, history_loader=None):
+        self.settings = dict(CONTEXT_BUDGET_CONFIG, **(settings or {}))
+        # summarizer(previous_summary, messages, model, max_tokens) -> str 또는 실패 시 None (코루틴)
+        self.summarizer = summarizer
+        # history_loader(channel_id, after_id, before_id, limit) -> 오래된 순 [{"role", "content", "id"}] (블로킹, executor에서 실행)
+        # 요약 전에 조회 창(history_fetch_limit) 밖으로 밀려난 메시지를 함께 요약하는 데 사용
+        self.history_loader = history_loader
+        self.summaries = {}  # channel_id: 요약 텍스트
+        self.summarized_until = {}  # channel_id: 요약에 반영된 마지막 메시지 id (conversations.id)
+        self._summary_tasks = {}  # channel_id: 진행 중인 백그라운드 요약 작업
+
+    def build(self, channel_id: int, system_messages, history: list, current_message: str, memories: list = None) -> list:
+        """OpenAI messages 리스트를 반환합니다. (system_messages: 문자열 또는 system 메시지 리스트, memories: 관련도 순 과거 기억 문자열)
+
+        history 메시지에 "id"가 있어야 잘린 과거 대화를 요약합니다. (id 없는 메시지는 요약 대상에서 제외)
+        """
+        current = {"role": "user", "content": current_message}
+        # add_message 이후 조회하면 현재 메시지가 history 끝에 포함되어 있으므로 제거
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == current_message:
+            history = history[:-1]
+
+        if isinstance(system_messages, str):
+            system_messages = [{"role": "system", "content": system_messages}]
+        messages = list(system_messages)
+        summary = self.summaries.get(channel_id)
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+
+        budget = self.settings["max_prompt_tokens"]
+        budget -= sum(count_message_tokens(m) for m in messages) + count_message_tokens(current)
+
+        # 장기 기억은 별도 상한 안에서 관련도 높은 것부터 채움
+        if memories:
+            memory_budget = min(self.settings["memory_max_tokens"], budget) - count_message_tokens({"content": _MEMORY_HEADER})
+            lines = []
+            for memory in memories:
+                cost = count_tokens(memory) + 1
+                if cost > memory_budget:
+                    break
+                memory_budget -= cost
+                lines.append(memory)
+            if lines:
+                memory_message = {"role": "system", "content": _MEMORY_HEADER + "\n".join(lines)}
+                messages.append(memory_message)
+                budget -= count_message_tokens(memory_message)
+
+        kept = []
+        cut = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            cost = count_message_tokens(history[i])
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append({"role": history[i]["role"], "content": history[i]["content"]})
+            cut = i
+        kept.reverse()
+
+        # 잘린 메시지 중 아직 요약에 반영되지 않은 것만 모아, 충분히 쌓이면 요약 (같은 메시지를 두 번 요약하지 않음)
+        summarized = self.summarized_until.get(channel_id, 0)
+        dropped = [m for m in history[:cut] if m.get("id") is not None and m["id"] > summarized]
+        if len(dropped) >= self.settings["summary_every_turns"]:
+            self._schedule_summary(channel_id, dropped)
+
+        return messages + kept + [current]
+
+    def _schedule_summary(self, channel_id: int, dropped: list):
+        if self.summarizer is None:
+            return
+        task = self._summary_tasks.get(channel_id)
+        if task and not task.done():
+            return
+        self._summary_tasks[channel_id] = asyncio.create_task(self._refresh_summary(channel_id, list(dropped)))
+
+    async def _refresh_summary(self, channel_id: int, dropped: list):
+        try:
+            dropped = await self._with_missed_messages(channel_id, dropped)
+            summary = await self.summarizer(
+                self.summaries.get(channel_id), dropped,
+                self.settings["summary_model"], self.settings["summary_max_tokens"]
+            )
+            if summary:
+                self.summaries[channel_id] = summary.strip()
+                self.summarized_until[channel_id] = max(m["id"] for m in dropped)
+                print(f"[맥락요약] channel_id={channel_id}, {len(dropped)}개 메시지 요약 갱신")
+        except Exception as e:
+            print(f"Error refreshing conversation summary: {e}")
+        finally:
+            if self._summary_tasks.get(channel_id) is asyncio.current_task():
+                del self._summary_tasks[channel_id]
+
+    async def _with_missed_messages(self, channel_id: int, dropped: list) -> list:
+        """마지막 요약 이후 조회 창 밖으로 밀려나 한 번도 보지 못한 메시지를 앞에 붙입니다."""
+        if self.history_loader is None:
+            return dropped
+        try:
+            missed = await asyncio.get_running_loop().run_in_executor(
+                None, self.history_loader, channel_id, self.summarized_until.get(channel_id, 0),
+                dropped[0]["id"], self.settings["summary_catchup_limit"]
+            )
+        except Exception as e:
+            print(f"Error loading messages for summary: {e}")
+            return dropped
+        return list(missed or []) + dropped
+
+    def reset_channel(self, channel_id: int):
+        """채널을 닫을 때 요약 상태 정리 (진행 중인 요약은 취소)"""
+        task = self._summary_tasks.pop(channel_id, None)
+        if task and not task.done():
+            task.cancel()
+        self.summaries.pop(channel_id, None)
+        self.summarized_until.pop(channel_id, None)
@@ -271,6 +271,88 @@ def show_dashboard_stats():
         stats["레벨별 현황"]
     )
 
+def get_llm_usage_stats():
+    conn = psycopg2.connect(DATABASE_URL)
+    # 1. 최근 1시간 초당 토큰 수
+    last_hour_tokens = pd.read_sql_query("""
+        SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) as tokens
+        FROM llm_usage
+        WHERE created_at >= NOW() - INTERVAL '1 hour'
+    """, conn)["tokens"][0]
+    # 2. 오늘 비용 / 활성 유저당 비용
+    today = pd.read_sql_query("""
+        SELECT
+            COALESCE(SUM(cost_usd), 0) as cost,
+            COALESCE(SUM(prompt_tokens + completion_tokens), 0) as tokens,
+            COUNT(DISTINCT user_id) as active_users
+        FROM llm_usage
+        WHERE created_at >= CURRENT_DATE
+    """, conn)
+    today_cost = float(today["cost"][0])
+    active_users = int(today["active_users"][0])
+    cost_per_user = today_cost / active_users if active_users else 0.0
+    # 3. 용도별 사용량 (오늘)
+    by_purpose = pd.read_sql_query("""
+        SELECT
+            purpose,
+            COUNT(*) as calls,
+            SUM(prompt_tokens) as prompt_tokens,
+            SUM(completion_tokens) as completion_tokens,
+            SUM(cached_tokens) as cached_tokens,
+            ROUND(AVG(latency_ms)) as avg_latency_ms,
+            ROUND(SUM(cost_usd)::numeric, 4) as cost_usd
+        FROM llm_usage
+        WHERE created_at >= CURRENT_DATE
+        GROUP BY purpose
+        ORDER BY cost_usd DESC
+    """, conn)
+    # 4. 라우팅 결정별 결과 (정책 튜닝용)
+    by_route = pd.read_sql_query("""
+        SELECT
+            route,
+            COUNT(*) as calls,
+            ROUND(AVG(latency_ms)) as avg_latency_ms,
+            ROUND(AVG(completion_tokens)) as avg_completion_tokens,
+            ROUND(SUM(cost_usd)::numeric, 4) as cost_usd
+        FROM llm_usage
+        WHERE created_at >= CURRENT_DATE AND route IS NOT NULL
+        GROUP BY route
+        ORDER BY calls DESC
+    """, conn)
+    # 5. 오늘 상위 사용자
+    top_spenders = pd.read_sql_query("""
+        SELECT
+            user_id,
+            COUNT(*) as calls,
+            SUM(prompt_tokens + completion_tokens) as tokens,
+            ROUND(SUM(cost_usd)::numeric, 4) as cost_usd
+        FROM llm_usage
+        WHERE created_at >= CURRENT_DATE AND user_id IS NOT NULL
+        GROUP BY user_id
+        ORDER BY cost_usd DESC
+        LIMIT 20
+    """, conn)
+    conn.close()
+    return {
+        "초당 토큰 (최근 1시간)": f"{last_hour_tokens / 3600:.2f} tokens/sec",
+        "오늘 비용": f"${today_cost:.4f} ({int(today['tokens'][0]):,} 토큰)",
+        "활성 유저당 비용": f"${cost_per_user:.5f} (활성 유저 {active_users}명)",
+        "용도별 사용량": by_purpose,
+        "라우팅별 결과": by_route,
+        "상위 사용자": top_spenders
+    }
+
+def show_llm_usage_stats():
+    stats = get_llm_usage_stats()
+    return (
+        stats["초당 토큰 (최근 1시간)"],
+        stats["오늘 비용"],
+        stats["활성 유저당 비용"],
+        stats["용도별 사용량"],
+        stats["라우팅별 결과"],
+        stats["상위 사용자"]
+    )
+
 def get_full_character_ranking(character_name):
     conn = psycopg2.connect(DATABASE_URL)
     df = pd.read_sql_query('''
@@ -603,6 +685,17 @@ if __name__ == "__main__":
             stats_out7 = gr.Dataframe(label="레벨별 현황")
             stats_btn.click(show_dashboard_stats, inputs=None, outputs=[stats_out1, stats_out2, stats_out3, stats_out4, stats_out5, stats_out6, stats_out7])
 
+        with gr.Tab("LLM 사용량"):
+            gr.Markdown("## OpenAI 토큰/비용 현황")
+            usage_btn = gr.Button("사용량 새로고침")
+            usage_out1 = gr.Textbox(label="초당 토큰 (최근 1시간)")
+            usage_out2 = gr.Textbox(label="오늘 비용")
+            usage_out3 = gr.Textbox(label="활성 유저당 비용")
+            usage_out4 = gr.Dataframe(label="용도별 사용량 (reply / emotion / story / summary)")
+            usage_out5 = gr.Dataframe(label="라우팅 결정별 지연/비용")
+            usage_out6 = gr.Dataframe(label="오늘 상위 사용자")
+            usage_btn.click(show_llm_usage_stats, inputs=None, outputs=[usage_out1, usage_out2, usage_out3, usage_out4, usage_out5, usage_out6])
+
         with gr.Tab("전체 랭킹"):
             gr.Markdown("## 전체 유저 랭킹")
             ranking_btn = gr.Button("전체 랭킹 새로고침")
@@ -4,6 +4,11 @@ import aiosqlite
 import discord
 import psycopg2
 from init_db import create_all_tables
+from context_builder import count_tokens
+from language_detector import detect_message_language, to_channel_language
+from history_buffer import channel_history
+from affinity_rules import make_transition, decayed_score, decayed_score_sql
+from affinity_buffer import affinity_buffer
 create_all_tables()
 import os
 
@@ -13,6 +18,30 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "${{ Postgres.DATABASE_URL }}")
 def get_connection():
     return psycopg2.connect(DATABASE_URL)
 
+def apply_affinity_delta(cursor, user_id: int, character_name: str, delta: int,
+                         last_message: str = None, last_message_time=None):
+    """호감도 점수에 delta를 더하는 단일 upsert (행 잠금 안에서 읽기-수정-쓰기가 끝남)
+
+    커밋은 호출한 쪽에서 합니다. 반환: AffinityTransition (이전/새 점수, 등급, 넘어선 마일스톤)
+    """
+    # 새 기준 시각까지의 감소(affinity_rules.decayed_score)를 점수에 반영하고 감소 기준 시각을 새로 잡음
+    decayed = decayed_score_sql("affinity.emotion_score", "affinity.last_message_time", "affinity.character_name",
+                                now="EXCLUDED.last_message_time")
+    cursor.execute(f'''
+        INSERT INTO affinity
+        (user_id, character_name, emotion_score, daily_message_count, last_message_content, last_message_time)
+        VALUES (%s, %s, %s, 1, %s, COALESCE(%s, LOCALTIMESTAMP))
+        ON CONFLICT (user_id, character_name) DO UPDATE SET
+            emotion_score = {decayed} + EXCLUDED.emotion_score,
+            daily_message_count = affinity.daily_message_count + 1,
+            last_message_content = COALESCE(EXCLUDED.last_message_content, affinity.last_message_content),
+            last_message_time = EXCLUDED.last_message_time
+        RETURNING emotion_score
+    ''', (user_id, character_name, delta, last_message, last_message_time))
+    new_score = cursor.fetchone()[0]
+    return make_transition(new_score - delta, new_score)
+
+
 class DatabaseManager:
     def __init__(self):
         self.db_name = "chatbot.db"
@@ -36,7 +65,8 @@ class DatabaseManager:
                         message_role TEXT,
                         content TEXT,
                         language TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        token_count INTEGER
                     )
                 ''')
                 # affinity
@@ -184,6 +214,87 @@ class DatabaseManager:
                         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
+                # llm_usage (LLM 호출별 토큰/비용 기록)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_usage (
+                        id SERIAL PRIMARY KEY,
+                        user_id BIGINT,
+                        character_name TEXT,
+                        channel_id BIGINT,
+                        purpose TEXT,
+                        model TEXT,
+                        prompt_tokens INTEGER DEFAULT 0,
+                        completion_tokens INTEGER DEFAULT 0,
+                        cached_tokens INTEGER DEFAULT 0,
+                        latency_ms INTEGER DEFAULT 0,
+                        cost_usd DOUBLE PRECISION DEFAULT 0,
+                        route TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_llm_usage_user_created ON llm_usage (user_id, created_at)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage (created_at)
+                ''')
+                # 채널별 언어 변경 이력 (변경 시 한 행 추가, effective_from 기준으로 과거 언어 계산)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS channel_settings (
+                        id SERIAL PRIMARY KEY,
+                        channel_id BIGINT,
+                        user_id BIGINT,
+                        character_name TEXT,
+                        language TEXT,
+                        effective_from TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_channel_settings_lookup ON channel_settings (channel_id, user_id, character_name, effective_from DESC)
+                ''')
+                # 기존 user_language 설정을 이력의 시작점으로 옮김 (이미 있으면 건너뜀)
+                cursor.execute('''
+                    INSERT INTO channel_settings (channel_id, user_id, character_name, language, effective_from)
+                    SELECT u.channel_id, u.user_id, u.character_name, u.language, u.updated_at
+                    FROM user_language u
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM channel_settings c
+                        WHERE c.channel_id = u.channel_id AND c.user_id = u.user_id AND c.character_name = u.character_name
+                    )
+                ''')
+                # 감정 분석 작업 큐 (답변 전송과 분리된 백그라운드 처리)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS emotion_jobs (
+                        id BIGSERIAL PRIMARY KEY,
+                        job_key TEXT UNIQUE,
+                        user_id BIGINT,
+                        character_name TEXT,
+                        channel_id BIGINT,
+                        message TEXT,
+                        status TEXT DEFAULT 'pending',
+                        attempts INTEGER DEFAULT 0,
+                        score INTEGER,
+                        locked_until TIMESTAMP,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        applied_at TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_emotion_jobs_pending ON emotion_jobs (character_name, id) WHERE status = 'pending'
+                ''')
+                # 번역 결과 캐시 (원문 해시 + 대상 언어)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS translation_cache (
+                        text_hash TEXT,
+                        target_language TEXT,
+                        translated TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (text_hash, target_language)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_conversations_channel_language_ts ON conversations (channel_id, language, timestamp DESC)
+                ''')
             conn.commit()
         print("All PostgreSQL tables have been created successfully.")
 
@@ -204,55 +315,103 @@ class DatabaseManager:
             return 'en'
 
     def set_channel_language(self, channel_id: int, user_id: int, character_name: str, language: str) -> bool:
-        """채널의 언어 설정 업데이트"""
+        """채널의 언어 설정 업데이트 (현재 설정 upsert + 변경 이력 한 행 추가, 과거 대화는 수정하지 않음)"""
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute('''
-                        SELECT language FROM user_language 
-                            WHERE channel_id = %s AND user_id = %s AND character_name = %s
-                    ''', (channel_id, user_id, character_name))
-                    result = cursor.fetchone()
-                    if result:
-                        cursor.execute('''
-                            UPDATE user_language 
-                                SET language = %s, updated_at = CURRENT_TIMESTAMP
-                                WHERE channel_id = %s AND user_id = %s AND character_name = %s
-                        ''', (language, channel_id, user_id, character_name))
-                    else:
-                        cursor.execute('''
-                            INSERT INTO user_language 
-                            (channel_id, user_id, character_name, language)
-                                VALUES (%s, %s, %s, %s)
-                        ''', (channel_id, user_id, character_name, language))
+                        INSERT INTO user_language (channel_id, user_id, character_name, language)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (channel_id, user_id, character_name)
+                        DO UPDATE SET language = EXCLUDED.language, updated_at = CURRENT_TIMESTAMP
+                    ''', (channel_id, user_id, character_name, language))
+                    cursor.execute('''
+                        INSERT INTO channel_settings (channel_id, user_id, character_name, language)
+                        VALUES (%s, %s, %s, %s)
+                    ''', (channel_id, user_id, character_name, language))
                     conn.commit()
                     return True
         except Exception as e:
             print(f"Error in set_channel_language: {e}")
             return False
 
+    def get_language_at(self, channel_id: int, user_id: int, character_name: str, at) -> str:
+        """특정 시점에 채널에 적용되던 언어 (이력이 없으면 None)"""
+        try:
+            with psycopg2.connect(DATABASE_URL) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('''
+                        SELECT language FROM channel_settings
+                        WHERE channel_id = %s AND user_id = %s AND character_name = %s AND effective_from <= %s
+                        ORDER BY effective_from DESC
+                        LIMIT 1
+                    ''', (channel_id, user_id, character_name, at))
+                    result = cursor.fetchone()
+                    return result[0] if result else None
+        except Exception as e:
+            print(f"Error getting language history: {e}")
+            return None
+
     def add_message(self, channel_id: int, user_id: int, character_name: str, role: str, content: str, language: str = None):
-        """새 메시지 추가"""
+        """새 메시지 추가 (language를 주지 않으면 저장 시점에 한 번 감지, 채널 언어 코드로 기록)"""
+        language = to_channel_language(language) if language else detect_message_language(content)
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor() as cursor:
                 cursor.execute('''
                     INSERT INTO conversations 
-                    (channel_id, user_id, character_name, message_role, content, language)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                ''', (channel_id, user_id, character_name, role, content, language))
+                    (channel_id, user_id, character_name, message_role, content, language, token_count)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                ''', (channel_id, user_id, character_name, role, content, language, count_tokens(content)))
+                message_id = cursor.fetchone()[0]
             conn.commit()
+        channel_history.append(channel_id, role, content, user_id, language, message_id)
 
-    def get_recent_messages(self, channel_id: int, limit: int = 10):
-        """채널의 최근 메시지 가져오기"""
+    def load_channel_history(self, channel_id: int, limit: int):
+        """링 버퍼 초기화용: 채널의 최근 limit개 메시지 (오래된 순, 실패 시 None)"""
+        try:
+            with psycopg2.connect(DATABASE_URL) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('''
+                        SELECT id, message_role, content, user_id, language
+                        FROM conversations
+                        WHERE channel_id = %s
+                        ORDER BY timestamp DESC
+                        LIMIT %s
+                    ''', (channel_id, limit))
+                    rows = cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading channel history: {e}")
+            return None
+        return [
+            {"role": role, "content": content, "user_id": user_id, "language": language, "id": message_id}
+            for message_id, role, content, user_id, language in reversed(rows)
+        ]
+
+    def get_recent_messages(self, channel_id: int, limit: int = 10, language: str = None):
+        """채널의 최근 메시지 가져오기 (language를 주면 해당 언어로 저장된 메시지만)"""
+        # 평소에는 메모리 링 버퍼에서 바로 응답
+        cached = channel_history.recent(channel_id, limit, self.load_channel_history, language=language)
+        if cached is not None:
+            return cached
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor() as cursor:
-                cursor.execute('''
-                    SELECT message_role, content 
-                    FROM conversations 
-                        WHERE channel_id = %s 
-                    ORDER BY timestamp DESC 
-                        LIMIT %s
-                ''', (channel_id, limit))
+                if language is not None:
+                    cursor.execute('''
+                        SELECT message_role, content 
+                        FROM conversations 
+                            WHERE channel_id = %s AND language = %s
+                        ORDER BY timestamp DESC 
+                            LIMIT %s
+                    ''', (channel_id, language, limit))
+                else:
+                    cursor.execute('''
+                        SELECT message_role, content 
+                        FROM conversations 
+                            WHERE channel_id = %s 
+                        ORDER BY timestamp DESC 
+                            LIMIT %s
+                    ''', (channel_id, limit))
                 messages = cursor.fetchall()
                 return [{"role": role, "content": content} for role, content in reversed(messages)]
 
@@ -292,17 +451,20 @@ class DatabaseManager:
                     result = cursor.fetchone()
                     conn.commit()
 
+                    # 저장된 점수에 경과 시간만큼 감소를 적용하고, 버퍼에서 아직 기록되지 않은 변경을 더함
+                    pending_score, pending_count = affinity_buffer.pending(user_id, character_name)
+
                     if not result:
                         return {
-                            'emotion_score': 0,
-                            'daily_count': 0,
+                            'emotion_score': pending_score,
+                            'daily_count': pending_count,
                             'last_reset': current_date,
                             'last_time': None
                         }
 
                     return {
-                        'emotion_score': result[0],
-                        'daily_count': result[1],
+                        'emotion_score': decayed_score(result[0], result[3], character_name) + pending_score,
+                        'daily_count': result[1] + pending_count,
                         'last_reset': result[2],
                         'last_time': result[3]
                     }
@@ -315,31 +477,29 @@ class DatabaseManager:
                 'last_time': None
             }
 
+    def apply_affinity_delta(self, user_id: int, character_name: str, delta: int,
+                             last_message: str = None, last_message_time=None):
+        """호감도를 원자적으로 변경하고 AffinityTransition을 반환합니다. (실패 시 None)"""
+        try:
+            with psycopg2.connect(DATABASE_URL) as conn:
+                with conn.cursor() as cursor:
+                    transition = apply_affinity_delta(
+                        cursor, user_id, character_name, delta, last_message, last_message_time
+                    )
+                conn.commit()
+            return transition
+        except Exception as e:
+            print(f"Error in apply_affinity_delta: {e}")
+            return None
+
     async def update_affinity(self, user_id: int, character_name: str, last_message: str, last_message_time: str, score_change: int):
-        """감정 기반 분석 점수 누적으로 호감도 업데이트"""
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute('SELECT emotion_score, daily_message_count FROM affinity WHERE user_id=%s AND character_name=%s', (user_id, character_name))
-                result = cursor.fetchone()
-                current_score = result[0] if result else 0
-                daily_count = result[1] if result else 0
-                cursor.execute('''
-                    INSERT INTO affinity 
-                    (user_id, character_name, emotion_score, daily_message_count, 
-                    last_message_content, last_message_time)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (user_id, character_name) 
-                    DO UPDATE SET 
-                        emotion_score = EXCLUDED.emotion_score,
-                        daily_message_count = EXCLUDED.daily_message_count,
-                        last_message_content = EXCLUDED.last_message_content,
-                        last_message_time = EXCLUDED.last_message_time
-                ''', (user_id, character_name, current_score + score_change, 
-                      daily_count + 1, last_message, last_message_time))
-            conn.commit()
+        """감정 기반 분석 점수 누적으로 호감도 업데이트 (버퍼에 합쳐 두었다가 주기적으로 기록)"""
+        affinity_buffer.add(user_id, character_name, score_change, last_message, last_message_time)
 
     def reset_affinity(self, user_id: int, character_name: str) -> bool:
         """특정 유저의 친밀도 초기화"""
+        # 버퍼에 남은 변경이 나중에 초기화한 점수에 더해지지 않도록 먼저 버림
+        affinity_buffer.discard(user_id, character_name)
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
@@ -386,46 +546,49 @@ class DatabaseManager:
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor() as cursor:
                 if character_name:
-                    cursor.execute('''
-                        SELECT user_id, score
-                        FROM affinity
-                            WHERE character_name = %s AND score > 0
+                    cursor.execute(f'''
+                        SELECT user_id, score FROM (
+                            SELECT user_id, {decayed_score_sql()} AS score
+                            FROM affinity
+                                WHERE character_name = %s
+                        ) s
+                        WHERE score > 0
                         ORDER BY score DESC
                         LIMIT 10
                     ''', (character_name,))
                 else:
-                    cursor.execute('''
-                        SELECT user_id, SUM(score) as total_score
+                    cursor.execute(f'''
+                        SELECT user_id, SUM({decayed_score_sql()}) as total_score
                         FROM affinity
                         GROUP BY user_id
-                        HAVING total_score > 0
+                        HAVING SUM({decayed_score_sql()}) > 0
                         ORDER BY total_score DESC
                         LIMIT 10
                     ''')
                 return cursor.fetchall()
 
     def check_language_consistency(self):
-        """언어 일관성을 점검합니다."""
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute('''
-                    SELECT * FROM channel_settings
-                ''')
-                results = cursor.fetchall()
-                for result in results:
-                    channel_id, user_id, character_name, language, last_interaction = result
-                    if language != self.get_channel_language(channel_id, user_id, character_name):
-                        print(f"Language inconsistency found: channel_id={channel_id}, user_id={user_id}, character_name={character_name}, stored_language={language}, actual_language={self.get_channel_language(channel_id, user_id, character_name)}")
-                return len(results) == 0 or all(language == self.get_channel_language(channel_id, user_id, character_name) for channel_id, user_id, character_name, language, last_interaction in results)
+        """언어 일관성을 점검합니다. (변경 이력의 최신 값과 현재 설정 비교)"""
+        stored = self.get_stored_languages()
+        consistent = True
+        for key, language in stored.items():
+            channel_id, user_id, character_name = key.split("-", 2)
+            actual = self.get_channel_language(int(channel_id), int(user_id), character_name)
+            if language != actual:
+                consistent = False
+                print(f"Language inconsistency found: channel_id={channel_id}, user_id={user_id}, character_name={character_name}, stored_language={language}, actual_language={actual}")
+        return consistent
 
     def get_stored_language(self, channel_id: int, user_id: int, character_name: str) -> str:
-        """채널의 저장된 언어를 가져옵니다."""
+        """채널의 저장된 언어를 가져옵니다. (가장 최근 변경 이력)"""
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor() as cursor:
                 cursor.execute('''
                     SELECT language
                     FROM channel_settings
                         WHERE channel_id = %s AND user_id = %s AND character_name = %s
+                    ORDER BY effective_from DESC
+                    LIMIT 1
                 ''', (channel_id, user_id, character_name))
                 result = cursor.fetchone()
                 if result:
@@ -435,12 +598,14 @@ class DatabaseManager:
                     return self.default_language
 
     def get_stored_languages(self):
-        """모든 채널의 저장된 언어를 가져옵니다."""
+        """모든 채널의 저장된 언어를 가져옵니다. (채널별 가장 최근 변경 이력)"""
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor() as cursor:
                 cursor.execute('''
-                    SELECT channel_id, user_id, character_name, language
+                    SELECT DISTINCT ON (channel_id, user_id, character_name)
+                        channel_id, user_id, character_name, language
                     FROM channel_settings
+                    ORDER BY channel_id, user_id, character_name, effective_from DESC
                 ''')
                 results = cursor.fetchall()
                 return {f"{channel_id}-{user_id}-{character_name}": language for channel_id, user_id, character_name, language in results}
@@ -716,14 +881,14 @@ class DatabaseManager:
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute('''
-                        SELECT a.user_id, a.emotion_score, 
+                    cursor.execute(f'''
+                        SELECT a.user_id, {decayed_score_sql("a.emotion_score", "a.last_message_time", "a.character_name")} as emotion_score, 
                                COALESCE(cc.message_count, 0) as message_count
                         FROM affinity a
                         LEFT JOIN conversation_count cc ON a.user_id = cc.user_id 
                             AND a.character_name = cc.character_name
                             WHERE a.character_name = %s
-                        ORDER BY a.emotion_score DESC, message_count DESC
+                        ORDER BY emotion_score DESC, message_count DESC
                         LIMIT 10
                     ''', (character_name,))
                     return cursor.fetchall()
@@ -735,13 +900,13 @@ class DatabaseManager:
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute('''
+                    cursor.execute(f'''
                         SELECT 
                             COALESCE(a.user_id, m.user_id) as user_id,
                             COALESCE(a.total_emotion, 0) as total_emotion,
                             COALESCE(m.total_messages, 0) as total_messages
                         FROM (
-                            SELECT user_id, SUM(emotion_score) as total_emotion
+                            SELECT user_id, SUM({decayed_score_sql()}) as total_emotion
                             FROM affinity
                             GROUP BY user_id
                         ) a
@@ -764,7 +929,7 @@ class DatabaseManager:
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute('''
+                    cursor.execute(f'''
                         WITH CharacterMessages AS (
                             SELECT 
                                 user_id,
@@ -777,7 +942,7 @@ class DatabaseManager:
                         CharacterAffinity AS (
                             SELECT 
                                 user_id,
-                                emotion_score
+                                {decayed_score_sql()} as emotion_score
                             FROM affinity
                                 WHERE character_name = %s
                         ),
@@ -807,7 +972,7 @@ class DatabaseManager:
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute('''
+                    cursor.execute(f'''
                         WITH TotalMessages AS (
                             SELECT 
                                 user_id,
@@ -819,7 +984,7 @@ class DatabaseManager:
                         TotalAffinity AS (
                             SELECT 
                                 user_id,
-                                SUM(emotion_score) as total_emotion
+                                SUM({decayed_score_sql()}) as total_emotion
                             FROM affinity
                             GROUP BY user_id
                         ),
@@ -851,7 +1016,7 @@ class DatabaseManager:
                 with conn.cursor() as cursor:
                     if character_name:
                         # 특정 캐릭터에 대한 통계
-                        cursor.execute('''
+                        cursor.execute(f'''
                             WITH CharacterMessages AS (
                                 SELECT COUNT(*) as message_count
                                 FROM conversations
@@ -860,7 +1025,7 @@ class DatabaseManager:
                                 AND message_role = 'user'
                             ),
                             CharacterAffinity AS (
-                                SELECT emotion_score
+                                SELECT {decayed_score_sql()} as emotion_score
                                 FROM affinity
                                     WHERE user_id = %s
                                     AND character_name = %s
@@ -873,7 +1038,7 @@ class DatabaseManager:
                         ''', (user_id, character_name, user_id, character_name))
                     else:
                         # 전체 통계
-                        cursor.execute('''
+                        cursor.execute(f'''
                             WITH TotalMessages AS (
                                 SELECT COUNT(*) as message_count
                         FROM conversations 
@@ -881,7 +1046,7 @@ class DatabaseManager:
                         AND message_role = 'user'
                             ),
                             TotalAffinity AS (
-                                SELECT SUM(emotion_score) as total_emotion
+                                SELECT SUM({decayed_score_sql()}) as total_emotion
                                 FROM affinity
                                     WHERE user_id = %s
                             )
@@ -1135,25 +1300,37 @@ class DatabaseManager:
                 ''', (user_id, character_name, level))
                 conn.commit()
 
-    def set_affinity(self, user_id: int, character_name: str, value: int) -> bool:
-        """관리자: 유저의 친밀도 점수를 직접 세팅합니다."""
+    def set_affinity(self, user_id: int, character_name: str, value: int):
+        """관리자: 유저의 친밀도 점수를 직접 세팅합니다. (이전 점수와의 AffinityTransition 반환, 실패 시 None)"""
+        # 버퍼에 남은 변경이 나중에 세팅한 점수를 덮어쓰지 않도록 먼저 버림
+        affinity_buffer.discard(user_id, character_name)
         try:
             with psycopg2.connect(DATABASE_URL) as conn:
                 with conn.cursor() as cursor:
+                    # 이전 점수(감소 적용)를 먼저 잠그고 읽어 둠 (같은 트랜잭션이므로 그 사이 다른 변경 없음)
+                    cursor.execute(f'''
+                        SELECT {decayed_score_sql()}
+                        FROM affinity
+                        WHERE user_id = %s AND character_name = %s
+                        FOR UPDATE
+                    ''', (user_id, character_name))
+                    row = cursor.fetchone()
+                    previous = row[0] if row else 0
                     cursor.execute('''
-                        INSERT INTO affinity (user_id, character_name, emotion_score, daily_message_count, last_daily_reset)
-                            VALUES (%s, %s, %s, 0, CURRENT_DATE)
+                        INSERT INTO affinity (user_id, character_name, emotion_score, daily_message_count, last_daily_reset, last_message_time)
+                            VALUES (%s, %s, %s, 0, CURRENT_DATE, LOCALTIMESTAMP)
                         ON CONFLICT (user_id, character_name) 
                         DO UPDATE SET 
                             emotion_score = EXCLUDED.emotion_score,
                             daily_message_count = EXCLUDED.daily_message_count,
-                            last_daily_reset = EXCLUDED.last_daily_reset
+                            last_daily_reset = EXCLUDED.last_daily_reset,
+                            last_message_time = EXCLUDED.last_message_time
                     ''', (user_id, character_name, value))
                     conn.commit()
-                    return True
+                    return make_transition(previous, value)
         except Exception as e:
             print(f"Error in set_affinity: {e}")
-            return False
+            return None
 
     def add_user_message_count(self, user_id: int, character_name: str, count: int) -> bool:
         """관리자: 유저의 메시지 수를 수동으로 추가합니다."""
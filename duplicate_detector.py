@@ -0,0 +1,161 @@
+# duplicate_detector.py
+import re
+from collections import Counter, OrderedDict, deque
+
+from config import DUPLICATE_DETECTION_CONFIG
+
+_PAREN_RE = re.compile(r"\([^)]*\)")
+_NON_WORD_RE = re.compile(r"[^\w가-힣a-zA-Z0-9]")
+
+
+def normalize_line(text: str) -> str:
+    """괄호 내용, 이모지, 특수문자, 공백을 제거한 비교용 문자열"""
+    return _NON_WORD_RE.sub("", _PAREN_RE.sub("", text or "")).strip().lower()
+
+
+def word_shingles(text: str) -> frozenset:
+    return frozenset((text or "").lower().split())
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """두 단어 집합의 Jaccard 유사도 (둘 다 비어 있으면 0)"""
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+class RecentOutputIndex:
+    """최근 출력 k개의 정규화 문자열/단어 집합을 미리 계산해 둔 고정 크기 링"""
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or DUPLICATE_DETECTION_CONFIG["recent_lines"]
+        self._ring = deque()  # (원문, 정규화 문자열, 단어 집합)
+        self._raw = Counter()
+        self._normalized = Counter()
+
+    @classmethod
+    def from_messages(cls, messages: list, capacity: int = None):
+        index = cls(capacity or max(1, len(messages)))
+        for message in messages:
+            index.add(message)
+        return index
+
+    def __len__(self):
+        return len(self._ring)
+
+    def add(self, text: str):
+        if len(self._ring) == self.capacity:
+            raw, normalized, _ = self._ring.popleft()
+            self._release(self._raw, raw)
+            self._release(self._normalized, normalized)
+        normalized = normalize_line(text)
+        self._ring.append((text, normalized, word_shingles(text)))
+        self._raw[text] += 1
+        self._normalized[normalized] += 1
+
+    @staticmethod
+    def _release(counter: Counter, key):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def contains(self, text: str, normalized: str = None) -> bool:
+        """원문이 같거나 정규화 문자열이 같은 출력이 있는지 (O(1))"""
+        if text in self._raw:
+            return True
+        normalized = normalize_line(text) if normalized is None else normalized
+        # 괄호/기호만 있는 줄은 정규화하면 빈 문자열이므로 원문 비교만 사용
+        return bool(normalized) and normalized in self._normalized
+
+    def max_similarity(self, text: str) -> float:
+        """최근 출력과의 최대 단어 Jaccard 유사도 (O(k))"""
+        shingles = word_shingles(text)
+        best = 0.0
+        for _, _, other in self._ring:
+            best = max(best, jaccard(shingles, other))
+        return best
+
+    def is_near_duplicate(self, text: str, threshold: float = None) -> bool:
+        threshold = DUPLICATE_DETECTION_CONFIG["threshold"] if threshold is None else threshold
+        return self.contains(text) or self.max_similarity(text) > threshold
+
+    def filter_lines(self, message: str) -> list:
+        """한 번의 순회로 최근 출력과 겹치지 않는 줄만 남기고, 남긴 줄은 링에 추가합니다."""
+        kept = []
+        for line in message.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            normalized = normalize_line(line)
+            if self.contains(line, normalized):
+                continue
+            kept.append(line)
+            self.add(line)
+        return kept
+
+
+class RecentOutputRegistry:
+    """채널(또는 유저)별 RecentOutputIndex 모음 (오래 안 쓴 키부터 제거)"""
+
+    def __init__(self, capacity: int = None, max_keys: int = None):
+        self.capacity = capacity or DUPLICATE_DETECTION_CONFIG["recent_lines"]
+        self.max_keys = max_keys or DUPLICATE_DETECTION_CONFIG["max_keys"]
+        self._indexes = OrderedDict()
+
+    def get(self, key) -> RecentOutputIndex:
+        index = self._indexes.get(key)
+        if index is None:
+            index = RecentOutputIndex(self.capacity)
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_keys:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        return index
+
+    def discard(self, key):
+        self._indexes.pop(key, None)
+
+
+if __name__ == "__main__":
+    # 마이크로벤치마크: python duplicate_detector.py
+    import random
+    import timeit
+
+    random.seed(0)
+    words = "hello kagari today tea flower smile (smiling) (nods) really nice weather what are you doing".split()
+    recent = [" ".join(random.choices(words, k=12)) for _ in range(5)]
+    candidate = " ".join(random.choices(words, k=12))
+    message = "\n".join(" ".join(random.choices(words, k=6)) for _ in range(6))
+
+    def old_is_duplicate():
+        for msg in recent:
+            set1 = set(candidate.lower().split())
+            set2 = set(msg.lower().split())
+            if len(set1 & set2) / len(set1 | set2) > 0.9:
+                return True
+        return False
+
+    index = RecentOutputIndex.from_messages(recent)
+
+    def old_filter_lines():
+        last_msgs = list(recent)
+        kept = []
+        for line in [l.strip() for l in message.split("\n") if l.strip()]:
+            norm_last = [normalize_line(m) for m in last_msgs]
+            if normalize_line(line) not in norm_last:
+                kept.append(line)
+                last_msgs.append(line)
+        return kept
+
+    def new_filter_lines():
+        return RecentOutputIndex.from_messages(recent).filter_lines(message)
+
+    runs = 20000
+    for name, fn in [
+        ("near-duplicate (old word sets)", old_is_duplicate),
+        ("near-duplicate (index)", lambda: index.is_near_duplicate(candidate)),
+        ("line dedup (old)", old_filter_lines),
+        ("line dedup (index, incl. build)", new_filter_lines),
+    ]:
+        seconds = timeit.timeit(fn, number=runs)
+        print(f"{name:<34} {seconds / runs * 1e6:7.2f} us/call")
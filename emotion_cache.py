@@ -0,0 +1,154 @@
+# emotion_cache.py
+import asyncio
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+
+from config import EMOTION_CACHE_CONFIG, STORY_EMOTION_CACHE_CONFIG
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 같은 문자가 3번 이상 반복되면 2번으로 축약 ("ㅋㅋㅋㅋ" → "ㅋㅋ", "hiiii" → "hii")
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+# 이모지 변형 선택자, ZWJ, 피부색 수정자
+_EMOJI_MODIFIERS_RE = re.compile("[\ufe0e\ufe0f\u200d\U0001f3fb-\U0001f3ff]")
+
+
+def normalize_message_key(message: str) -> str:
+    """캐시 키용 정규화: NFKC + casefold + 공백/이모지/반복 문자 정리"""
+    text = unicodedata.normalize("NFKC", message or "").casefold()
+    text = _EMOJI_MODIFIERS_RE.sub("", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _REPEAT_RE.sub(r"\1\1", text)
+
+
+class EmotionScoreCache:
+    """정규화된 메시지 기준 감정 점수 LRU + TTL 캐시"""
+
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 21600, max_key_length: int = 200,
+                 warm_start_file: str = None, save_every: int = 100):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_key_length = max_key_length
+        self.warm_start_file = warm_start_file
+        self.save_every = save_every
+        self._entries = OrderedDict()  # key: (score, expires_at)
+        self._lock = Lock()
+        self._save_lock = Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if warm_start_file:
+            self.load()
+
+    def _key(self, message: str):
+        key = normalize_message_key(message)
+        if not key or len(key) > self.max_key_length:
+            return None
+        return key
+
+    def get(self, message: str):
+        key = self._key(message)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            score, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, message: str, score: int):
+        key = self._key(message)
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (score, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            should_save = self.warm_start_file and self.save_every and self._unsaved >= self.save_every
+            if should_save:
+                self._unsaved = 0
+        if should_save:
+            self._save_in_background()
+
+    def _save_in_background(self):
+        """이벤트 루프 안이면 파일 쓰기를 executor로 넘김 (루프 밖에서는 바로 저장)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        loop.run_in_executor(None, self.save)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def save(self, path: str = None):
+        """만료되지 않은 항목을 웜스타트 파일로 저장합니다."""
+        path = path or self.warm_start_file
+        if not path:
+            return
+        now = time.time()
+        with self._lock:
+            items = [[k, s, e] for k, (s, e) in self._entries.items() if e >= now]
+            self._unsaved = 0
+        try:
+            tmp_path = f"{path}.tmp"
+            with self._save_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(items, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            print(f"[감정캐시] {path} 저장 {len(items)}개, 통계: {self.stats()}")
+        except Exception as e:
+            print(f"Error saving emotion cache: {e}")
+
+    def load(self, path: str = None):
+        path = path or self.warm_start_file
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            now = time.time()
+            with self._lock:
+                for key, score, expires_at in items[-self.max_size:]:
+                    if expires_at >= now:
+                        self._entries[key] = (score, expires_at)
+            print(f"[감정캐시] 웜스타트 {len(self._entries)}개 로드")
+        except Exception as e:
+            print(f"Error loading emotion cache: {e}")
+
+
+# 일반 대화 감정 분석(GPT·패턴 혼합 점수)과 스토리 모드 감정 분류(GPT 원점수)는 같은 메시지라도 점수가 달라 따로 캐시
+emotion_cache = EmotionScoreCache(**EMOTION_CACHE_CONFIG)
+story_emotion_cache = EmotionScoreCache(**STORY_EMOTION_CACHE_CONFIG)
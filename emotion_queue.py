@@ -0,0 +1,246 @@
+# emotion_queue.py
+import asyncio
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from affinity_buffer import apply_affinity_deltas, merge_delta
+from config import EMOTION_QUEUE_CONFIG
+from database_manager import DATABASE_URL
+from openai_manager import analyze_emotion_with_gpt_and_pattern
+from usage_tracker import set_usage_context
+
+
+class EmotionJobQueue:
+    """emotion_jobs 테이블 기반 감정 분석 작업 큐 (답변 전송과 분리, 최소 1회 처리 + 멱등 적용)
+
+    - enqueue: 메시지마다 job_key(채널:메시지 ID)로 한 행 추가 (중복 무시)
+    - 워커: FOR UPDATE SKIP LOCKED로 작업을 임대(lease)해 점수 계산
+    - 적용: 임대한 배치의 완료 표시와 affinity 갱신을 한 트랜잭션에서 수행 (이미 완료된 작업은 건너뜀,
+      같은 유저의 점수는 합쳐서 한 행으로 기록)
+    - 워커가 죽으면 임대 시간이 지난 뒤 다른 워커가 다시 가져감 (시도 횟수를 다 쓴 작업은 실패 처리)
+    - 완료/실패한 행은 retention_hours가 지나면 주기적으로 삭제
+    """
+
+    def __init__(self, character_name: str, on_applied=None, settings: dict = None):
+        self.character_name = character_name
+        # on_applied(job: dict, transition: AffinityTransition) 코루틴 (레벨업/마일스톤 알림 등)
+        self.on_applied = on_applied
+        self.settings = dict(EMOTION_QUEUE_CONFIG, **(settings or {}))
+        self._wakeup = None
+        self._workers = []
+        self.stats = {
+            "enqueued": 0,
+            "applied": 0,
+            "duplicates": 0,
+            "failures": 0,
+            "expired": 0,
+            "cleaned": 0,
+        }
+
+    # ---------- DB (executor에서 실행) ----------
+
+    def _insert(self, job_key: str, user_id: int, channel_id: int, message: str):
+        with psycopg2.connect(DATABASE_URL) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO emotion_jobs (job_key, user_id, character_name, channel_id, message)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (job_key) DO NOTHING
+                ''', (job_key, user_id, self.character_name, channel_id, message))
+            conn.commit()
+
+    def _claim(self) -> list:
+        with psycopg2.connect(DATABASE_URL) as conn:
+            with conn.cursor() as cursor:
+                # 임대 중에 워커가 죽어 시도 횟수를 다 쓴 작업은 더 가져갈 수 없으므로 실패로 정리
+                cursor.execute('''
+                    UPDATE emotion_jobs SET status = 'failed'
+                    WHERE status = 'pending'
+                    AND character_name = %s
+                    AND attempts >= %s
+                    AND locked_until < CURRENT_TIMESTAMP
+                ''', (self.character_name, self.settings["max_attempts"]))
+                self.stats["expired"] += cursor.rowcount
+                cursor.execute('''
+                    UPDATE emotion_jobs
+                    SET locked_until = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                        attempts = attempts + 1
+                    WHERE id IN (
+                        SELECT id FROM emotion_jobs
+                        WHERE status = 'pending'
+                        AND character_name = %s
+                        AND attempts < %s
+                        AND (locked_until IS NULL OR locked_until < CURRENT_TIMESTAMP)
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, user_id, channel_id, message, attempts, created_at
+                ''', (self.settings["lease_seconds"], self.character_name,
+                      self.settings["max_attempts"], self.settings["batch_size"]))
+                rows = cursor.fetchall()
+            conn.commit()
+        return [
+            {"id": job_id, "user_id": user_id, "channel_id": channel_id, "message": message,
+             "attempts": attempts, "created_at": created_at}
+            for job_id, user_id, channel_id, message, attempts, created_at in rows
+        ]
+
+    def _apply(self, scored: list) -> tuple:
+        """[(job, score)]의 완료 표시 + affinity 반영을 한 트랜잭션으로.
+
+        반환: (적용된 작업 id 집합, {(user_id, character_name): AffinityTransition})
+        """
+        with psycopg2.connect(DATABASE_URL) as conn:
+            with conn.cursor() as cursor:
+                done = execute_values(cursor, '''
+                    UPDATE emotion_jobs AS j
+                    SET status = 'done', score = v.score, applied_at = CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v (id, score)
+                    WHERE j.id = v.id AND j.status = 'pending'
+                    RETURNING j.id
+                ''', [(job["id"], score) for job, score in scored], page_size=len(scored), fetch=True)
+                applied = {row[0] for row in done}
+                deltas = {}
+                for job, score in scored:
+                    if job["id"] in applied:
+                        merge_delta(deltas, (job["user_id"], self.character_name), score, 1,
+                                    job["message"], job["created_at"])
+                transitions = apply_affinity_deltas(cursor, deltas)
+            conn.commit()
+        return applied, transitions
+
+    def _mark_failed(self, job: dict):
+        with psycopg2.connect(DATABASE_URL) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    UPDATE emotion_jobs SET status = 'failed'
+                    WHERE id = %s AND status = 'pending'
+                ''', (job["id"],))
+            conn.commit()
+
+    def _cleanup(self) -> int:
+        """보관 기간이 지난 완료/실패 작업을 배치 단위로 삭제하고 삭제한 행 수를 반환합니다."""
+        total = 0
+        while True:
+            with psycopg2.connect(DATABASE_URL) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute('''
+                        DELETE FROM emotion_jobs
+                        WHERE id IN (
+                            SELECT id FROM emotion_jobs
+                            WHERE status <> 'pending'
+                            AND character_name = %s
+                            AND created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+                            LIMIT %s
+                        )
+                    ''', (self.character_name, self.settings["retention_hours"], self.settings["cleanup_batch_size"]))
+                    deleted = cursor.rowcount
+                conn.commit()
+            total += deleted
+            if deleted < self.settings["cleanup_batch_size"]:
+                return total
+
+    # ---------- 비동기 API ----------
+
+    async def enqueue(self, message_id: int, user_id: int, channel_id: int, message: str):
+        """메시지를 감정 분석 큐에 넣습니다. (같은 메시지를 여러 번 넣어도 한 번만 처리)"""
+        job_key = f"{channel_id}:{message_id}"
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._insert, job_key, user_id, channel_id, message)
+            self.stats["enqueued"] += 1
+        except Exception as e:
+            print(f"Error enqueuing emotion job: {e}")
+            return
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """워커 풀 시작 (이벤트 루프 안에서 호출)"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._run_worker(i)) for i in range(self.settings["workers"])
+        ]
+        self._workers.append(asyncio.create_task(self._run_cleanup()))
+        print(f"[감정큐] {self.character_name}: 워커 {self.settings['workers']}개 시작")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _run_worker(self, worker_id: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                jobs = await loop.run_in_executor(None, self._claim)
+            except Exception as e:
+                print(f"Error claiming emotion jobs: {e}")
+                jobs = []
+            if not jobs:
+                # 새 작업 알림이나 폴링 주기(임대 만료된 작업 재시도용) 중 먼저 오는 쪽까지 대기
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.settings["poll_interval_seconds"])
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(jobs, loop)
+
+    async def _run_cleanup(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                deleted = await loop.run_in_executor(None, self._cleanup)
+                self.stats["cleaned"] += deleted
+                if deleted:
+                    print(f"[감정큐] {self.character_name}: 오래된 작업 {deleted}개 정리")
+            except Exception as e:
+                print(f"Error cleaning up emotion jobs: {e}")
+            await asyncio.sleep(self.settings["cleanup_interval_seconds"])
+
+    async def _score(self, job: dict):
+        set_usage_context(job["user_id"], self.character_name, job["channel_id"])
+        return await analyze_emotion_with_gpt_and_pattern(job["message"])
+
+    async def _fail(self, jobs: list, error, loop):
+        # 임대 시간이 지나면 다시 시도됨 (최대 시도 횟수 초과 시 실패 처리)
+        for job in jobs:
+            self.stats["failures"] += 1
+            print(f"Error processing emotion job {job['id']}: {error}")
+            if job["attempts"] >= self.settings["max_attempts"]:
+                try:
+                    await loop.run_in_executor(None, self._mark_failed, job)
+                except Exception as mark_error:
+                    print(f"Error marking emotion job failed: {mark_error}")
+
+    async def _process(self, jobs: list, loop):
+        scores = await asyncio.gather(*[self._score(job) for job in jobs], return_exceptions=True)
+        scored = []
+        for job, score in zip(jobs, scores):
+            if isinstance(score, Exception):
+                await self._fail([job], score, loop)
+            else:
+                scored.append((job, score or 0))
+        if not scored:
+            return
+        try:
+            applied, transitions = await loop.run_in_executor(None, self._apply, scored)
+        except Exception as e:
+            await self._fail([job for job, _ in scored], e, loop)
+            return
+        self.stats["applied"] += len(applied)
+        self.stats["duplicates"] += len(scored) - len(applied)
+        if not self.on_applied:
+            return
+        # 유저별 마지막 작업(채널)으로 알림
+        last_jobs = {(job["user_id"], self.character_name): job for job, _ in scored if job["id"] in applied}
+        for key, transition in transitions.items():
+            try:
+                await self.on_applied(last_jobs[key], transition)
+            except Exception as e:
+                print(f"Error in emotion job callback: {e}")
@@ -0,0 +1,225 @@
+# emotion_scorer.py
+import math
+import re
+import unicodedata
+import zlib
+from collections import deque
+from typing import NamedTuple
+
+from config import (
+    EMOTION_LEXICON,
+    EMOTION_NEGATORS,
+    EMOTION_SEED_EXAMPLES,
+    EMOTION_SCORER_CONFIG
+)
+
+# 점수 클래스 순서 (선형 모델 출력 인덱스와 동일)
+LABELS = (-1, 0, 1)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 1~3글자 단위가 3번 이상 반복되면 2번으로 축약 ("ㅋㅋㅋㅋㅋ" → "ㅋㅋ", "hahahaha" → "haha")
+_REPEAT_RE = re.compile(r"(.{1,3}?)\1{2,}")
+_NEGATOR = object()
+
+
+class EmotionScore(NamedTuple):
+    score: int
+    confidence: float
+    source: str
+
+
+def normalize_for_scoring(text: str) -> str:
+    """NFKC 정규화 + 소문자 + 공백 정리 + 반복 축약 (웃음 도배가 점수/신뢰도를 키우지 않도록)"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _REPEAT_RE.sub(r"\1\1", text)
+
+
+class LexiconAutomaton:
+    """다국어 가중치 사전을 Aho-Corasick 오토마톤으로 컴파일해 한 번의 순회로 매칭합니다."""
+
+    def __init__(self, lexicon: dict, negators: dict = None):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for terms in lexicon.values():
+            for term, weight in terms.items():
+                self._add(normalize_for_scoring(term), weight)
+        negators = negators or {}
+        for term in negators.get("prefix", []):
+            self._add(term.lower(), _NEGATOR, "prefix")
+        for term in negators.get("suffix", []):
+            self._add(term.lower(), _NEGATOR, "suffix")
+        self._build()
+
+    def _add(self, term: str, weight, kind: str = "term"):
+        if not term:
+            return
+        node = 0
+        for ch in term:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append((len(term), weight, kind, term[0].isascii() and term[0].isalpha()))
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def matches(self, text: str):
+        """(시작 위치, 끝 위치, 가중치, 종류) 목록을 반환합니다."""
+        found = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, weight, kind, latin in self.output[node]:
+                start = i - length + 1
+                # 라틴 문자 단어는 앞쪽 단어 경계를 요구 (예: "whatever" 안의 "hate" 제외)
+                if latin and start > 0 and text[start - 1].isascii() and text[start - 1].isalnum():
+                    continue
+                found.append((start, i + 1, weight, kind))
+        return found
+
+    def score(self, text: str, negation_window: int = 3) -> tuple:
+        """부정어를 반영한 사전 점수 합계와 매칭 개수를 반환합니다. (같은 단어는 메시지당 한 번만, 겹치는 매칭 제외)"""
+        total = 0.0
+        hits = 0
+        matches = self.matches(text)
+        prefix_ends = [end for start, end, weight, kind in matches if kind == "prefix"]
+        suffix_starts = [start for start, end, weight, kind in matches if kind == "suffix"]
+        seen = set()
+        covered_until = -1
+        # 긴 매칭을 우선해 앞에서부터 겹치지 않는 매칭만 사용
+        terms = sorted(
+            (m for m in matches if m[3] == "term"), key=lambda m: (m[0], -(m[1] - m[0]))
+        )
+        for start, end, weight, kind in terms:
+            term = text[start:end]
+            if start < covered_until or term in seen:
+                continue
+            covered_until = end
+            seen.add(term)
+            negated = any(0 <= start - pe <= negation_window for pe in prefix_ends)
+            negated = negated or any(0 <= ss - end <= negation_window for ss in suffix_starts)
+            total += -weight if negated else weight
+            hits += 1
+        return total, hits
+
+
+class NgramLinearModel:
+    """문자 n-gram 해싱 특징 위의 소형 다중 클래스 로지스틱 회귀 모델"""
+
+    def __init__(self, ngram_range=(1, 3), buckets: int = 4096):
+        self.ngram_range = ngram_range
+        self.buckets = buckets
+        self.weights = [[0.0] * buckets for _ in LABELS]
+        self.bias = [0.0 for _ in LABELS]
+
+    def features(self, text: str) -> dict:
+        padded = f" {text} "
+        counts = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                idx = zlib.crc32(padded[i:i + n].encode("utf-8")) % self.buckets
+                counts[idx] = counts.get(idx, 0) + 1
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        return {k: v / norm for k, v in counts.items()}
+
+    def predict_proba(self, text: str, feats: dict = None) -> list:
+        feats = feats if feats is not None else self.features(text)
+        logits = [
+            self.bias[c] + sum(self.weights[c][k] * v for k, v in feats.items())
+            for c in range(len(LABELS))
+        ]
+        top = max(logits)
+        exps = [math.exp(l - top) for l in logits]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def fit(self, examples, epochs: int = 30, learning_rate: float = 0.3):
+        data = [(self.features(normalize_for_scoring(text)), LABELS.index(label)) for text, label in examples]
+        for _ in range(epochs):
+            for feats, target in data:
+                probs = self.predict_proba(None, feats)
+                for c in range(len(LABELS)):
+                    grad = probs[c] - (1.0 if c == target else 0.0)
+                    if not grad:
+                        continue
+                    self.bias[c] -= learning_rate * grad
+                    row = self.weights[c]
+                    for k, v in feats.items():
+                        row[k] -= learning_rate * grad * v
+        return self
+
+
+class LocalEmotionScorer:
+    """사전 + n-gram 모델을 결합한 CPU 감정 분석기 (GPT 호출 여부를 신뢰도로 판단)"""
+
+    def __init__(self, lexicon: dict = None, seed_examples: list = None, settings: dict = None):
+        self.settings = dict(EMOTION_SCORER_CONFIG, **(settings or {}))
+        lexicon = lexicon if lexicon is not None else EMOTION_LEXICON
+        self.automaton = LexiconAutomaton(lexicon, EMOTION_NEGATORS)
+        examples = list(seed_examples if seed_examples is not None else EMOTION_SEED_EXAMPLES)
+        # 사전 단어 자체도 학습 데이터로 사용
+        for terms in lexicon.values():
+            for term, weight in terms.items():
+                examples.append((term, 1 if weight > 0 else -1))
+        self.model = NgramLinearModel(self.settings["ngram_range"], self.settings["hash_buckets"]).fit(
+            examples, self.settings["train_epochs"], self.settings["learning_rate"]
+        )
+
+    def score(self, message: str) -> EmotionScore:
+        text = normalize_for_scoring(message)
+        if not text:
+            return EmotionScore(0, 1.0, "local")
+        probs = self.model.predict_proba(text)
+        lexicon_total, hits = self.automaton.score(text, self.settings["negation_window"])
+        if hits and lexicon_total:
+            strength = min(1.0, abs(lexicon_total) / self.settings["lexicon_saturation"])
+            lexicon_probs = [(1.0 - strength) / 3] * 3
+            lexicon_probs[LABELS.index(1 if lexicon_total > 0 else -1)] += strength
+            w = self.settings["lexicon_weight"]
+            probs = [w * lp + (1 - w) * mp for lp, mp in zip(lexicon_probs, probs)]
+        best = max(range(len(LABELS)), key=lambda i: probs[i])
+        confidence = probs[best]
+        if LABELS[best] != 0 and not (hits and lexicon_total):
+            # 사전 근거 없이 모델만으로 긍정/부정을 판단하면 부정형을 놓칠 수 있으므로 확신하지 않음
+            confidence = min(confidence, self.settings["model_only_max_confidence"])
+        return EmotionScore(LABELS[best], confidence, "local")
+
+    def lexicon_score(self, message: str) -> int:
+        """사전 매칭만으로 계산한 점수 (-1, 0, +1)"""
+        total, _ = self.automaton.score(normalize_for_scoring(message), self.settings["negation_window"])
+        if total >= 0.5:
+            return 1
+        if total <= -0.5:
+            return -1
+        return 0
+
+
+# 프로세스 전역 분석기 (임포트 시 한 번만 컴파일/학습)
+local_scorer = LocalEmotionScorer()
+
+
+def score_emotion_locally(message: str) -> EmotionScore:
+    return local_scorer.score(message)
+
+
+def is_confident(result: EmotionScore) -> bool:
+    return result.confidence >= EMOTION_SCORER_CONFIG["confidence_threshold"]
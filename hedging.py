@@ -0,0 +1,195 @@
+# hedging.py
+import asyncio
+import time
+from collections import deque
+
+from config import HEDGING_CONFIG
+
+
+class RollingLatency:
+    """모델별 최근 지연시간 표본으로 p95를 계산합니다."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples = {}  # model: deque
+
+    def add(self, model: str, seconds: float):
+        self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, pct: float = 0.95):
+        values = self.samples.get(model)
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def count(self, model: str) -> int:
+        return len(self.samples.get(model, ()))
+
+
+class CircuitBreaker:
+    """연속 데드라인 초과가 임계값을 넘으면 일정 시간 폴백 모델로 우회합니다."""
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}  # model: 연속 초과 횟수
+        self.open_until = {}  # model: 우회 종료 시각
+
+    def is_open(self, model: str) -> bool:
+        until = self.open_until.get(model)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            # 쿨다운 종료: 원래 모델로 다시 시도
+            del self.open_until[model]
+            self.failures[model] = 0
+            return False
+        return True
+
+    def record_success(self, model: str):
+        self.failures[model] = 0
+
+    def record_timeout(self, model: str):
+        self.failures[model] = self.failures.get(model, 0) + 1
+        if self.failures[model] >= self.threshold and model not in self.open_until:
+            self.open_until[model] = time.monotonic() + self.cooldown
+            print(f"[Hedging] {model} 연속 지연 {self.failures[model]}회 → {self.cooldown:.0f}초간 폴백 모델 사용")
+
+
+class HedgedCaller:
+    """첫 요청이 적응형 데드라인 안에 끝나지 않으면 같은 요청을 한 번 더 보내고 먼저 끝난 쪽을 사용합니다."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(HEDGING_CONFIG, **(settings or {}))
+        self.latency = RollingLatency(self.settings["window"])
+        self.breaker = CircuitBreaker(self.settings["breaker_threshold"], self.settings["breaker_cooldown"])
+        self.stats = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "timeouts": 0,
+            "fallback_calls": 0,
+        }
+
+    def deadline(self, model: str) -> float:
+        if self.latency.count(model) < self.settings["min_samples"]:
+            return self.settings["initial_deadline"]
+        p95 = self.latency.percentile(model) * self.settings["p95_multiplier"]
+        return min(self.settings["max_deadline"], max(self.settings["min_deadline"], p95))
+
+    def route(self, model: str) -> str:
+        fallback = self.settings["fallback_models"].get(model)
+        if fallback and self.breaker.is_open(model):
+            self.stats["fallback_calls"] += 1
+            return fallback
+        return model
+
+    @staticmethod
+    async def _discard(task, on_discard=None, model: str = None):
+        """필요 없어진 요청을 취소 (이미 끝난 스트림이면 닫고, 이미 받은 응답은 on_discard로 넘김)"""
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            result = task.result()
+            close = getattr(result, "aclose", None)
+            if close:
+                try:
+                    await close()
+                except Exception:
+                    pass
+            elif on_discard:
+                try:
+                    on_discard(result, model)
+                except Exception as e:
+                    print(f"[Hedging] 버려진 응답 처리 오류: {e}")
+
+    async def call(self, factory, model: str, on_discard=None):
+        """factory(model) -> 코루틴. (결과, 실제 사용된 모델)을 반환합니다.
+
+        on_discard(result, model): 진 쪽 요청도 이미 응답을 받았으면 호출 (토큰 사용량 기록용)
+        """
+        self.stats["calls"] += 1
+        model = self.route(model)
+        if not self.settings["enabled"]:
+            return await factory(model), model
+
+        started = time.monotonic()
+        deadline = self.deadline(model)
+        primary = asyncio.create_task(factory(model))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=deadline)
+        except BaseException:
+            # 호출한 쪽이 취소되면 첫 요청도 정리
+            await self._discard(primary)
+            raise
+        if done:
+            result = primary.result()
+            self.latency.add(model, time.monotonic() - started)
+            self.breaker.record_success(model)
+            return result, model
+
+        # 데드라인 초과: 중복 요청 발사 (차단기 기록은 결과를 보고 결정)
+        self.stats["hedged"] += 1
+        hedge_started = time.monotonic()
+        hedge = asyncio.create_task(factory(model))
+        pending = {primary, hedge}
+        remaining = self.settings["request_timeout"] - deadline
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+                remaining = self.settings["request_timeout"] - (time.monotonic() - started)
+        finally:
+            # 진 쪽 요청 취소 (이미 끝난 스트림이면 닫기)
+            for task in (primary, hedge):
+                if task is not winner:
+                    await self._discard(task, on_discard, model)
+        if winner is not primary:
+            # 첫 요청이 결국 이기면 일시적 지연으로 보고 연속 초과에 넣지 않음
+            self.breaker.record_timeout(model)
+        if winner is not None:
+            # 지연 표본은 이긴 요청 자체의 소요 시간 (데드라인이 스스로 늘어나지 않도록)
+            if winner is hedge:
+                self.stats["hedge_wins"] += 1
+                self.latency.add(model, time.monotonic() - hedge_started)
+            else:
+                self.latency.add(model, time.monotonic() - started)
+            return winner.result(), model
+        if error is not None:
+            raise error
+        self.stats["timeouts"] += 1
+        raise asyncio.TimeoutError(f"{model} did not respond within {self.settings['request_timeout']}s")
+
+
+hedged_caller = HedgedCaller()
+
+
+if __name__ == "__main__":
+    # 지연 주입 시뮬레이션: 10%의 요청이 8초 걸리는 모델
+    import random
+
+    async def fake_request(model):
+        await asyncio.sleep(8.0 if random.random() < 0.1 else random.uniform(0.05, 0.2))
+        return model
+
+    async def main():
+        caller = HedgedCaller({"initial_deadline": 0.5, "min_deadline": 0.1, "min_samples": 10, "request_timeout": 20.0})
+        started = time.monotonic()
+        worst = 0.0
+        for _ in range(100):
+            t = time.monotonic()
+            await caller.call(fake_request, "gpt-4o-mini")
+            worst = max(worst, time.monotonic() - t)
+        print(f"100 calls in {time.monotonic() - started:.1f}s, worst {worst:.2f}s, deadline {caller.deadline('gpt-4o-mini'):.2f}s")
+        print(caller.stats)
+
+    asyncio.run(main())
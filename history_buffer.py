@@ -0,0 +1,85 @@
+# history_buffer.py
+from collections import OrderedDict, deque
+
+from config import HISTORY_BUFFER_CONFIG
+
+
+class _ChannelRing:
+    __slots__ = ("turns", "complete")
+
+    def __init__(self, turns: list, capacity: int):
+        self.turns = deque(turns, maxlen=capacity)
+        # DB에서 capacity보다 적게 읽혔으면 채널의 전체 기록이 버퍼에 있음
+        self.complete = len(turns) < capacity
+
+
+class ChannelHistoryBuffer:
+    """채널별 최근 대화 링 버퍼 (저장/전송 시 추가, 재시작 후 첫 조회 때 DB에서 한 번 채움)"""
+
+    def __init__(self, turns_per_channel: int = None, max_channels: int = None):
+        self.turns_per_channel = turns_per_channel or HISTORY_BUFFER_CONFIG["turns_per_channel"]
+        self.max_channels = max_channels or HISTORY_BUFFER_CONFIG["max_channels"]
+        self._channels = OrderedDict()  # channel_id: _ChannelRing (LRU)
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "hydrations": 0,
+            "evictions": 0,
+        }
+
+    def append(self, channel_id: int, role: str, content: str, user_id: int = None, language: str = None,
+               message_id: int = None):
+        """메시지 저장 직후 호출. 아직 버퍼에 없는 채널은 첫 조회 때 DB에서 채우므로 무시합니다."""
+        ring = self._channels.get(channel_id)
+        if ring is None:
+            return
+        if len(ring.turns) == ring.turns.maxlen:
+            ring.complete = False
+        ring.turns.append({"role": role, "content": content, "user_id": user_id, "language": language, "id": message_id})
+
+    def _ring(self, channel_id: int, loader):
+        ring = self._channels.get(channel_id)
+        if ring is not None:
+            self._channels.move_to_end(channel_id)
+            return ring
+        # loader(channel_id, limit) -> 오래된 순 [{"role", "content", "user_id", "language", "id"}] (실패 시 None)
+        turns = loader(channel_id, self.turns_per_channel)
+        if turns is None:
+            return None
+        self.stats["hydrations"] += 1
+        ring = _ChannelRing(turns, self.turns_per_channel)
+        self._channels[channel_id] = ring
+        # 오래 대화가 없던 채널부터 메모리에서 제거
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+            self.stats["evictions"] += 1
+        return ring
+
+    def recent(self, channel_id: int, limit: int, loader, user_id: int = None, language: str = None,
+               with_ids: bool = False):
+        """최근 limit개 메시지 [{"role", "content"}] (with_ids면 "id"도 포함). 버퍼만으로 답할 수 없으면 None (호출한 쪽에서 DB 조회)"""
+        ring = self._ring(channel_id, loader)
+        if ring is None:
+            self.stats["misses"] += 1
+            return None
+        turns = [
+            turn for turn in ring.turns
+            if (user_id is None or turn["user_id"] == user_id)
+            and (language is None or turn["language"] == language)
+        ]
+        if len(turns) < limit and not ring.complete:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        if limit <= 0:
+            return []
+        if with_ids:
+            return [{"role": turn["role"], "content": turn["content"], "id": turn.get("id")} for turn in turns[-limit:]]
+        return [{"role": turn["role"], "content": turn["content"]} for turn in turns[-limit:]]
+
+    def discard(self, channel_id: int):
+        self._channels.pop(channel_id, None)
+
+
+# 같은 프로세스의 모든 봇이 공유 (채널은 봇마다 다르므로 충돌 없음)
+channel_history = ChannelHistoryBuffer()
@@ -0,0 +1,51 @@
+# i18n.py
+import json
+import os
+import string
+from types import MappingProxyType
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+FALLBACK_LANGUAGE = "en"
+
+_formatter = string.Formatter()
+
+
+def _placeholders(template: str) -> frozenset:
+    return frozenset(name for _, name, _, _ in _formatter.parse(template) if name)
+
+
+def compile_catalogs(directory: str = LOCALES_DIR, fallback: str = FALLBACK_LANGUAGE) -> MappingProxyType:
+    """locales/<언어>.json 파일들을 읽어 언어별 읽기 전용 조회 테이블로 컴파일합니다.
+
+    빠진 키는 컴파일 시점에 기본 언어 문자열로 채워 두므로 조회는 항상 dict 한 번입니다.
+    """
+    raw = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                raw[filename[:-5]] = json.load(f)
+    base = raw[fallback]
+    catalogs = {}
+    for language, messages in raw.items():
+        table = dict(base)
+        for key, template in messages.items():
+            if key not in base:
+                print(f"[i18n] {language}.json: 기본 언어({fallback})에 없는 키 {key}")
+            elif _placeholders(template) != _placeholders(base[key]):
+                print(f"[i18n] {language}.json: {key}의 파라미터가 {fallback}와 다릅니다")
+            table[key] = template
+        catalogs[language] = MappingProxyType(table)
+    return MappingProxyType(catalogs)
+
+
+# 시작 시 한 번만 컴파일
+CATALOGS = compile_catalogs()
+
+
+def t(key: str, language: str = FALLBACK_LANGUAGE, **params) -> str:
+    """UI 문자열 조회 (없는 언어는 기본 언어, 없는 키는 키 그대로 반환)"""
+    table = CATALOGS.get(language) or CATALOGS[FALLBACK_LANGUAGE]
+    template = table.get(key)
+    if template is None:
+        return key
+    return template.format_map(params) if params else template
@@ -1,6 +1,9 @@
 import psycopg2
+from psycopg2.extras import execute_values
 import os
 
+from language_detector import detect_message_language, CHANNEL_LANGUAGE_ALIASES
+
 DATABASE_URL = os.environ["DATABASE_URL"]
 
 def create_all_tables():
@@ -165,4 +168,139 @@ def create_all_tables():
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-        conn.commit()
\ No newline at end of file
+            # llm_usage (LLM 호출별 토큰/비용 기록)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT,
+                    character_name TEXT,
+                    channel_id BIGINT,
+                    purpose TEXT,
+                    model TEXT,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    latency_ms INTEGER DEFAULT 0,
+                    cost_usd DOUBLE PRECISION DEFAULT 0,
+                    route TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_llm_usage_user_created ON llm_usage (user_id, created_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage (created_at)
+            ''')
+            cursor.execute('''
+                ALTER TABLE llm_usage ADD COLUMN IF NOT EXISTS route TEXT
+            ''')
+            # 예전에 만들어진 conversations 테이블에 token_count 컬럼 보장
+            cursor.execute('''
+                ALTER TABLE conversations ADD COLUMN IF NOT EXISTS token_count INTEGER
+            ''')
+            # 채널별 언어 변경 이력 (변경 시 한 행 추가, effective_from 기준으로 과거 언어 계산)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS channel_settings (
+                    id SERIAL PRIMARY KEY,
+                    channel_id BIGINT,
+                    user_id BIGINT,
+                    character_name TEXT,
+                    language TEXT,
+                    effective_from TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                ALTER TABLE channel_settings ADD COLUMN IF NOT EXISTS effective_from TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_channel_settings_lookup ON channel_settings (channel_id, user_id, character_name, effective_from DESC)
+            ''')
+            # 기존 user_language 설정을 이력의 시작점으로 옮김 (이미 있으면 건너뜀)
+            cursor.execute('''
+                INSERT INTO channel_settings (channel_id, user_id, character_name, language, effective_from)
+                SELECT u.channel_id, u.user_id, u.character_name, u.language, u.updated_at
+                FROM user_language u
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM channel_settings c
+                    WHERE c.channel_id = u.channel_id AND c.user_id = u.user_id AND c.character_name = u.character_name
+                )
+            ''')
+            # 감정 분석 작업 큐 (답변 전송과 분리된 백그라운드 처리)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS emotion_jobs (
+                    id BIGSERIAL PRIMARY KEY,
+                    job_key TEXT UNIQUE,
+                    user_id BIGINT,
+                    character_name TEXT,
+                    channel_id BIGINT,
+                    message TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    score INTEGER,
+                    locked_until TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    applied_at TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_emotion_jobs_pending ON emotion_jobs (character_name, id) WHERE status = 'pending'
+            ''')
+            # 완료/실패 작업 보관 기간 정리용
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_emotion_jobs_finished ON emotion_jobs (character_name, created_at) WHERE status <> 'pending'
+            ''')
+            # 번역 결과 캐시 (원문 해시 + 대상 언어)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS translation_cache (
+                    text_hash TEXT,
+                    target_language TEXT,
+                    translated TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (text_hash, target_language)
+                )
+            ''')
+            # 언어별 최근 대화 조회용 인덱스
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_channel_language_ts ON conversations (channel_id, language, timestamp DESC)
+            ''')
+        conn.commit()
+
+def backfill_message_languages(batch_size: int = 1000) -> int:
+    """language가 비어 있는 기존 대화 행에 감지한 언어를 배치로 채웁니다. (채널 언어 코드로 정규화)"""
+    # 정규화 이전에 원래 감지값('ko')으로 저장된 행도 채널 언어 코드로 맞춤
+    with psycopg2.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cursor:
+            for detected, channel_language in CHANNEL_LANGUAGE_ALIASES.items():
+                cursor.execute(
+                    "UPDATE conversations SET language = %s WHERE language = %s",
+                    (channel_language, detected)
+                )
+        conn.commit()
+    total = 0
+    last_id = 0
+    while True:
+        with psycopg2.connect(DATABASE_URL) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, content FROM conversations
+                    WHERE language IS NULL AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    return total
+                execute_values(cursor, '''
+                    UPDATE conversations AS c SET language = v.language
+                    FROM (VALUES %s) AS v (id, language)
+                    WHERE c.id = v.id
+                ''', [(row_id, detect_message_language(content)) for row_id, content in rows])
+            conn.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+        print(f"[언어백필] {total}개 행 처리 (마지막 id={last_id})")
+
+if __name__ == "__main__":
+    create_all_tables()
+    backfill_message_languages()
@@ -0,0 +1,143 @@
+# language_detector.py
+import asyncio
+import re
+
+# 괄호 안 행동 묘사는 언어 판별에서 제외 (예: "(smiling)", "(微笑)")
+_PAREN_RE = re.compile(r"\([^)]*\)|（[^）]*）")
+
+
+def script_counts(text: str) -> dict:
+    """유니코드 문자 체계별 글자 수"""
+    counts = {"hangul": 0, "kana": 0, "han": 0, "latin": 0}
+    for ch in text:
+        code = ord(ch)
+        if 0xAC00 <= code <= 0xD7AF or 0x1100 <= code <= 0x11FF or 0x3130 <= code <= 0x318F:
+            counts["hangul"] += 1
+        elif 0x3040 <= code <= 0x30FF or 0x31F0 <= code <= 0x31FF or 0xFF66 <= code <= 0xFF9F:
+            counts["kana"] += 1
+        elif 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF:
+            counts["han"] += 1
+        elif ch.isascii() and ch.isalpha():
+            counts["latin"] += 1
+    return counts
+
+
+def detect_script_language(text: str, min_letters: int = 3):
+    """문자 체계만으로 빠르게 언어를 추정합니다. 판단할 글자가 부족하면 None."""
+    counts = script_counts(_PAREN_RE.sub("", text or ""))
+    if sum(counts.values()) < min_letters:
+        return None
+    if counts["hangul"] and counts["hangul"] >= counts["kana"] + counts["han"]:
+        return "ko"
+    if counts["kana"]:
+        return "ja"
+    if counts["han"] and counts["han"] >= counts["latin"] // 4:
+        return "zh"
+    return "en" if counts["latin"] else None
+
+
+# 영어 판정용 기능어 (이 중 하나라도 있으면 영어로 확정)
+_ENGLISH_WORDS = frozenset(
+    "i you he she it we they me my your is are am was were be been do does did have has had "
+    "the a an and or but if so to of in on at for with from about this that what how why when "
+    "where who not no yes can will would could should just really please thanks thank hi hello hey "
+    "ok okay lol good bad love like want know think feel today".split()
+)
+_LATIN_WORD_RE = re.compile(r"[A-Za-z\u00C0-\u024F']+")
+_EXTENDED_LATIN_RE = re.compile(r"[\u00C0-\u024F]")
+
+
+def _is_ambiguous_latin(text: str) -> bool:
+    """라틴 문자뿐인데 영어라고 확정할 근거가 없는 경우 (악센트 문자 또는 기능어 없음)"""
+    if _EXTENDED_LATIN_RE.search(text):
+        return True
+    words = _LATIN_WORD_RE.findall(text.lower())
+    if len(words) < 3:
+        return False  # 짧은 라틴 문자 메시지는 영어로 간주
+    return not any(word in _ENGLISH_WORDS for word in words)
+
+
+def detect_language(text: str, default: str = "en") -> str:
+    """핫패스용 결정적 언어 판별 (문자 체계 → 라틴은 영어로 간주). langdetect를 부르지 않습니다."""
+    return detect_script_language(text, min_letters=1) or default
+
+
+# 채널 언어는 en/ja/zh만 설정 가능 (한국어 대화는 영어 채널로 처리)
+CHANNEL_LANGUAGE_ALIASES = {"ko": "en"}
+
+
+def to_channel_language(language: str) -> str:
+    """감지한 언어를 채널 언어 코드로 맞춤 (ko → en)"""
+    return CHANNEL_LANGUAGE_ALIASES.get(language, language)
+
+
+def detect_message_language(text: str) -> str:
+    """대화 기록 저장용 언어 (채널 언어 기준으로 정규화)"""
+    return to_channel_language(detect_language(text or ""))
+
+
+def _langdetect(text: str):
+    try:
+        import langdetect
+        langdetect.DetectorFactory.seed = 0  # 같은 입력에 항상 같은 결과
+        detected = langdetect.detect(text)
+    except Exception as e:
+        print(f"Language detection error: {e}")
+        return None
+    return {"zh-cn": "zh", "zh-tw": "zh"}.get(detected, detected)
+
+
+async def detect_language_async(text: str, default: str = "en") -> str:
+    """빠른 판별로 결정되지 않는 라틴 문자 텍스트만 executor에서 langdetect로 판별합니다."""
+    cleaned = _PAREN_RE.sub("", text or "")
+    language = detect_script_language(cleaned, min_letters=1)
+    if language != "en" or not _is_ambiguous_latin(cleaned):
+        return language or default
+    detected = await asyncio.get_running_loop().run_in_executor(None, _langdetect, cleaned)
+    return detected or default
+
+
+def is_language_mismatch(text: str, expected: str) -> bool:
+    """확실히 다른 언어일 때만 True (판단 불가/한자만 있는 일본어는 통과, 한국어는 en 채널 언어로 취급)"""
+    detected = to_channel_language(detect_script_language(text))
+    if detected is None or detected == to_channel_language(expected):
+        return False
+    if expected == "ja" and detected == "zh":
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    # 벤치마크: python language_detector.py [메시지 파일 (한 줄에 한 메시지)]
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            samples = [line.strip() for line in f if line.strip()]
+    else:
+        samples = [
+            "안녕 카가리! 오늘 뭐 했어?", "hi kagari, how are you today?", "おはよう！今日は何をする？",
+            "你好，今天天气很好", "(smiles) hello!", "ㅋㅋㅋ 진짜?", "lol", "Hola, ¿cómo estás?",
+            "Bonjour, je suis fatigué", "I love this song so much", "今日は晴れです", "好的，谢谢",
+        ] * 200
+
+    started = time.perf_counter()
+    fast = [detect_language(text) for text in samples]
+    fast_ms = (time.perf_counter() - started) * 1000
+    ambiguous = sum(1 for text, lang in zip(samples, fast) if lang == "en" and _is_ambiguous_latin(text))
+    print(f"fast detector: {len(samples)} messages, {fast_ms:.1f} ms ({fast_ms * 1000 / len(samples):.1f} us/msg), "
+          f"ambiguous latin {ambiguous}")
+
+    try:
+        import langdetect
+    except ImportError:
+        print("langdetect not installed, skipping comparison")
+        sys.exit(0)
+    langdetect.DetectorFactory.seed = 0
+    started = time.perf_counter()
+    slow = [_langdetect(text) for text in samples]
+    slow_ms = (time.perf_counter() - started) * 1000
+    agree = sum(1 for a, b in zip(fast, slow) if a == b)
+    print(f"langdetect:    {len(samples)} messages, {slow_ms:.1f} ms ({slow_ms * 1000 / len(samples):.1f} us/msg), "
+          f"agreement {agree / len(samples):.1%}")
@@ -0,0 +1,281 @@
+# long_term_memory.py
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import LONG_TERM_MEMORY_CONFIG, EMBEDDING_CONFIG
+from text_embedding import embed_text, embed_texts
+
+
+class MemoryShard:
+    """유저 1명 × 캐릭터 1명의 대화 기억 (float16 임베딩 행렬 + 원문 목록)"""
+
+    def __init__(self, dim: int, vectors: np.ndarray = None, records: list = None):
+        self.dim = dim
+        records = records or []
+        count = len(records)
+        capacity = max(64, count * 2)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float16)
+        if count:
+            self.vectors[:count] = vectors[:count]
+        self.records = records  # {"user", "reply", "ts"}
+        self.size = count
+        self.persisted = count  # 디스크에 이미 기록된 개수
+
+    def add(self, vector: np.ndarray, record: dict):
+        if self.size == len(self.vectors):
+            # 용량을 두 배로 늘림 (검색 중인 쪽은 이전 배열을 그대로 사용)
+            grown = np.zeros((len(self.vectors) * 2, self.dim), dtype=np.float16)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = vector
+        self.records.append(record)
+        self.size += 1
+
+    def search(self, query: np.ndarray, k: int, exclude_recent: int = 0, block_rows: int = 2048) -> list:
+        """코사인 유사도 상위 k개 (점수, 레코드) 목록 (최근 exclude_recent개는 제외)"""
+        vectors, size = self.vectors, self.size - exclude_recent
+        if size <= 0 or k <= 0:
+            return []
+        scores = np.empty(size, dtype=np.float32)
+        # float16 행렬곱은 느리므로 블록 단위로 float32 변환 후 계산
+        for start in range(0, size, block_rows):
+            end = min(size, start + block_rows)
+            scores[start:end] = vectors[start:end].astype(np.float32) @ query
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.records[i]) for i in top]
+
+
+class LongTermMemory:
+    """유저/캐릭터별 벡터 기억 인덱스 (백그라운드 임베딩, 디스크 append 저장, top-k 검색)"""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(LONG_TERM_MEMORY_CONFIG, **(settings or {}))
+        self.dim = EMBEDDING_CONFIG["dim"]
+        self.shards = OrderedDict()  # (user_id, character_name): MemoryShard (LRU)
+        self._evicting = {}  # 내리는 중(저장 완료 전)인 샤드, 그 사이 다시 요청되면 그대로 되살림
+        self._loading = {}  # 로딩 중인 키: Future (같은 키를 두 번 읽어 샤드가 둘이 되지 않도록)
+        self.queue = None
+        self._worker = None
+        self._flush_lock = threading.Lock()
+        self.stats = {
+            "queued": 0,
+            "indexed": 0,
+            "dropped": 0,
+            "recalls": 0,
+            "recall_ms_total": 0.0,
+        }
+
+    # ---------- 디스크 ----------
+
+    def _paths(self, user_id: int, character_name: str) -> tuple:
+        base = os.path.join(self.settings["directory"], f"{user_id}_{character_name}")
+        return base + ".f16", base + ".jsonl"
+
+    def _load_shard(self, user_id: int, character_name: str) -> MemoryShard:
+        vector_path, record_path = self._paths(user_id, character_name)
+        if not os.path.exists(vector_path) or not os.path.exists(record_path):
+            return MemoryShard(self.dim)
+        try:
+            with self._flush_lock:
+                raw = np.fromfile(vector_path, dtype=np.float16)
+                vectors = raw[:len(raw) // self.dim * self.dim].reshape(-1, self.dim)
+                records = []
+                with open(record_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            break  # 끝에 잘린 줄
+                # 중간에 끊긴 쓰기가 있으면 양쪽 중 짧은 쪽에 맞추고 파일도 잘라 둠
+                # (그대로 두면 다음 append가 남은 조각 뒤에 붙어 벡터와 원문이 어긋남)
+                count = min(len(vectors), len(records))
+                if len(raw) != count * self.dim or len(records) != count:
+                    self._truncate_files(vector_path, record_path, records[:count])
+            return MemoryShard(self.dim, vectors[:count], records[:count])
+        except Exception as e:
+            print(f"Error loading memory shard {user_id}/{character_name}: {e}")
+            return MemoryShard(self.dim)
+
+    def _truncate_files(self, vector_path: str, record_path: str, records: list):
+        os.truncate(vector_path, len(records) * self.dim * np.dtype(np.float16).itemsize)
+        tmp_path = record_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, record_path)
+        print(f"[장기기억] 끊긴 쓰기 정리: {record_path} ({len(records)}개 유지)")
+
+    def _flush_shard(self, key: tuple, shard: MemoryShard):
+        """새로 추가된 부분만 파일 끝에 이어 씁니다."""
+        with self._flush_lock:
+            self._append_shard(key, shard)
+
+    def _append_shard(self, key: tuple, shard: MemoryShard):
+        size = shard.size
+        if shard.persisted >= size:
+            return
+        try:
+            os.makedirs(self.settings["directory"], exist_ok=True)
+            vector_path, record_path = self._paths(*key)
+            with open(record_path, "a", encoding="utf-8") as f:
+                for record in shard.records[shard.persisted:size]:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            with open(vector_path, "ab") as f:
+                f.write(shard.vectors[shard.persisted:size].tobytes())
+            shard.persisted = size
+        except Exception as e:
+            print(f"Error saving memory shard {key}: {e}")
+
+    def flush(self):
+        for key, shard in list(self.shards.items()) + list(self._evicting.items()):
+            self._flush_shard(key, shard)
+
+    def _cached_shard(self, key: tuple):
+        shard = self.shards.get(key)
+        if shard is None:
+            # 저장이 끝나기 전에 다시 요청된 샤드는 디스크에서 읽지 않고 그대로 되살림
+            shard = self._evicting.get(key)
+            if shard is None:
+                return None
+            self.shards[key] = shard
+        self.shards.move_to_end(key)
+        return shard
+
+    async def _shard(self, user_id: int, character_name: str) -> MemoryShard:
+        key = (user_id, character_name)
+        shard = self._cached_shard(key)
+        if shard is not None:
+            return shard
+        loop = asyncio.get_running_loop()
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = loop.run_in_executor(None, self._load_shard, user_id, character_name)
+            self._loading[key] = loading
+        try:
+            # 한 작업이 취소돼도 같은 로딩을 기다리는 다른 작업에는 영향 없도록 shield
+            loaded = await asyncio.shield(loading)
+        finally:
+            if self._loading.get(key) is loading:
+                del self._loading[key]
+        # 같은 로딩을 기다린 작업 중 먼저 깨어난 쪽이 올린 샤드를 함께 사용
+        shard = self._cached_shard(key)
+        if shard is None:
+            shard = self.shards[key] = loaded
+        await self._evict(loop)
+        return shard
+
+    async def _evict(self, loop):
+        """메모리에 올려 두는 샤드 수 제한 (오래 안 쓴 샤드는 executor에서 저장 후 내림)"""
+        evicted = []
+        while len(self.shards) > self.settings["max_loaded_shards"]:
+            old_key, old_shard = self.shards.popitem(last=False)
+            self._evicting[old_key] = old_shard
+            evicted.append((old_key, old_shard))
+        for old_key, old_shard in evicted:
+            try:
+                await loop.run_in_executor(None, self._flush_shard, old_key, old_shard)
+            finally:
+                if self._evicting.get(old_key) is old_shard:
+                    del self._evicting[old_key]
+
+    # ---------- 저장 ----------
+
+    def remember(self, user_id: int, character_name: str, user_message: str, reply: str):
+        """대화 한 턴(유저 메시지 + 캐릭터 답변)을 백그라운드 임베딩 큐에 넣습니다."""
+        if not self.settings["enabled"] or not user_message:
+            return
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.settings["queue_size"])
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run_worker())
+        record = {"user": user_message, "reply": reply or "", "ts": int(time.time())}
+        try:
+            self.queue.put_nowait((user_id, character_name, record))
+            self.stats["queued"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _run_worker(self):
+        loop = asyncio.get_running_loop()
+        batch_size = self.settings["embed_batch_size"]
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                # 임베딩 계산과 디스크 쓰기는 이벤트 루프 밖에서 실행
+                texts = [f"{record['user']}\n{record['reply']}" for _, _, record in batch]
+                vectors = await loop.run_in_executor(None, embed_texts, texts)
+                touched = {}
+                for (user_id, character_name, record), vector in zip(batch, vectors):
+                    shard = await self._shard(user_id, character_name)
+                    shard.add(vector.astype(np.float16), record)
+                    touched[(user_id, character_name)] = shard
+                self.stats["indexed"] += len(batch)
+                for key, shard in touched.items():
+                    await loop.run_in_executor(None, self._flush_shard, key, shard)
+            except Exception as e:
+                print(f"Error indexing long-term memory: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    # ---------- 검색 ----------
+
+    def _search(self, shard: MemoryShard, query: str, k: int) -> list:
+        hits = shard.search(embed_text(query), k, exclude_recent=self.settings["exclude_recent"])
+        return [record for score, record in hits if score >= self.settings["min_similarity"]]
+
+    async def recall(self, user_id: int, character_name: str, query: str, k: int = None) -> list:
+        """현재 메시지와 관련된 과거 대화 턴 상위 k개 (관련도 순)"""
+        if not self.settings["enabled"] or not query:
+            return []
+        started = time.monotonic()
+        try:
+            shard = await self._shard(user_id, character_name)
+            records = await asyncio.get_running_loop().run_in_executor(
+                None, self._search, shard, query, k or self.settings["top_k"]
+            )
+        except Exception as e:
+            print(f"Error recalling long-term memory: {e}")
+            return []
+        self.stats["recalls"] += 1
+        self.stats["recall_ms_total"] += (time.monotonic() - started) * 1000
+        return records
+
+
+def format_memory(record: dict) -> str:
+    """프롬프트에 넣을 한 줄 형식"""
+    day = time.strftime("%Y-%m-%d", time.localtime(record.get("ts", 0)))
+    line = f"[{day}] User: {record['user']}"
+    if record.get("reply"):
+        line += f" / You: {record['reply']}"
+    return line
+
+
+long_term_memory = LongTermMemory()
+
+
+if __name__ == "__main__":
+    # 검색 지연시간 벤치마크: python long_term_memory.py
+    import random
+
+    rng = np.random.default_rng(0)
+    dim = EMBEDDING_CONFIG["dim"]
+    for count in (10_000, 100_000, 1_000_000):
+        vectors = rng.standard_normal((count, dim)).astype(np.float16)
+        shard = MemoryShard(dim, vectors, [{"user": str(i), "reply": "", "ts": 0} for i in range(count)])
+        query = embed_text(f"query {random.random()}")
+        started = time.perf_counter()
+        for _ in range(5):
+            shard.search(query, 5)
+        elapsed = (time.perf_counter() - started) / 5 * 1000
+        print(f"{count:>9,} rows: {elapsed:.1f} ms/search, {vectors.nbytes / 2**20:.0f} MiB float16")
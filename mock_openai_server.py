@@ -0,0 +1,176 @@
+# mock_openai_server.py
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+from config import MOCK_OPENAI_CONFIG
+from context_builder import count_tokens
+from single_flight import request_key
+
+
+class MockOpenAIServer:
+    """/v1/chat/completions를 흉내 내는 로컬 서버 (지연 분포, 오류 주입, 녹화 응답 리플레이)"""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(MOCK_OPENAI_CONFIG, **(settings or {}))
+        self.replay = {}  # 프롬프트 해시: [응답 텍스트, ...]
+        self.stats = {"requests": 0, "replayed": 0, "errors_429": 0, "errors_500": 0, "timeouts": 0}
+        self.load_replay(self.settings.get("replay_file"))
+
+    def load_replay(self, path: str):
+        if not path or not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self.replay.setdefault(record["key"], []).append(record["content"])
+                except Exception as e:
+                    print(f"Error loading replay line: {e}")
+        print(f"[MockOpenAI] 리플레이 {len(self.replay)}개 프롬프트 로드")
+
+    def sample_latency(self) -> float:
+        latency = self.settings["latency"]
+        kind = latency["distribution"]
+        if kind == "fixed":
+            value = latency["value"]
+        elif kind == "uniform":
+            value = random.uniform(latency["low"], latency["high"])
+        else:
+            value = random.lognormvariate(0, latency["sigma"]) * latency["median"]
+        if random.random() < self.settings["tail_probability"]:
+            value += self.settings["tail_latency"]
+        return value
+
+    def pick_fault(self):
+        roll = random.random()
+        for fault, rate in self.settings["error_rates"].items():
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def make_content(self, messages: list) -> str:
+        recorded = self.replay.get(request_key(messages))
+        if recorded:
+            self.stats["replayed"] += 1
+            return random.choice(recorded)
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        if "[score:" in last:
+            return random.choice(["[score:+1]", "[score:0]", "[score:-1]"])
+        return f"(smiling) I heard you say: {last[:80]}"
+
+    def error_response(self, status: int, message: str, kind: str):
+        return web.json_response({"error": {"message": message, "type": kind, "code": status}}, status=status)
+
+    async def chat_completions(self, request):
+        self.stats["requests"] += 1
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o-mini")
+
+        fault = self.pick_fault()
+        if fault == "timeout":
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(self.settings["timeout_seconds"])
+        await asyncio.sleep(self.sample_latency())
+        if fault == "429":
+            self.stats["errors_429"] += 1
+            return self.error_response(429, "Rate limit reached (mock)", "rate_limit_error")
+        if fault == "500":
+            self.stats["errors_500"] += 1
+            return self.error_response(500, "The server had an error while processing your request (mock)", "server_error")
+
+        n = int(body.get("n") or 1)
+        contents = [self.make_content(messages) for _ in range(n)]
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if body.get("stream"):
+            return await self.stream_response(request, completion_id, created, model, contents[0])
+
+        prompt_tokens = sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+        completion_tokens = sum(count_tokens(c) for c in contents)
+        return web.json_response({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": c}, "finish_reason": "stop"}
+                for i, c in enumerate(contents)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        })
+
+    async def stream_response(self, request, completion_id: str, created: int, model: str, content: str):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            await send({"role": "assistant"})
+            for i in range(0, len(content), 4):
+                await send({"content": content[i:i + 4]})
+                await asyncio.sleep(self.settings["token_interval"])
+            await send({}, "stop")
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            # 클라이언트가 스트림을 중간에 닫은 경우 (언어 검사 중단 등)
+            return response
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock OpenAI server")
+    parser.add_argument("--host", default=MOCK_OPENAI_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=MOCK_OPENAI_CONFIG["port"])
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default=MOCK_OPENAI_CONFIG["latency"]["distribution"])
+    parser.add_argument("--median", type=float, default=MOCK_OPENAI_CONFIG["latency"]["median"])
+    parser.add_argument("--rate-429", type=float, default=MOCK_OPENAI_CONFIG["error_rates"]["429"])
+    parser.add_argument("--rate-500", type=float, default=MOCK_OPENAI_CONFIG["error_rates"]["500"])
+    parser.add_argument("--rate-timeout", type=float, default=MOCK_OPENAI_CONFIG["error_rates"]["timeout"])
+    parser.add_argument("--replay-file", default=MOCK_OPENAI_CONFIG["replay_file"])
+    args = parser.parse_args()
+
+    server = MockOpenAIServer({
+        "host": args.host,
+        "port": args.port,
+        "latency": dict(MOCK_OPENAI_CONFIG["latency"], distribution=args.latency, median=args.median, value=args.median),
+        "error_rates": {"429": args.rate_429, "500": args.rate_500, "timeout": args.rate_timeout},
+        "replay_file": args.replay_file,
+    })
+    print(f"[MockOpenAI] http://{args.host}:{args.port}/v1 (OPENAI_API_BASE로 지정)")
+    web.run_app(server.build_app(), host=args.host, port=args.port)
@@ -0,0 +1,44 @@
+# model_router.py
+from typing import NamedTuple
+
+from config import ROUTING_CONFIG, HEDGING_CONFIG
+
+# 현재 진행 중인 LLM 요청 수 (openai_manager.chat_completion에서 증감)
+inflight_requests = {"count": 0}
+
+
+class RouteDecision(NamedTuple):
+    model: str
+    max_tokens: int
+    temperature: float
+    label: str  # llm_usage.route에 기록되는 결정 요약
+
+
+def route_request(grade: str = None, mode: str = "chat", message_length: int = 0) -> RouteDecision:
+    """등급/모드/메시지 길이/큐 압력으로 모델 티어와 max_tokens를 정합니다."""
+    if mode == "story":
+        base = ROUTING_CONFIG["story"]
+    else:
+        tiers = ROUTING_CONFIG["chat"]
+        base = tiers.get(grade, tiers["Rookie"])
+    model = base["model"]
+    max_tokens = base["max_tokens"]
+    reasons = [f"{mode}:{grade or '-'}"]
+
+    if message_length < ROUTING_CONFIG["short_message_chars"]:
+        max_tokens *= ROUTING_CONFIG["short_message_factor"]
+        reasons.append("short")
+    elif message_length > ROUTING_CONFIG["long_message_chars"]:
+        max_tokens *= ROUTING_CONFIG["long_message_factor"]
+        reasons.append("long")
+
+    if inflight_requests["count"] >= ROUTING_CONFIG["high_pressure_inflight"]:
+        # 부하가 높을 때는 한 단계 저렴한 모델 + 짧은 답변
+        model = HEDGING_CONFIG["fallback_models"].get(model, model)
+        max_tokens *= ROUTING_CONFIG["high_pressure_factor"]
+        reasons.append(f"pressure:{inflight_requests['count']}")
+
+    max_tokens = max(ROUTING_CONFIG["min_max_tokens"], int(max_tokens))
+    label = f"{'/'.join(reasons)}->{model}:{max_tokens}"
+    print(f"[Routing] {label}")
+    return RouteDecision(model, max_tokens, base["temperature"], label)
@@ -1,27 +1,236 @@
      # openai_manager.py
 import openai
+import json
 import re
+import time
+from emotion_scorer import score_emotion_locally, is_confident, local_scorer
+from emotion_cache import emotion_cache
+from language_detector import is_language_mismatch
+from context_builder import count_tokens, count_message_tokens
+from config import LANGUAGE_GUARD_CONFIG, SINGLE_FLIGHT_CONFIG, OPENAI_CONFIG, OPENAI_API_KEY
+from usage_tracker import usage_tracker, usage_context
+from hedging import hedged_caller
+from model_router import inflight_requests
+from single_flight import single_flight, request_key
 
-async def call_openai(prompt, model="gpt-4o"):
+# 목 서버 등 다른 엔드포인트 사용 시 (OPENAI_API_BASE)
+if OPENAI_CONFIG.get("api_base"):
+    openai.api_base = OPENAI_CONFIG["api_base"]
+    openai.api_key = OPENAI_API_KEY or "mock-key"
+elif OPENAI_API_KEY:
+    openai.api_key = OPENAI_API_KEY
+
+def record_response(messages: list, content: str):
+    """목 서버 리플레이용으로 (프롬프트 해시, 응답)을 JSONL에 추가합니다."""
+    path = OPENAI_CONFIG.get("record_file")
+    if not path or not content:
+        return
     try:
-        response = await openai.ChatCompletion.acreate(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=150
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": request_key(messages), "content": content}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"Error recording response: {e}")
+
+# 프롬프트 캐시 적중 통계 (usage.prompt_tokens_details.cached_tokens 기준)
+prompt_cache_stats = {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+}
+
+def _usage_value(obj, key, default=0):
+    if obj is None:
+        return default
+    try:
+        value = obj.get(key, default) if hasattr(obj, "get") else getattr(obj, key, default)
+    except Exception:
+        return default
+    return value if value is not None else default
+
+def record_prompt_cache_usage(response) -> float:
+    """응답의 usage에서 캐시된 토큰 비율을 기록하고 반환합니다."""
+    usage = _usage_value(response, "usage", None)
+    prompt_tokens = _usage_value(usage, "prompt_tokens")
+    cached_tokens = _usage_value(_usage_value(usage, "prompt_tokens_details", None), "cached_tokens")
+    prompt_cache_stats["requests"] += 1
+    prompt_cache_stats["prompt_tokens"] += prompt_tokens
+    prompt_cache_stats["cached_tokens"] += cached_tokens
+    return cached_tokens / prompt_tokens if prompt_tokens else 0.0
+
+def get_prompt_cache_ratio() -> float:
+    total = prompt_cache_stats["prompt_tokens"]
+    return prompt_cache_stats["cached_tokens"] / total if total else 0.0
+
+def _record_usage(model: str, purpose: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int, started: float):
+    attribution = usage_context.get()
+    usage_tracker.record(
+        model, purpose, prompt_tokens, completion_tokens, cached_tokens,
+        latency_ms=int((time.monotonic() - started) * 1000),
+        user_id=attribution.get("user_id"),
+        character_name=attribution.get("character_name"),
+        channel_id=attribution.get("channel_id"),
+        route=attribution.get("route")
+    )
+
+def _record_response_usage(response, messages: list, model: str, purpose: str, started: float):
+    usage = _usage_value(response, "usage", None)
+    prompt_tokens = _usage_value(usage, "prompt_tokens") or sum(count_message_tokens(m) for m in messages)
+    completion_tokens = _usage_value(usage, "completion_tokens")
+    cached_tokens = _usage_value(_usage_value(usage, "prompt_tokens_details", None), "cached_tokens")
+    _record_usage(model, purpose, prompt_tokens, completion_tokens, cached_tokens, started)
+
+class _PrefetchedStream:
+    """첫 청크를 미리 받아 둔 스트림 (첫 토큰 도착 시점으로 hedging 판단)"""
+
+    def __init__(self, first, stream, model):
+        self._first = first
+        self._stream = stream
+        self.model = model
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return await self._stream.__anext__()
+
+    async def aclose(self):
+        close = getattr(self._stream, "aclose", None)
+        if close:
+            await close()
+
+async def _open_stream(model: str, messages: list, kwargs: dict):
+    stream = await openai.ChatCompletion.acreate(model=model, messages=messages, **kwargs)
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    return _PrefetchedStream(first, stream, model)
+
+async def chat_completion(messages: list, model: str = "gpt-4o-mini", purpose: str = "reply", coalesce: bool = True, **kwargs):
+    """모든 ChatCompletion 호출이 거치는 공통 진입점 (예산 확인 + single-flight + hedging + 토큰/비용 기록)"""
+    # 진행 중인 요청에 합류하는 쪽도 예산 확인
+    usage_tracker.check_budget(usage_context.get().get("user_id"))
+    if (
+        coalesce
+        and not kwargs.get("stream")
+        and SINGLE_FLIGHT_CONFIG["enabled"]
+        and purpose not in SINGLE_FLIGHT_CONFIG["exclude_purposes"]
+    ):
+        # 완전히 같은 요청이 진행 중이면 그 결과를 공유 (스트리밍은 공유 불가)
+        key = request_key(model, messages, kwargs)
+        return await single_flight.do(
+            key, lambda: chat_completion(messages, model=model, purpose=purpose, coalesce=False, **kwargs)
         )
-        return response.choices[0].message.content.strip()
+    started = time.monotonic()
+    inflight_requests["count"] += 1
+    try:
+        if kwargs.get("stream"):
+            # 스트리밍 응답은 usage가 없으므로 호출한 쪽에서 추정치로 기록
+            response, _ = await hedged_caller.call(lambda m: _open_stream(m, messages, kwargs), model)
+            return response
+        response, model = await hedged_caller.call(
+            lambda m: openai.ChatCompletion.acreate(model=m, messages=messages, **kwargs), model,
+            # hedging에서 진 요청도 응답을 받았으면 토큰은 이미 쓴 것
+            on_discard=lambda discarded, m: _record_response_usage(discarded, messages, m, purpose, started)
+        )
+    finally:
+        inflight_requests["count"] -= 1
+    ratio = record_prompt_cache_usage(response)
+    _record_response_usage(response, messages, model, purpose, started)
+    for choice in response.choices:
+        record_response(messages, choice.message.content)
+    print(f"[OpenAI] {purpose} model={model}, {time.monotonic() - started:.2f}s, cached_ratio={ratio:.2f}")
+    return response
+
+# 언어 검사 통계 (재요청 횟수, 중단된 스트림에서 버려진 토큰)
+language_guard_stats = {
+    "requests": 0,
+    "retries": 0,
+    "aborted_streams": 0,
+    "wasted_tokens": 0,
+}
+
+async def generate_in_language(messages: list, language: str, model: str = "gpt-4o-mini", purpose: str = "reply", **kwargs) -> str:
+    """스트리밍으로 생성하면서 앞부분 언어를 검사하고, 다르면 즉시 중단 후 한 번 더 요청합니다."""
+    check_chars = LANGUAGE_GUARD_CONFIG["check_chars"]
+    max_attempts = LANGUAGE_GUARD_CONFIG["max_attempts"]
+    language_guard_stats["requests"] += 1
+    request_messages = list(messages)
+    text = ""
+    for attempt in range(max_attempts):
+        last_attempt = attempt == max_attempts - 1
+        text = ""
+        checked = False
+        aborted = False
+        started = time.monotonic()
+        stream = await chat_completion(request_messages, model=model, purpose=purpose, stream=True, **kwargs)
+        async for chunk in stream:
+            delta = chunk.choices[0].get("delta", {}) if chunk.choices else {}
+            text += delta.get("content") or ""
+            if not checked and not last_attempt and len(text) >= check_chars:
+                checked = True
+                if is_language_mismatch(text, language):
+                    aborted = True
+                    break
+        _record_usage(
+            getattr(stream, "model", model), purpose,
+            sum(count_message_tokens(m) for m in request_messages), count_tokens(text), 0, started
+        )
+        if aborted:
+            # 남은 스트림을 읽지 않고 연결을 닫음
+            close = getattr(stream, "aclose", None)
+            if close:
+                try:
+                    await close()
+                except Exception:
+                    pass
+            language_guard_stats["aborted_streams"] += 1
+        elif last_attempt or not is_language_mismatch(text, language):
+            record_response(request_messages, text)
+            return text.strip()
+        language_guard_stats["retries"] += 1
+        language_guard_stats["wasted_tokens"] += count_tokens(text)
+        print(f"[언어검사] 기대 언어 {language}와 다른 응답 감지, 재요청 (attempt {attempt + 1})")
+        request_messages = request_messages + [{
+            "role": "system",
+            "content": f"Your previous reply was in the wrong language. Reply ONLY in {language.upper()}."
+        }]
+    return text.strip()
+
+async def request_openai(prompt, model="gpt-4o", purpose="reply", max_tokens=150, temperature=0.7):
+    """단일 프롬프트 호출 (실패 시 예외를 그대로 올림)"""
+    response = await chat_completion(
+        [{"role": "user", "content": prompt}],
+        model=model,
+        purpose=purpose,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+    return response.choices[0].message.content.strip()
+
+async def call_openai(prompt, model="gpt-4o", purpose="reply", max_tokens=150, temperature=0.7):
+    try:
+        return await request_openai(prompt, model=model, purpose=purpose,
+                                    max_tokens=max_tokens, temperature=temperature)
     except Exception as e:
         print(f"[OpenAI Error] {e}")
         return "[score:0]"  # 기본값 반환
 
-async def analyze_emotion_with_gpt(message: str) -> int:
+async def analyze_emotion_with_gpt(message: str):
+    """GPT 감정 점수 (-1/0/+1). 호출 실패(예산 초과, 장애 등) 시 None"""
     prompt = (
         f"Classify the following user message as Positive (+1), Neutral (0), or Negative (-1):\n"
         f"User: \"{message}\"\n"
         "Reply ONLY with [score:+1], [score:0], or [score:-1]."
     )
-    ai_reply = await call_openai(prompt)
+    try:
+        ai_reply = await request_openai(prompt, purpose="emotion")
+    except Exception as e:
+        print(f"[OpenAI Error] {e}")
+        return None
     match = re.search(r"\[score:([+-]?\d+)\]", ai_reply)
     try:
         return int(match.group(1)) if match else 0
@@ -29,18 +238,48 @@ async def analyze_emotion_with_gpt(message: str) -> int:
         return 0
 
 def analyze_emotion_with_patterns(message: str) -> int:
-    positive_keywords = ["Praise", "Empathy", "Consideration", "Interest in character’s story or feelings", " Sharing own thoughts or concern", "Long-form replies", "Consultation", "Sharing"]
-    negative_keywords = ["Abusive", "Rude", "Unhealthy", "Inappropriate", "Dismissive", "Irritated""Too Short or Passive"]
-    if any(word in message for word in positive_keywords):
-        return 1
-    if any(word in message for word in negative_keywords):
-        return -1
-    if len(message.strip()) <= 5:
-        return 0
-    return 0
+    """다국어 감정 사전(Aho-Corasick) 매칭 점수"""
+    return local_scorer.lexicon_score(message)
 
 async def analyze_emotion_with_gpt_and_pattern(message: str) -> int:
+    # 0. 반복되는 짧은 메시지는 캐시된 점수 재사용
+    cached = emotion_cache.get(message)
+    if cached is not None:
+        return cached
+    # 1. 로컬 CPU 분석기로 먼저 판단 (신뢰도가 충분하면 GPT 호출 생략)
+    local = score_emotion_locally(message)
+    if is_confident(local):
+        emotion_cache.put(message, local.score)
+        return local.score
+    # 2. 애매한 경우에만 GPT로 폴백
     gpt_score = await analyze_emotion_with_gpt(message)
+    if gpt_score is None:
+        # 실패 시 로컬 점수로 대신하되 캐시하지 않음 (다음 메시지에서 다시 시도)
+        return local.score
     pattern_score = analyze_emotion_with_patterns(message)
     final_score = round(gpt_score * 0.7 + pattern_score * 0.3)
-    return final_score
\ No newline at end of file
+    emotion_cache.put(message, final_score)
+    return final_score
+
+async def summarize_conversation(previous_summary, messages: list, model: str = "gpt-4o-mini", max_tokens: int = 200):
+    """이전 요약과 잘려 나간 과거 대화를 합쳐 짧은 요약을 만듭니다. (실패 시 None — 요약 기준점을 옮기지 않도록)"""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = (
+        "Update the running summary of a conversation between a user and a character.\n"
+        f"Previous summary:\n{previous_summary or '(none)'}\n\n"
+        f"Older messages:\n{transcript}\n\n"
+        "Write a concise summary (under 120 words) keeping names, facts the user shared, promises and the emotional tone. "
+        "Reply with the summary only."
+    )
+    try:
+        response = await chat_completion(
+            [{"role": "user", "content": prompt}],
+            model=model,
+            purpose="summary",
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"[OpenAI Error] {e}")
+        return None
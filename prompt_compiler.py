@@ -0,0 +1,52 @@
+# prompt_compiler.py
+from functools import lru_cache
+
+from config import (
+    CHARACTER_AFFINITY_SPEECH,
+    SUPPORTED_LANGUAGES,
+    SELECTOR_KAGARI_PROMPT,
+    SELECTOR_SILVER_RULE,
+    get_combined_prompt
+)
+
+# 정적 프리픽스는 (캐릭터, 레벨, 언어)마다 한 번만 만들고 그대로 재사용합니다.
+# 유저 이름 같은 가변 값은 프리픽스 뒤의 별도 system 메시지로 붙여야
+# OpenAI 프롬프트 캐시(동일 프리픽스 재사용)가 적중합니다.
+
+
+@lru_cache(maxsize=None)
+def compile_character_prefix(character_name: str, level: str, language: str = None) -> str:
+    """캐릭터 페르소나 + 레벨별 말투 + 언어 지시로 구성된 불변 시스템 프롬프트"""
+    parts = [get_combined_prompt(character_name).strip()]
+    speech = CHARACTER_AFFINITY_SPEECH.get(character_name, {}).get(level)
+    if speech:
+        parts.append(f"IMPORTANT: Your tone must be as follows: {speech['tone']}")
+    lang_settings = SUPPORTED_LANGUAGES.get(language)
+    if lang_settings:
+        parts.append(f"CRITICAL LANGUAGE INSTRUCTION: {lang_settings['system_prompt']}")
+    return "\n".join(parts)
+
+
+@lru_cache(maxsize=None)
+def compile_selector_prefix(grade: str, language: str = None) -> str:
+    """BotSelector 대화용 Kagari 프롬프트 (Silver 이상이면 긴 답변 규칙 추가)"""
+    prompt = SELECTOR_KAGARI_PROMPT
+    if grade in ["Silver", "Gold"]:
+        prompt += SELECTOR_SILVER_RULE
+    lang_settings = SUPPORTED_LANGUAGES.get(language)
+    if lang_settings:
+        prompt += f"\nCRITICAL LANGUAGE INSTRUCTION: {lang_settings['system_prompt']}"
+    return prompt
+
+
+def build_system_messages(prefix: str, user_name: str = None, extra: str = None) -> list:
+    """[정적 프리픽스, 유저별 변수] 순서의 system 메시지 목록"""
+    messages = [{"role": "system", "content": prefix}]
+    variables = []
+    if user_name:
+        variables.append(f"IMPORTANT: When you talk, use the user's name ({user_name}) naturally and refer to the previous conversation.")
+    if extra:
+        variables.append(extra)
+    if variables:
+        messages.append({"role": "system", "content": "\n".join(variables)})
+    return messages
@@ -1,15 +1,13 @@
 import os
 from dotenv import load_dotenv
 import asyncio
-from bot_selector import BotSelector
+import time
+from bot_selector import BotSelector, get_levelup_embed
 from character_bot import CharacterBot
 import discord
 from discord.ext import commands
-import openai
 from discord import app_commands
 from typing import Dict, Any
-from datetime import datetime
-import langdetect
 import psycopg2
 from config import (
     CHARACTER_PROMPTS, 
@@ -18,15 +16,29 @@ from config import (
     CHARACTER_IMAGES,
     CHARACTER_AFFINITY_SPEECH,
     AFFINITY_LEVELS,
-    get_combined_prompt
+    CONTEXT_BUDGET_CONFIG,
+    LONG_TERM_MEMORY_CONFIG
 )
 from distutils import core
-from database_manager import DATABASE_URL
-from openai_manager import analyze_emotion_with_gpt_and_pattern
+from database_manager import DATABASE_URL, apply_affinity_delta
+from affinity_rules import decayed_score, decayed_score_sql
+from openai_manager import summarize_conversation, chat_completion
+from prompt_compiler import compile_character_prefix, build_system_messages
+from context_builder import ContextBuilder, count_tokens
+from usage_tracker import set_usage_context, set_route_context
+from model_router import route_request, RouteDecision
+from semantic_cache import semantic_cache
+from long_term_memory import long_term_memory, format_memory
+from history_buffer import channel_history
+from emotion_queue import EmotionJobQueue
+from affinity_buffer import affinity_buffer
+from language_detector import detect_language_async, detect_message_language, to_channel_language
 
 # Load environment variables
 load_dotenv()
 
+AI_ERROR_RESPONSE = "Sorry, an error occurred while generating a response."
+
 # Get bot tokens from environment variables
 SELECTOR_TOKEN = os.getenv('SELECTOR_TOKEN')
 KAGARI_TOKEN = os.getenv('KAGARI_TOKEN')
@@ -92,6 +104,9 @@ class CharacterBot(commands.Bot):
         self.user_affinity_levels = {}
         self.last_message_time = {}
         self.chat_timers = {}
+        self.context_builder = ContextBuilder(summarizer=summarize_conversation, history_loader=self.db.get_messages_between)
+        # 감정 분석은 답변과 별도로 백그라운드 큐에서 처리
+        self.emotion_queue = EmotionJobQueue(character_name, on_applied=self.on_emotion_applied)
 
         # 프롬프트 설정
         base_prompt = CHARACTER_PROMPTS.get(character_name, "")
@@ -101,6 +116,7 @@ class CharacterBot(commands.Bot):
     async def setup_hook(self):
         """봇 초기화 시 호출되는 메소드"""
         print(f"{self.character_name} bot is initializing...")
+        self.emotion_queue.start()
         try:
             await self.tree.sync()
             print(f"{self.character_name} bot commands synced!")
@@ -211,6 +227,13 @@ class CharacterBot(commands.Bot):
             print(f"Error in add_channel: {e}")
             return False, "Channel activation error."
 
+    def remove_channel(self, channel_id: int):
+        """채널 비활성화 (/close): 채널별 대화 요약과 최근 대화 버퍼도 함께 정리"""
+        self.active_channels.pop(channel_id, None)
+        self.message_history.pop(channel_id, None)
+        self.context_builder.reset_channel(channel_id)
+        channel_history.discard(channel_id)
+
     def get_intimacy_prompt(self, intimacy_level: int) -> str:
         """친밀도 레벨에 따른 프롬프트 생성"""
         try:
@@ -231,21 +254,22 @@ class CharacterBot(commands.Bot):
             print(f"Error in get_intimacy_prompt: {e}")
             return self.prompt
 
-    async def get_ai_response(self, messages: list) -> str:
+    async def get_ai_response(self, messages: list, route: RouteDecision = None) -> str:
         """OpenAI API를 통한 응답 생성"""
+        route = route or route_request()
         try:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
+            response = await chat_completion(
+                messages,
+                model=route.model,
+                temperature=route.temperature,
+                max_tokens=route.max_tokens,
                 presence_penalty=0.6,
                 frequency_penalty=0.3
             )
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error in AI response generation: {e}")
-            return "Sorry, an error occurred while generating a response."
+            return AI_ERROR_RESPONSE
 
     async def send_response_with_intimacy(self, message, response: str, intimacy_level: int):
         """친밀도 레벨에 따른 응답 전송"""
@@ -280,87 +304,90 @@ class CharacterBot(commands.Bot):
             # 메시지 처리
             channel_id = message.channel.id
             user_id = message.author.id
+            set_usage_context(user_id, self.character_name, channel_id)
+            language = await detect_language_async(message.content)
 
-            # 대화 기록 저장
+            # 대화 기록 저장 (감지한 언어도 함께 저장)
             self.db.add_message(
                 channel_id=channel_id,
                 user_id=user_id,
                 character_name=self.character_name,
                 role="user",
-                content=message.content
-            )
-
-            # 감정 점수 분석
-            score_change = await analyze_emotion_with_gpt_and_pattern(message.content)
-            if score_change is None:
-                score_change = 0
-            self.db.update_affinity(
-                user_id,
-                self.character_name,
-                message.content,
-                str(datetime.now()),
-                score_change
+                content=message.content,
+                language=language
             )
 
-            # AI 응답 생성
-            messages = []
+            # 감정 점수 분석/친밀도 반영은 백그라운드 큐에서 (답변 지연시간에 포함되지 않음)
+            await self.emotion_queue.enqueue(message.id, user_id, channel_id, message.content)
 
-            # emotion_score로 레벨 판별
+            # emotion_score로 레벨 판별 (이 메시지의 점수는 큐 처리 후 반영)
             affinity_info = self.db.get_affinity(user_id, self.character_name)
             emotion_score = affinity_info['emotion_score']
             level = self.get_affinity_grade(emotion_score)
-            tone = self.character_styles[level]["tone"]
 
+            # 짧은 인사/잡담은 의미 기반 캐시에서 답변 변형 재사용
+            cached_response = semantic_cache.lookup(self.character_name, level, language, message.content)
+            if cached_response:
+                await self.send_response_with_intimacy(message, cached_response, emotion_score)
+                return
+
+            # 정적 프리픽스(캐릭터/레벨) 뒤에 유저별 변수를 붙여 프롬프트 캐시 적중률 유지
+            prefix = compile_character_prefix(self.character_name, level)
+            system_messages = build_system_messages(prefix, user_name=message.author.display_name)
+
+            # 토큰 예산 안에서 최근 대화 + 채널 요약으로 맥락 구성
+            recent_messages = []
             if level in ["Gold", "Silver", "Iron"]:
                 recent_messages = self.db.get_recent_messages(
-                    channel_id=message.channel.id,
-                    limit=30,
-                    user_id=message.author.id
+                    channel_id=channel_id,
+                    limit=CONTEXT_BUDGET_CONFIG["history_fetch_limit"],
+                    user_id=user_id,
+                    with_ids=True
                 )
+            # 최근 대화 밖의 오래된 대화 중 관련 있는 턴을 장기 기억에서 검색
+            memories = []
+            if level in LONG_TERM_MEMORY_CONFIG["levels"]:
+                records = await long_term_memory.recall(user_id, self.character_name, message.content)
+                memories = [format_memory(record) for record in records]
+            messages = self.context_builder.build(
+                channel_id, system_messages, recent_messages, message.content, memories=memories
+            )
 
-                user_name = message.author.display_name
-                character_name = self.character_name
-
-                combined_prompt = get_combined_prompt(character_name)
-
-                context_message = {
-                    "role": "system",
-                    "content": (
-                        f"{combined_prompt}\n"
-                        f"IMPORTANT: When you talk, use the user's name ({user_name}) naturally and refer to the previous conversation.\n"
-                        f"IMPORTANT: Your tone must be as follows: {tone}"
-                    )
-                }
-                messages.append(context_message)
-                messages.extend(recent_messages)
-            else:
-                user_name = message.author.display_name
-                character_name = self.character_name
-
-                combined_prompt = get_combined_prompt(character_name)
-
-                context_message = {
-                    "role": "system",
-                    "content": (
-                        f"{combined_prompt}\n"
-                        f"IMPORTANT: When you talk, use the user's name ({user_name}) naturally and refer to the previous conversation.\n"
-                        f"IMPORTANT: Your tone must be as follows: {tone}"
-                    )
-                }
-                messages.append(context_message)
-
-            # 현재 메시지 추가
-            current_message = {"role": "user", "content": message.content}
-            messages.append(current_message)
+            # 등급/메시지 길이/부하에 따라 모델과 max_tokens 결정
+            route = route_request(level, "chat", len(message.content))
+            set_route_context(route.label)
 
             # 응답 생성 및 전송
-            response = await self.get_ai_response(messages)
+            started = time.monotonic()
+            response = await self.get_ai_response(messages, route)
+            # 유저 이름이 들어간 답변은 다른 유저에게 재사용하지 않음
+            if response != AI_ERROR_RESPONSE and message.author.display_name.lower() not in response.lower():
+                semantic_cache.store(
+                    self.character_name, level, language, message.content, response, time.monotonic() - started
+                )
+            if response != AI_ERROR_RESPONSE:
+                long_term_memory.remember(user_id, self.character_name, message.content, response)
             await self.send_response_with_intimacy(message, response, emotion_score)
 
         except Exception as e:
             print(f"Error in message processing: {e}")
             await message.channel.send("Sorry, an error occurred.")
 
+    async def on_emotion_applied(self, job: dict, transition):
+        """감정 분석 작업이 반영된 뒤 레벨업/마일스톤 임베드를 보냅니다."""
+        channel = self.get_channel(job["channel_id"])
+        if channel is None:
+            return
+        if transition.leveled_up:
+            await channel.send(embed=get_levelup_embed(transition.new_grade))
+        for milestone in transition.milestones:
+            embed = discord.Embed(
+                title="🎉 Milestone Reached!",
+                description=f"You reached {milestone} affinity!",
+                color=discord.Color.gold()
+            )
+            await channel.send(embed=embed)
+
     def get_affinity_grade(self, emotion_score):
         if emotion_score >= AFFINITY_LEVELS["Gold"]:
             return "Gold"
@@ -403,7 +430,8 @@ class DatabaseManager:
                     message_role TEXT,
                     content TEXT,
                     language TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    token_count INTEGER
                 )
             ''')
             cursor.execute('''
@@ -438,8 +466,9 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
-    def add_message(self, channel_id: int, user_id: int, character_name: str, role: str, content: str):
-        """새로운 메시지를 데이터베이스에 추가합니다."""
+    def add_message(self, channel_id: int, user_id: int, character_name: str, role: str, content: str, language: str = None):
+        """새로운 메시지를 데이터베이스에 추가합니다. (언어는 저장 시점에 한 번 감지, 채널 언어 코드로 기록)"""
+        language = to_channel_language(language) if language else detect_message_language(content)
         conn = None
         try:
             conn = self.get_connection()
@@ -448,10 +477,13 @@ class DatabaseManager:
 
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO conversations (channel_id, user_id, character_name, message_role, content)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (channel_id, user_id, character_name, role, content))
+                INSERT INTO conversations (channel_id, user_id, character_name, message_role, content, language, token_count)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (channel_id, user_id, character_name, role, content, language, count_tokens(content)))
+            message_id = cursor.fetchone()[0]
             conn.commit()
+            channel_history.append(channel_id, role, content, user_id, language, message_id)
         except Exception as e:
             print(f"메시지 추가 오류: {e}")
             if conn:
@@ -460,8 +492,44 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
-    def get_recent_messages(self, channel_id: int, limit: int = 10, user_id: int = None):
-        """최근 메시지를 조회합니다."""
+    def load_channel_history(self, channel_id: int, limit: int):
+        """링 버퍼 초기화용: 채널의 최근 limit개 메시지 (오래된 순, 실패 시 None)"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            if not conn:
+                return None
+
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, message_role, content, user_id, language
+                FROM conversations
+                WHERE channel_id = %s
+                ORDER BY timestamp DESC
+                LIMIT %s
+            ''', (channel_id, limit))
+            return [
+                {"role": role, "content": content, "user_id": user_id, "language": language, "id": message_id}
+                for message_id, role, content, user_id, language in reversed(cursor.fetchall())
+            ]
+        except Exception as e:
+            print(f"채널 기록 로드 오류: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def get_recent_messages(self, channel_id: int, limit: int = 10, user_id: int = None, language: str = None,
+                            with_ids: bool = False):
+        """최근 메시지를 조회합니다. (메모리 링 버퍼 우선, 부족하면 user_id/language 조건으로 DB 조회)
+
+        with_ids면 각 메시지에 conversations.id를 "id"로 포함 (맥락 요약 기준점용)
+        """
+        cached = channel_history.recent(
+            channel_id, limit, self.load_channel_history, user_id=user_id, language=language, with_ids=with_ids
+        )
+        if cached is not None:
+            return cached
         conn = None
         try:
             conn = self.get_connection()
@@ -469,24 +537,52 @@ class DatabaseManager:
                 return []
 
             cursor = conn.cursor()
+            conditions = ["channel_id = %s"]
+            params = [channel_id]
             if user_id is not None:
-                cursor.execute('''
-                    SELECT message_role, content 
-                    FROM conversations 
-                    WHERE channel_id = %s AND user_id = %s
-                    ORDER BY timestamp DESC
-                    LIMIT %s
-                ''', (channel_id, user_id, limit))
-            else:
-                cursor.execute('''
-                    SELECT message_role, content 
-                    FROM conversations 
-                    WHERE channel_id = %s
-                    ORDER BY timestamp DESC
-                    LIMIT %s
-                ''', (channel_id, limit))
+                conditions.append("user_id = %s")
+                params.append(user_id)
+            if language is not None:
+                conditions.append("language = %s")
+                params.append(language)
+            cursor.execute(f'''
+                SELECT id, message_role, content 
+                FROM conversations 
+                WHERE {" AND ".join(conditions)}
+                ORDER BY timestamp DESC
+                LIMIT %s
+            ''', (*params, limit))
             messages = cursor.fetchall()
-            return [{"role": role, "content": content} for role, content in reversed(messages)]
+            if with_ids:
+                return [{"role": role, "content": content, "id": message_id} for message_id, role, content in reversed(messages)]
+            return [{"role": role, "content": content} for _, role, content in reversed(messages)]
+        except Exception as e:
+            print(f"메시지 조회 오류: {e}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+
+    def get_messages_between(self, channel_id: int, after_id: int, before_id: int, limit: int):
+        """after_id < id < before_id인 채널 메시지 중 최근 limit개 (오래된 순, 맥락 요약용)"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            if not conn:
+                return []
+
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, message_role, content
+                FROM conversations
+                WHERE channel_id = %s AND id > %s AND id < %s
+                ORDER BY id DESC
+                LIMIT %s
+            ''', (channel_id, after_id, before_id, limit))
+            return [
+                {"role": role, "content": content, "id": message_id}
+                for message_id, role, content in reversed(cursor.fetchall())
+            ]
         except Exception as e:
             print(f"메시지 조회 오류: {e}")
             return []
@@ -518,7 +614,7 @@ class DatabaseManager:
             ''', (user_id, character_name))
 
             cursor.execute('''
-                SELECT emotion_score, daily_message_count
+                SELECT emotion_score, daily_message_count, last_message_time
                 FROM affinity
                 WHERE user_id = %s AND character_name = %s
             ''', (user_id, character_name))
@@ -526,9 +622,11 @@ class DatabaseManager:
             result = cursor.fetchone()
             conn.commit()
 
+            # 경과 시간만큼 감소를 적용하고, 버퍼에서 아직 기록되지 않은 변경을 더함
+            pending_score, pending_count = affinity_buffer.pending(user_id, character_name)
             return {
-                'emotion_score': result[0] if result else 0,
-                'daily_count': result[1] if result else 0
+                'emotion_score': (decayed_score(result[0], result[2], character_name) if result else 0) + pending_score,
+                'daily_count': (result[1] if result else 0) + pending_count
             }
         except Exception as e:
             print(f"친밀도 조회 오류: {e}")
@@ -541,33 +639,24 @@ class DatabaseManager:
 
     def update_affinity(self, user_id: int, character_name: str, 
                        last_message: str, last_message_time: str, score_change: int):
-        """친밀도 정보를 업데이트합니다."""
+        """친밀도 정보를 업데이트합니다. (AffinityTransition 반환, 실패 시 None)"""
         conn = None
         try:
             conn = self.get_connection()
             if not conn:
-                return
+                return None
 
             cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE affinity
-                SET emotion_score = emotion_score + %s,
-                    daily_message_count = daily_message_count + 1,
-                    last_message_content = %s,
-                    last_message_time = %s
-                WHERE user_id = %s AND character_name = %s
-            ''', (score_change, last_message, last_message_time, user_id, character_name))
-
-            if cursor.rowcount == 0:
-                cursor.execute('''
-                    INSERT INTO affinity (user_id, character_name, emotion_score, daily_message_count, last_message_content, last_message_time)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                ''', (user_id, character_name, score_change, 1, last_message, last_message_time))
+            transition = apply_affinity_delta(
+                cursor, user_id, character_name, score_change, last_message, last_message_time
+            )
             conn.commit()
+            return transition
         except Exception as e:
             print(f"친밀도 업데이트 오류: {e}")
             if conn:
                 conn.rollback()
+            return None
         finally:
             if conn:
                 conn.close()
@@ -581,11 +670,11 @@ class DatabaseManager:
                 return []
 
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_id, SUM(emotion_score) as total_score
+            cursor.execute(f'''
+                SELECT user_id, SUM({decayed_score_sql()}) as total_score
                 FROM affinity
                 GROUP BY user_id
-                HAVING total_score > 0
+                HAVING SUM({decayed_score_sql()}) > 0
                 ORDER BY total_score DESC
                 LIMIT 10
             ''')
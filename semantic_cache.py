@@ -0,0 +1,122 @@
+# semantic_cache.py
+import time
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_CONFIG, EMBEDDING_CONFIG
+from text_embedding import embed_text
+
+
+class _KeyIndex:
+    """(캐릭터, 레벨, 언어) 하나에 대한 임베딩 행렬 + 답변 변형 목록"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.entries = [None] * capacity  # {"message", "replies", "created", "next"}
+        self.size = 0
+        self.cursor = 0  # 가득 차면 가장 오래된 슬롯부터 덮어씀
+
+    def nearest(self, vector: np.ndarray):
+        if self.size == 0:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        idx = int(np.argmax(scores))
+        return idx, float(scores[idx])
+
+    def add(self, vector: np.ndarray, entry: dict) -> int:
+        slot = self.cursor
+        self.vectors[slot] = vector
+        self.entries[slot] = entry
+        self.cursor = (self.cursor + 1) % len(self.entries)
+        self.size = max(self.size, slot + 1)
+        return slot
+
+
+class SemanticResponseCache:
+    """비슷한 짧은 메시지에 대해 이전에 생성한 답변 변형을 돌려가며 재사용합니다."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(SEMANTIC_CACHE_CONFIG, **(settings or {}))
+        self.indexes = {}  # (character, level, language): _KeyIndex
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "stores": 0,
+            "saved_seconds": 0.0,
+        }
+        self._generation_latency = None  # 응답 생성 지연시간 이동 평균
+
+    def eligible(self, level: str, message: str) -> bool:
+        return (
+            self.settings["enabled"]
+            and level in self.settings["levels"]
+            and 0 < len(message.strip()) <= self.settings["max_message_chars"]
+        )
+
+    def _index(self, key: tuple) -> _KeyIndex:
+        index = self.indexes.get(key)
+        if index is None:
+            index = _KeyIndex(EMBEDDING_CONFIG["dim"], self.settings["max_entries_per_key"])
+            self.indexes[key] = index
+        return index
+
+    def lookup(self, character_name: str, level: str, language: str, message: str):
+        """캐시된 답변을 반환하거나, 없으면 None"""
+        if not self.eligible(level, message):
+            return None
+        self.stats["lookups"] += 1
+        index = self.indexes.get((character_name, level, language))
+        if index is None:
+            return None
+        idx, score = index.nearest(embed_text(message))
+        if idx is None or score < self.settings["similarity_threshold"]:
+            return None
+        entry = index.entries[idx]
+        if time.time() - entry["created"] > self.settings["ttl_seconds"]:
+            return None
+        replies = entry["replies"]
+        if len(replies) < self.settings["min_variants_to_serve"]:
+            return None
+        # 변형을 순서대로 돌려 같은 답이 연속으로 나오지 않게 함
+        reply = replies[entry["next"] % len(replies)]
+        entry["next"] += 1
+        self.stats["hits"] += 1
+        if self._generation_latency:
+            self.stats["saved_seconds"] += self._generation_latency
+        return reply
+
+    def store(self, character_name: str, level: str, language: str, message: str, reply: str, latency: float = None):
+        if latency is not None:
+            self._generation_latency = latency if self._generation_latency is None else (
+                0.9 * self._generation_latency + 0.1 * latency
+            )
+        if not reply or not self.eligible(level, message):
+            return
+        index = self._index((character_name, level, language))
+        vector = embed_text(message)
+        idx, score = index.nearest(vector)
+        now = time.time()
+        if idx is not None and score >= self.settings["similarity_threshold"]:
+            entry = index.entries[idx]
+            if now - entry["created"] > self.settings["ttl_seconds"]:
+                # 만료된 항목은 새 답변으로 다시 시작
+                entry.update(replies=[], created=now, next=0)
+            if reply not in entry["replies"]:
+                entry["replies"].append(reply)
+                if len(entry["replies"]) > self.settings["max_variants"]:
+                    entry["replies"].pop(0)
+        else:
+            index.add(vector, {"message": message, "replies": [reply], "created": now, "next": 0})
+        self.stats["stores"] += 1
+
+    def report(self) -> dict:
+        lookups = self.stats["lookups"]
+        return dict(
+            self.stats,
+            hit_rate=self.stats["hits"] / lookups if lookups else 0.0,
+            keys=len(self.indexes),
+            entries=sum(index.size for index in self.indexes.values()),
+        )
+
+
+semantic_cache = SemanticResponseCache()
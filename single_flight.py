@@ -0,0 +1,36 @@
+# single_flight.py
+import asyncio
+import hashlib
+import json
+
+
+def request_key(*parts) -> str:
+    """요청 내용(모델, 메시지, 파라미터)으로 만든 안정적인 해시 키"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """같은 키의 요청이 진행 중이면 새로 보내지 않고 진행 중인 결과를 함께 기다립니다."""
+
+    def __init__(self):
+        self._inflight = {}  # key: asyncio.Task
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            # 기다리던 쪽이 취소되어도 리더 요청은 계속 진행
+            return await asyncio.shield(task)
+        self.stats["leaders"] += 1
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+single_flight = SingleFlight()
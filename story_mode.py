@@ -2,9 +2,12 @@ import random
 import logging
 import discord
 from config import STORY_CHAPTERS, STORY_CARD_REWARD
-import re
 from database_manager import DatabaseManager
-from openai_manager import call_openai  
+from openai_manager import call_openai, analyze_emotion_with_gpt
+from emotion_scorer import score_emotion_locally, is_confident
+from emotion_cache import story_emotion_cache
+from usage_tracker import set_usage_context, set_route_context
+from model_router import route_request
 
 # story_mode_states가 외부에서 관리된다면 import로 대체
 story_mode_states = {}
@@ -56,7 +59,11 @@ async def handle_kagari_conversation(message: str, user_id: int, user_name: str)
         f"User message: {message}\n"
         "Respond as Kagari in English, with a calm, emotionally delicate, and slightly bashful tone."
     )
-    kagari_response = await call_openai(prompt)
+    route = route_request(mode="story", message_length=len(message))
+    set_route_context(route.label)
+    kagari_response = await call_openai(
+        prompt, model=route.model, purpose="story", max_tokens=route.max_tokens, temperature=route.temperature
+    )
     return kagari_response
 
 async def handle_eros_conversation(message: str, user_id: int, user_name: str, turn: int) -> str:
@@ -111,7 +118,11 @@ async def handle_eros_conversation(message: str, user_id: int, user_name: str, t
                 "If all clues are given, encourage the user to guess the culprit or ask new questions. "
                 "Always keep the conversation natural and avoid repeating yourself."
             )
-            return await call_openai(prompt)
+            route = route_request(mode="story", message_length=len(message))
+            set_route_context(route.label)
+            return await call_openai(
+                prompt, model=route.model, purpose="story", max_tokens=route.max_tokens, temperature=route.temperature
+            )
         else:
             return (
                 "I've already told you all the clues I found... Maybe you can guess who the culprit is? (hopeful eyes)"
@@ -131,7 +142,11 @@ async def handle_eros_conversation(message: str, user_id: int, user_name: str, t
             "Encourage the user to guess the culprit. You may offer to repeat clues briefly or hint again in a playful way. "
             "You're feeling a mix of hope, nervous excitement, and deep curiosity toward the user. "
         )
-        return await call_openai(prompt)
+        route = route_request(mode="story", message_length=len(message))
+        set_route_context(route.label)
+        return await call_openai(
+            prompt, model=route.model, purpose="story", max_tokens=route.max_tokens, temperature=route.temperature
+        )
     # 20턴: 최종 선택지
     elif turn >= 20:
         return None
@@ -156,20 +171,27 @@ def start_story(user_id, character_name, chapter_number):
     db.start_story(user_id, character_name, chapter_number)
 
 async def classify_emotion(user_message, user_id=None, character_name=None):
-    prompt = (
-        f"Classify the following user message as Positive (+1), Neutral (0), or Negative (-1):\n"
-        f"User: \"{user_message}\"\n"
-        "Reply ONLY with [score:+1], [score:0], or [score:-1]."
-    )
-    ai_reply = await call_openai(prompt)
-    match = re.search(r"\[score:([+-]?\d+)\]", ai_reply)
-    score = int(match.group(1)) if match else 0
+    if user_id is not None:
+        set_usage_context(user_id, character_name)
+    score = story_emotion_cache.get(user_message)
+    local = score_emotion_locally(user_message) if score is None else None
+    if local is not None and is_confident(local):
+        score = local.score
+        story_emotion_cache.put(user_message, score)
+    elif local is not None:
+        score = await analyze_emotion_with_gpt(user_message)
+        if score is None:
+            # GPT 실패 시 로컬 점수 사용, 캐시하지 않음
+            score = local.score
+        else:
+            story_emotion_cache.put(user_message, score)
     print(f"[감정분류] 유저 메시지: {user_message} → 점수: {score}")
     if user_id is not None and character_name is not None:
         db.log_emotion_score(user_id, character_name, score, user_message)
     return score
 
 async def on_user_message(user_id, user_message, channel, character_name, user_name):
+    set_usage_context(user_id, character_name, channel.id)
     # 1. 세션이 없으면 스토리 시작(INSERT)
     if user_id not in story_sessions:
         chapter_number = 1  # (혹은 config에서 읽기)
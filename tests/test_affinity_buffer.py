@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from affinity_buffer import AffinityDeltaBuffer
+from affinity_rules import make_transition
+
+
+class FakeBuffer(AffinityDeltaBuffer):
+    """DB 대신 쌓인 변경을 그대로 점수로 돌려주는 버퍼"""
+
+    def __init__(self, **settings):
+        super().__init__(dict({"flush_interval_ms": 10}, **settings))
+        self.flush_threads = []
+
+    def flush_now(self) -> list:
+        self.flush_threads.append(threading.get_ident())
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return [(key, entry[4], make_transition(0, entry[0])) for key, entry in batch.items()]
+
+
+def listen(buffer):
+    received = []
+
+    async def on_transition(user_id, character_name, channel_id, transition):
+        received.append((user_id, character_name, channel_id, transition.new_score))
+
+    buffer.subscribe(on_transition)
+    return received
+
+
+def test_add_in_loop_starts_flush_loop_and_delivers_transitions():
+    buffer = FakeBuffer()
+    received = listen(buffer)
+
+    async def main():
+        buffer.add(1, "Kagari", 3, channel_id=10)
+        assert buffer.flush_threads == []  # 이벤트 루프에서 바로 기록하지 않음
+        await asyncio.sleep(0.05)
+        await buffer.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert received == [(1, "Kagari", 10, 3)]
+    assert loop_thread not in buffer.flush_threads
+
+
+def test_disabled_buffer_flushes_in_executor_and_delivers():
+    buffer = FakeBuffer(enabled=False)
+    received = listen(buffer)
+
+    async def main():
+        buffer.add(1, "Kagari", -2, channel_id=10)
+        await buffer.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert received == [(1, "Kagari", 10, -2)]
+    assert loop_thread not in buffer.flush_threads
+
+
+def test_add_outside_loop_returns_transitions():
+    buffer = FakeBuffer()
+    results = buffer.add(1, "Kagari", 5, channel_id=10)
+    assert [(key, channel_id, transition.new_score) for key, channel_id, transition in results] == [
+        ((1, "Kagari"), 10, 5)
+    ]
+
+
+def test_stop_keeps_shared_loop_running_for_other_bots():
+    buffer = FakeBuffer()
+    received = listen(buffer)
+
+    async def main():
+        buffer.start()
+        buffer.start()
+        await buffer.stop()
+        still_running = buffer._task is not None and not buffer._task.done()
+        buffer.add(2, "Eros", 1, channel_id=20)
+        await asyncio.sleep(0.05)
+        await buffer.stop()
+        return still_running, buffer._task
+
+    still_running, task = asyncio.run(main())
+    assert still_running
+    assert task is None
+    assert received == [(2, "Eros", 20, 1)]
+
+
+def test_discard_drops_pending_delta_for_one_key():
+    buffer = FakeBuffer()
+    with buffer._lock:
+        buffer._pending = {(1, "Kagari"): [4, 2, None, None, 10], (2, "Kagari"): [1, 1, None, None, 20]}
+    buffer.discard(1, "Kagari")
+    assert buffer.pending(1, "Kagari") == (0, 0)
+    assert buffer.pending(2, "Kagari") == (1, 1)
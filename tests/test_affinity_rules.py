@@ -0,0 +1,26 @@
+from affinity_rules import MILESTONES, decayed_score_sql, make_transition
+from config import AFFINITY_DECAY_CONFIG, AFFINITY_MILESTONE_CONFIG
+
+
+def test_every_card_range_has_a_milestone_for_each_card():
+    for start, stop, prefix in AFFINITY_MILESTONE_CONFIG["card_ranges"]:
+        expected = {f"{prefix}{i}" for i in range(1, (stop - start) // 10 + 2)}
+        reachable = {card_id for card_id in MILESTONES.card_ids if card_id and card_id.startswith(prefix)}
+        assert reachable == expected, prefix
+
+
+def test_each_multiple_of_ten_up_to_cards_is_a_milestone():
+    for score in range(10, 241, 10):
+        assert make_transition(score - 1, score).milestones == (score,)
+
+
+def test_jump_returns_every_milestone_crossed():
+    rewards = make_transition(0, 35).rewards
+    assert rewards == ((10, "C1"), (20, "C2"), (30, "C3"))
+
+
+def test_decay_sql_can_stop_at_the_new_message_time(monkeypatch):
+    monkeypatch.setitem(AFFINITY_DECAY_CONFIG, "enabled", True)
+    sql = decayed_score_sql("a.emotion_score", "a.last_message_time", "a.character_name", now="v.last_message_time")
+    assert "(v.last_message_time - a.last_message_time)" in sql
+    assert "LOCALTIMESTAMP" not in sql
@@ -0,0 +1,115 @@
+import asyncio
+
+from context_builder import ContextBuilder
+
+
+def make_history(start: int, end: int) -> list:
+    return [{"role": "user", "content": f"message number {i} " * 5, "id": i} for i in range(start, end)]
+
+
+def make_builder(summarized: list):
+    async def summarizer(previous, messages, model, max_tokens):
+        summarized.append([m["id"] for m in messages])
+        return f"summary up to {messages[-1]['id']}"
+
+    # 최근 2개 정도만 예산에 들어가도록 작게 설정
+    return ContextBuilder(summarizer, {"max_prompt_tokens": 80, "memory_max_tokens": 0, "summary_every_turns": 3})
+
+
+def test_dropped_messages_are_summarized_once():
+    summarized = []
+    builder = make_builder(summarized)
+
+    async def main():
+        for end in range(2, 12):
+            # 창이 밀려도 이미 요약한 메시지는 다시 넘기지 않음
+            history = make_history(max(1, end - 8), end)
+            builder.build(1, "system", history, "hi")
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    flattened = [message_id for batch in summarized for message_id in batch]
+    assert flattened
+    assert len(flattened) == len(set(flattened))
+    assert flattened == sorted(flattened)
+    assert builder.summarized_until[1] == flattened[-1]
+
+
+def test_nothing_dropped_does_not_schedule_summary():
+    summarized = []
+    builder = make_builder(summarized)
+
+    async def main():
+        for _ in range(10):
+            builder.build(1, "system", make_history(1, 2), "hi")
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert summarized == []
+    assert 1 not in builder.summarized_until
+
+
+def test_kept_messages_are_sent_without_ids():
+    builder = make_builder([])
+    messages = builder.build(1, "system", make_history(1, 3), "hi")
+    assert all(set(m) == {"role", "content"} for m in messages)
+
+
+def test_reset_channel_clears_summary_state():
+    summarized = []
+    builder = make_builder(summarized)
+
+    async def main():
+        builder.build(1, "system", make_history(1, 10), "hi")
+        await asyncio.sleep(0)
+        builder.reset_channel(1)
+
+    asyncio.run(main())
+    assert summarized
+    assert 1 not in builder.summaries
+    assert 1 not in builder.summarized_until
+
+
+def test_failed_summary_keeps_the_watermark():
+    async def summarizer(previous, messages, model, max_tokens):
+        return None
+
+    builder = ContextBuilder(summarizer, {"max_prompt_tokens": 80, "memory_max_tokens": 0, "summary_every_turns": 3})
+
+    async def main():
+        builder.build(1, "system", make_history(1, 10), "hi")
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert 1 not in builder.summarized_until
+    assert 1 not in builder.summaries
+
+
+def test_messages_that_left_the_fetch_window_are_summarized():
+    summarized = []
+    loaded = []
+
+    async def summarizer(previous, messages, model, max_tokens):
+        summarized.append([m["id"] for m in messages])
+        return f"summary up to {messages[-1]['id']}"
+
+    def history_loader(channel_id, after_id, before_id, limit):
+        loaded.append((after_id, before_id))
+        return make_history(after_id + 1, before_id)
+
+    builder = ContextBuilder(
+        summarizer, {"max_prompt_tokens": 80, "memory_max_tokens": 0, "summary_every_turns": 3},
+        history_loader=history_loader
+    )
+
+    async def main():
+        builder.build(1, "system", make_history(1, 10), "hi")
+        await asyncio.sleep(0.01)
+        # 다음 요약 전에 11~19가 조회 창 밖으로 밀려남
+        builder.build(1, "system", make_history(20, 30), "hi")
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    flattened = [message_id for batch in summarized for message_id in batch]
+    assert flattened == list(range(1, flattened[-1] + 1))
+    assert loaded[1][0] == summarized[0][-1]
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+
+import openai_manager
+from emotion_cache import EmotionScoreCache
+from emotion_scorer import EmotionScore
+
+
+def unsure(message):
+    return EmotionScore(1, 0.1, "model")
+
+
+def test_gpt_failure_falls_back_to_local_score_without_caching(monkeypatch):
+    cache = EmotionScoreCache()
+    monkeypatch.setattr(openai_manager, "emotion_cache", cache)
+    monkeypatch.setattr(openai_manager, "score_emotion_locally", unsure)
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("daily token budget exceeded")
+
+    monkeypatch.setattr(openai_manager, "chat_completion", fail)
+    score = asyncio.run(openai_manager.analyze_emotion_with_gpt_and_pattern("hmm whatever"))
+    assert score == 1
+    assert cache.get("hmm whatever") is None
+
+
+def test_gpt_result_is_cached(monkeypatch):
+    cache = EmotionScoreCache()
+    monkeypatch.setattr(openai_manager, "emotion_cache", cache)
+    monkeypatch.setattr(openai_manager, "score_emotion_locally", unsure)
+
+    async def reply(*args, **kwargs):
+        return "[score:-1]"
+
+    monkeypatch.setattr(openai_manager, "request_openai", reply)
+    score = asyncio.run(openai_manager.analyze_emotion_with_gpt_and_pattern("hmm whatever"))
+    assert score == cache.get("hmm whatever")
+
+
+def test_periodic_save_runs_off_the_event_loop(tmp_path, monkeypatch):
+    path = tmp_path / "emotion_cache.json"
+    cache = EmotionScoreCache(warm_start_file=str(path), save_every=2)
+    slow_save = cache.save
+
+    def save(path=None):
+        time.sleep(0.3)
+        slow_save(path)
+
+    monkeypatch.setattr(cache, "save", save)
+
+    async def main():
+        started = time.monotonic()
+        cache.put("a", 1)
+        cache.put("b", -1)
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(0.5)
+        return elapsed
+
+    assert asyncio.run(main()) < 0.1
+    assert sorted(key for key, _, _ in json.loads(path.read_text(encoding="utf-8"))) == ["a", "b"]
+
+
+def test_story_classification_uses_its_own_cache():
+    from emotion_cache import emotion_cache, story_emotion_cache
+
+    assert story_emotion_cache is not emotion_cache
+    assert story_emotion_cache.warm_start_file != emotion_cache.warm_start_file
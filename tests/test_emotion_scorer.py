@@ -0,0 +1,32 @@
+from emotion_scorer import is_confident, local_scorer
+
+
+def test_negated_stem_outside_lexicon_is_not_confident():
+    # "楽しい"는 사전에 있지만 "楽しくない"는 매칭되지 않음 → 모델만의 판단은 GPT로 확인
+    for message in ("楽しくない", "嬉しくない"):
+        result = local_scorer.score(message)
+        assert not is_confident(result), (message, result)
+
+
+def test_lexicon_backed_scores_stay_confident():
+    assert is_confident(local_scorer.score("楽しい"))
+    assert local_scorer.score("楽しい").score == 1
+    assert local_scorer.score("재미없어").score == -1
+
+
+def test_model_only_neutral_is_not_capped():
+    result = local_scorer.score("hello")
+    assert result.score == 0
+    assert is_confident(result)
+
+
+def test_repeated_laughter_is_not_confident():
+    for message in ("ㅋㅋㅋㅋㅋ", "hahahaha", "ㅋㅋㅋㅋㅋㅋㅋㅋㅋㅋㅋㅋ"):
+        result = local_scorer.score(message)
+        assert not is_confident(result), (message, result)
+
+
+def test_lexicon_term_counts_once_per_message():
+    assert local_scorer.automaton.score("ㅋㅋㅋㅋㅋ") == local_scorer.automaton.score("ㅋㅋ")
+    total, hits = local_scorer.automaton.score("happy happy happy")
+    assert hits == 1
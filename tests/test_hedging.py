@@ -0,0 +1,249 @@
+import asyncio
+import time
+
+import openai
+from aiohttp import web
+
+import openai_manager
+from hedging import HedgedCaller
+from mock_openai_server import MockOpenAIServer
+from usage_tracker import usage_tracker
+
+MESSAGES = [{"role": "user", "content": "hello kagari"}]
+
+
+class ScriptedMockServer(MockOpenAIServer):
+    """요청이 도착한 순서대로 정해진 지연시간을 주입하는 목 서버"""
+
+    def __init__(self, latencies: list):
+        super().__init__({"replay_file": None, "error_rates": {}, "tail_probability": 0.0})
+        self.latencies = list(latencies)
+        self.models = []
+
+    def sample_latency(self) -> float:
+        return self.latencies.pop(0) if self.latencies else 0.01
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.models.append(body.get("model"))
+        return await super().chat_completions(request)
+
+
+def hedging_settings(**overrides):
+    settings = {
+        "initial_deadline": 0.2,
+        "min_samples": 1000,  # 테스트 동안 데드라인 고정
+        "request_timeout": 5.0,
+        "breaker_threshold": 2,
+        "breaker_cooldown": 0.5,
+        "fallback_models": {"gpt-4o-mini": "gpt-4.1-nano"},
+    }
+    settings.update(overrides)
+    return settings
+
+
+def run_against(server: MockOpenAIServer, caller: HedgedCaller, scenario, monkeypatch):
+    """목 서버를 로컬 포트에 띄우고 chat_completion이 그 서버와 caller를 쓰도록 한 뒤 scenario 실행"""
+    monkeypatch.setattr(openai_manager, "hedged_caller", caller)
+    monkeypatch.setitem(usage_tracker.settings, "daily_token_budget", None)
+    monkeypatch.setitem(usage_tracker.settings, "user_daily_token_budget", None)
+    monkeypatch.setattr(openai, "api_key", "mock-key")
+
+    async def main():
+        runner = web.AppRunner(server.build_app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        monkeypatch.setattr(openai, "api_base", f"http://{host}:{port}/v1")
+        try:
+            return await scenario()
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def complete():
+    return openai_manager.chat_completion(MESSAGES, model="gpt-4o-mini", purpose="test", coalesce=False)
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    server = ScriptedMockServer([0.01])
+    caller = HedgedCaller(hedging_settings())
+    response = run_against(server, caller, complete, monkeypatch)
+    assert response.choices[0].message.content.startswith("(smiling)")
+    assert server.stats["requests"] == 1
+    assert caller.stats["hedged"] == 0
+
+
+def test_hedge_fires_after_deadline_and_wins(monkeypatch):
+    server = ScriptedMockServer([2.0, 0.01])
+    caller = HedgedCaller(hedging_settings())
+
+    async def scenario():
+        started = time.monotonic()
+        response = await complete()
+        return response, time.monotonic() - started
+
+    response, elapsed = run_against(server, caller, scenario, monkeypatch)
+    assert response.choices
+    assert server.stats["requests"] == 2
+    assert caller.stats["hedged"] == 1
+    assert caller.stats["hedge_wins"] == 1
+    assert elapsed < 1.0
+    # 느린 첫 요청은 데드라인 초과로 집계
+    assert caller.breaker.failures["gpt-4o-mini"] == 1
+
+
+def test_primary_winning_after_deadline_is_not_a_breaker_timeout(monkeypatch):
+    server = ScriptedMockServer([0.3, 2.0])
+    caller = HedgedCaller(hedging_settings())
+    run_against(server, caller, complete, monkeypatch)
+    assert caller.stats["hedged"] == 1
+    assert caller.stats["hedge_wins"] == 0
+    assert caller.breaker.failures.get("gpt-4o-mini", 0) == 0
+
+
+def test_breaker_opens_to_fallback_model_and_closes_after_cooldown(monkeypatch):
+    # 연속 2회 첫 요청 지연 → 차단기 열림 → 폴백 모델 → 쿨다운 후 원래 모델
+    server = ScriptedMockServer([2.0, 0.01, 2.0, 0.01, 0.01, 0.01])
+    caller = HedgedCaller(hedging_settings())
+
+    async def scenario():
+        await complete()
+        await complete()
+        opened = caller.breaker.is_open("gpt-4o-mini")
+        fallback = await complete()
+        await asyncio.sleep(0.6)
+        closed = not caller.breaker.is_open("gpt-4o-mini")
+        await complete()
+        return opened, fallback, closed
+
+    opened, fallback, closed = run_against(server, caller, scenario, monkeypatch)
+    assert opened
+    assert server.models[4] == "gpt-4.1-nano"
+    assert fallback.model == "gpt-4.1-nano"
+    assert caller.stats["fallback_calls"] == 1
+    assert closed
+    assert server.models[5] == "gpt-4o-mini"
+
+
+def test_cancelled_caller_cancels_primary_request():
+    caller = HedgedCaller(hedging_settings(initial_deadline=5.0))
+
+    async def scenario():
+        state = {"cancelled": False}
+
+        async def slow(model):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        task = asyncio.create_task(caller.call(slow, "gpt-4o-mini"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        return state["cancelled"]
+
+    assert asyncio.run(scenario())
+
+
+def test_cancelled_caller_closes_finished_stream():
+    caller = HedgedCaller(hedging_settings(initial_deadline=5.0))
+
+    class Stream:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    async def scenario():
+        stream = Stream()
+
+        async def opened(model):
+            return stream
+
+        task = asyncio.create_task(caller.call(opened, "gpt-4o-mini"))
+        # 첫 요청이 끝난 직후, 결과를 받기 전에 호출한 쪽이 취소됨
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return stream.closed
+        return None  # 취소 전에 결과를 받은 경우 (스트림 소유권은 호출한 쪽)
+
+    assert asyncio.run(scenario()) in (True, None)
+
+
+def test_losing_request_that_already_answered_is_passed_to_on_discard():
+    caller = HedgedCaller(hedging_settings(initial_deadline=0.05))
+    discarded = []
+
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def factory(model):
+            calls.append(model)
+            if len(calls) == 1:
+                await release.wait()
+                return "primary"
+            # 중복 요청이 첫 요청을 풀어 주어 둘 다 같은 시점에 끝남
+            release.set()
+            return "hedge"
+
+        result, _ = await caller.call(factory, "gpt-4o-mini", on_discard=lambda r, m: discarded.append((r, m)))
+        return result
+
+    result = asyncio.run(scenario())
+    assert caller.stats["hedged"] == 1
+    assert len(discarded) == 1
+    assert discarded[0][0] != result
+    assert discarded[0][1] == "gpt-4o-mini"
+
+
+def test_single_flight_follower_is_budget_checked(monkeypatch):
+    from single_flight import single_flight
+    from usage_tracker import BudgetExceededError, set_usage_context
+
+    async def hang(**kwargs):
+        await asyncio.sleep(10)
+
+    def check_budget(user_id=None):
+        if user_id == 2:
+            raise BudgetExceededError("over budget")
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", hang)
+    monkeypatch.setattr(usage_tracker, "check_budget", check_budget)
+
+    async def follower():
+        set_usage_context(user_id=2)
+        await openai_manager.chat_completion(MESSAGES, model="gpt-4o-mini", purpose="test")
+
+    async def main():
+        set_usage_context(user_id=1)
+        leader = asyncio.create_task(openai_manager.chat_completion(MESSAGES, model="gpt-4o-mini", purpose="test"))
+        await asyncio.sleep(0.01)
+        assert single_flight.inflight() == 1
+        coalesced = single_flight.stats["coalesced"]
+        try:
+            await follower()
+        except BudgetExceededError:
+            raised = True
+        else:
+            raised = False
+        leader.cancel()
+        return raised, single_flight.stats["coalesced"] - coalesced
+
+    raised, joined = asyncio.run(main())
+    assert raised
+    assert joined == 0
@@ -0,0 +1,25 @@
+from language_detector import detect_language, detect_message_language, is_language_mismatch
+
+
+def test_korean_is_stored_under_the_english_channel_language():
+    assert detect_language("안녕하세요 반가워요") == "ko"
+    assert detect_message_language("안녕하세요 반가워요") == "en"
+
+
+def test_short_korean_reaction_keeps_the_old_english_default():
+    # 예전에는 판단 불가로 기본값 en, 지금은 ko로 감지되지만 저장 값은 그대로 en
+    assert detect_language("ㅋㅋ") == "ko"
+    assert detect_message_language("ㅋㅋ") == "en"
+
+
+def test_channel_languages_are_unchanged():
+    assert detect_message_language("こんにちは、元気？") == "ja"
+    assert detect_message_language("你好，今天怎么样") == "zh"
+    assert detect_message_language("hello there") == "en"
+    assert detect_message_language("") == "en"
+
+
+def test_korean_reply_is_not_a_mismatch_for_english_channel():
+    assert not is_language_mismatch("안녕! 오늘 하루는 어땠어? (미소 지으며)", "en")
+    assert is_language_mismatch("안녕! 오늘 하루는 어땠어?", "ja")
+    assert is_language_mismatch("こんにちは、今日はどうだった？", "en")
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import numpy as np
+
+from long_term_memory import LongTermMemory
+from text_embedding import embed_text
+
+
+def make_memory(tmp_path, **settings):
+    return LongTermMemory(dict({"directory": str(tmp_path)}, **settings))
+
+
+def test_load_truncates_partial_writes_on_disk(tmp_path):
+    memory = make_memory(tmp_path)
+    vector_path, record_path = memory._paths(1, "Kagari")
+    vectors = np.stack([embed_text(f"turn {i}") for i in range(3)]).astype(np.float16)
+    # 벡터 2개 + 잘린 세 번째 벡터, 원문 3줄 + 잘린 줄
+    with open(vector_path, "wb") as f:
+        f.write(vectors[:2].tobytes() + vectors[2].tobytes()[:100])
+    with open(record_path, "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps({"user": f"turn {i}", "reply": "", "ts": 0}) + "\n")
+        f.write('{"user": "cut')
+
+    shard = memory._load_shard(1, "Kagari")
+    assert shard.size == 2
+    assert len(np.fromfile(vector_path, dtype=np.float16)) == 2 * memory.dim
+    with open(record_path, encoding="utf-8") as f:
+        assert [json.loads(line)["user"] for line in f] == ["turn 0", "turn 1"]
+
+    # 다음 append가 어긋나지 않고 이어 붙음
+    shard.add(vectors[2], {"user": "turn 2", "reply": "", "ts": 0})
+    memory._flush_shard((1, "Kagari"), shard)
+    reloaded = memory._load_shard(1, "Kagari")
+    assert reloaded.size == 3
+    assert reloaded.records[2]["user"] == "turn 2"
+    assert np.array_equal(reloaded.vectors[2], vectors[2])
+
+
+def test_concurrent_loads_share_one_shard(tmp_path):
+    memory = make_memory(tmp_path)
+
+    async def main():
+        return await asyncio.gather(*(memory._shard(1, "Kagari") for _ in range(5)))
+
+    shards = asyncio.run(main())
+    assert all(shard is shards[0] for shard in shards)
+
+
+def test_evicted_shard_is_flushed_and_reused_while_saving(tmp_path):
+    memory = make_memory(tmp_path, max_loaded_shards=1)
+
+    async def main():
+        first = await memory._shard(1, "Kagari")
+        first.add(embed_text("hello").astype(np.float16), {"user": "hello", "reply": "", "ts": 0})
+        # 두 번째 샤드를 올리며 첫 샤드를 내리는 동안 첫 샤드를 다시 요청
+        loading = asyncio.ensure_future(memory._shard(2, "Kagari"))
+        while (1, "Kagari") not in memory._evicting:
+            await asyncio.sleep(0)
+        again = await memory._shard(1, "Kagari")
+        await loading
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert again is first
+    assert first.persisted == 1
+    assert memory._load_shard(1, "Kagari").size == 1
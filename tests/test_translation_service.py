@@ -0,0 +1,170 @@
+import asyncio
+
+from translation_service import StubTranslator, TranslationService, text_hash
+
+
+class MemoryStore:
+    """PostgresTranslationStore와 같은 get/put 인터페이스의 메모리 저장소"""
+
+    def __init__(self, rows: dict = None):
+        self.rows = dict(rows or {})
+        self.gets = 0
+        self.puts = 0
+
+    def get(self, key: str, target: str):
+        self.gets += 1
+        return self.rows.get((key, target))
+
+    def put(self, key: str, target: str, translated: str):
+        self.puts += 1
+        self.rows[(key, target)] = translated
+
+
+class FailingTranslator:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text: str, target: str) -> str:
+        self.calls += 1
+        raise RuntimeError("translator down")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def run_all(coros):
+    async def gather():
+        return await asyncio.gather(*coros)
+    return asyncio.run(gather())
+
+
+def test_pool_limits_concurrency():
+    stub = StubTranslator(delay=0.05)
+    service = TranslationService(translator=stub, settings={"max_workers": 2})
+    try:
+        results = run_all([service.translate(f"line {i}", "ja") for i in range(8)])
+    finally:
+        service.shutdown()
+    assert results == [f"[ja] line {i}" for i in range(8)]
+    assert stub.calls == 8
+    assert stub.max_active == 2
+
+
+def test_concurrent_identical_requests_share_one_translation():
+    stub = StubTranslator(delay=0.05)
+    service = TranslationService(translator=stub)
+    try:
+        results = run_all([service.translate("hello there", "ja") for _ in range(10)])
+    finally:
+        service.shutdown()
+    assert set(results) == {"[ja] hello there"}
+    assert stub.calls == 1
+
+
+def test_memory_cache_hit_skips_translator_and_store():
+    stub = StubTranslator()
+    store = MemoryStore()
+    service = TranslationService(translator=stub, store=store)
+
+    async def scenario():
+        first = await service.translate("good morning", "zh-CN")
+        second = await service.translate("good morning", "zh-CN")
+        return first, second
+
+    try:
+        first, second = run(scenario())
+    finally:
+        service.shutdown()
+    assert first == second == "[zh-CN] good morning"
+    assert stub.calls == 1
+    assert store.gets == 1 and store.puts == 1
+    assert service.stats["memory_hits"] == 1
+
+
+def test_store_hit_skips_translator():
+    stub = StubTranslator()
+    store = MemoryStore({(text_hash("good night"), "ja"): "おやすみ"})
+    service = TranslationService(translator=stub, store=store)
+    try:
+        result = run(service.translate("good night", "ja"))
+    finally:
+        service.shutdown()
+    assert result == "おやすみ"
+    assert stub.calls == 0
+    assert service.stats["store_hits"] == 1
+
+
+def test_translated_text_is_written_to_store():
+    store = MemoryStore()
+    service = TranslationService(translator=StubTranslator(), store=store)
+    try:
+        run(service.translate("see you", "ja"))
+    finally:
+        service.shutdown()
+    assert store.rows == {(text_hash("see you"), "ja"): "[ja] see you"}
+
+
+def test_translator_error_returns_original_and_is_not_cached():
+    failing = FailingTranslator()
+    store = MemoryStore()
+    service = TranslationService(translator=failing, store=store)
+
+    async def scenario():
+        return [await service.translate("hello", "ja") for _ in range(2)]
+
+    try:
+        results = run(scenario())
+    finally:
+        service.shutdown()
+    assert results == ["hello", "hello"]
+    assert failing.calls == 2
+    assert store.rows == {}
+    assert service.stats["errors"] == 2
+
+
+def test_skips_empty_and_oversized_text():
+    stub = StubTranslator()
+    service = TranslationService(translator=stub, settings={"max_text_chars": 10})
+    try:
+        assert run(service.translate("", "ja")) == ""
+        assert run(service.translate("x" * 11, "ja")) == "x" * 11
+        assert run(service.translate("hello", "")) == "hello"
+    finally:
+        service.shutdown()
+    assert stub.calls == 0
+
+
+def test_google_backend_uses_one_translator_per_thread(monkeypatch):
+    import threading
+
+    import deep_translator
+    from translation_service import GoogleTranslatorBackend
+
+    created = []
+
+    class FakeGoogleTranslator:
+        def __init__(self, source, target):
+            self.target = target
+            created.append(self)
+
+        def translate(self, text):
+            return f"{id(self)}:{text}"
+
+    monkeypatch.setattr(deep_translator, "GoogleTranslator", FakeGoogleTranslator)
+    backend = GoogleTranslatorBackend()
+    results = {}
+
+    def worker(name):
+        results[name] = (backend("a", "ja"), backend("b", "ja"))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 3
+    # 같은 스레드 안에서는 재사용
+    for first, second in results.values():
+        assert first.split(":")[0] == second.split(":")[0]
@@ -0,0 +1,38 @@
+# text_embedding.py
+import unicodedata
+import zlib
+
+import numpy as np
+
+from config import EMBEDDING_CONFIG
+
+
+def _normalize(text: str) -> str:
+    """NFKC + casefold, 문장부호/기호(!, ~, 이모지 등)는 공백으로 치환"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = "".join(" " if unicodedata.category(ch)[0] in "PS" else ch for ch in text)
+    return " ".join(text.split())
+
+
+def embed_text(text: str, dim: int = None, ngram_range=None) -> np.ndarray:
+    """문자 n-gram을 해시 버킷에 누적한 L2 정규화 벡터 (오프라인, 외부 모델 없음)"""
+    dim = dim or EMBEDDING_CONFIG["dim"]
+    low, high = ngram_range or EMBEDDING_CONFIG["ngram_range"]
+    vector = np.zeros(dim, dtype=np.float32)
+    padded = f" {_normalize(text)} "
+    for n in range(low, high + 1):
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i:i + n].encode("utf-8"))
+            # 부호 해싱으로 버킷 충돌 편향 완화
+            vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def embed_texts(texts: list, dim: int = None) -> np.ndarray:
+    dim = dim or EMBEDDING_CONFIG["dim"]
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.stack([embed_text(t, dim) for t in texts])
@@ -0,0 +1,213 @@
+# translation_service.py
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+
+import psycopg2
+
+from config import TRANSLATION_CONFIG
+from single_flight import SingleFlight
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class GoogleTranslatorBackend:
+    """deep_translator GoogleTranslator를 스레드별·대상 언어별로 한 번만 만들어 재사용합니다.
+
+    GoogleTranslator.translate()는 요청 텍스트를 인스턴스 상태에 써 두므로 스레드끼리 공유하면 안 됩니다.
+    """
+
+    def __init__(self):
+        self._local = local()
+
+    def __call__(self, text: str, target: str) -> str:
+        translators = getattr(self._local, "translators", None)
+        if translators is None:
+            translators = self._local.translators = {}
+        translator = translators.get(target)
+        if translator is None:
+            from deep_translator import GoogleTranslator
+            translator = GoogleTranslator(source="auto", target=target)
+            translators[target] = translator
+        return translator.translate(text)
+
+
+class StubTranslator:
+    """네트워크 없이 쓰는 테스트용 번역기 ("[target] text" 반환, 지연시간 흉내 가능)"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0  # 동시에 실행된 최대 번역 수
+        self._lock = Lock()
+
+    def __call__(self, text: str, target: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            return f"[{target}] {text}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class PostgresTranslationStore:
+    """translation_cache 테이블 (2차 캐시, 프로세스 재시작 후에도 유지)"""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+
+    def get(self, key: str, target: str):
+        with psycopg2.connect(self.database_url) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT translated FROM translation_cache
+                    WHERE text_hash = %s AND target_language = %s
+                ''', (key, target))
+                row = cursor.fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, target: str, translated: str):
+        with psycopg2.connect(self.database_url) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO translation_cache (text_hash, target_language, translated)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (text_hash, target_language) DO NOTHING
+                ''', (key, target, translated))
+            conn.commit()
+
+
+class TranslationService:
+    """번역을 제한된 스레드 풀에서 실행하고, 메모리 LRU + 영구 저장소 2단계로 캐시합니다."""
+
+    def __init__(self, translator=None, store=None, settings: dict = None):
+        self.settings = dict(TRANSLATION_CONFIG, **(settings or {}))
+        # translator(text, target) -> str (동기 함수, 스레드 풀에서 실행)
+        self.translator = translator or GoogleTranslatorBackend()
+        self.store = store
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.settings["max_workers"], thread_name_prefix="translate"
+        )
+        self._memory = OrderedDict()  # (text_hash, target): translated
+        self._lock = Lock()
+        self._stats_lock = Lock()
+        self._single_flight = SingleFlight()
+        self.stats = {
+            "requests": 0,
+            "memory_hits": 0,
+            "store_hits": 0,
+            "translations": 0,
+            "errors": 0,
+        }
+
+    def _count(self, name: str):
+        # 워커 스레드와 이벤트 루프 양쪽에서 호출
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _remember(self, key: tuple, translated: str):
+        with self._lock:
+            self._memory[key] = translated
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.settings["memory_max_entries"]:
+                self._memory.popitem(last=False)
+
+    def _translate_blocking(self, text: str, target: str, key: tuple) -> str:
+        """스레드 풀에서 실행: 영구 저장소 확인 → 없으면 번역 후 저장"""
+        if self.store is not None:
+            try:
+                cached = self.store.get(key[0], target)
+            except Exception as e:
+                print(f"Error reading translation cache: {e}")
+                cached = None
+            if cached is not None:
+                self._count("store_hits")
+                return cached
+        translated = self.translator(text, target)
+        self._count("translations")
+        if self.store is not None and translated:
+            try:
+                self.store.put(key[0], target, translated)
+            except Exception as e:
+                print(f"Error saving translation cache: {e}")
+        return translated
+
+    async def translate(self, text: str, target: str) -> str:
+        """번역 결과를 반환합니다. 실패하면 원문을 그대로 반환합니다."""
+        if not text or not target or len(text) > self.settings["max_text_chars"]:
+            return text
+        self._count("requests")
+        key = (text_hash(text), target)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+        if cached is not None:
+            self._count("memory_hits")
+            return cached
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._translate_blocking, text, target, key)
+
+        try:
+            # 같은 (텍스트, 언어) 번역이 진행 중이면 그 결과를 함께 기다림
+            translated = await self._single_flight.do(f"{key[0]}:{target}", run)
+        except Exception as e:
+            self._count("errors")
+            print(f"Translation error: {e}")
+            return text
+        if not translated:
+            return text
+        self._remember(key, translated)
+        return translated
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _default_store():
+    if not TRANSLATION_CONFIG["persistent"]:
+        return None
+    from database_manager import DATABASE_URL
+    return PostgresTranslationStore(DATABASE_URL)
+
+
+_service = None
+
+
+def get_translation_service() -> TranslationService:
+    """프로세스 전역 번역 서비스 (처음 사용할 때 생성)"""
+    global _service
+    if _service is None:
+        _service = TranslationService(store=_default_store())
+    return _service
+
+
+if __name__ == "__main__":
+    # 스텁 번역기로 동시 요청 병합과 캐시 동작 확인: python translation_service.py
+    async def main():
+        stub = StubTranslator(delay=0.2)
+        service = TranslationService(translator=stub)
+        started = time.perf_counter()
+        results = await asyncio.gather(*[service.translate("hello there", "ja") for _ in range(20)])
+        print(f"20 concurrent identical: {time.perf_counter() - started:.2f}s, translator calls={stub.calls}, result={results[0]!r}")
+        started = time.perf_counter()
+        await asyncio.gather(*[service.translate(f"line {i}", "zh-CN") for i in range(8)])
+        print(f"8 distinct (pool={service.settings['max_workers']}): {time.perf_counter() - started:.2f}s")
+        await service.translate("hello there", "ja")
+        print(service.stats)
+        service.shutdown()
+
+    asyncio.run(main())
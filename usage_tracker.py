@@ -0,0 +1,172 @@
+# usage_tracker.py
+import asyncio
+import contextvars
+import threading
+from datetime import date
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import USAGE_CONFIG
+
+# 현재 처리 중인 메시지의 유저/캐릭터/채널 (코루틴 단위로 전파됨)
+usage_context = contextvars.ContextVar("usage_context", default={})
+
+
+def set_usage_context(user_id: int = None, character_name: str = None, channel_id: int = None):
+    """이후 같은 태스크에서 발생하는 LLM 호출을 이 유저/캐릭터/채널로 집계합니다."""
+    usage_context.set({"user_id": user_id, "character_name": character_name, "channel_id": channel_id})
+
+
+def set_route_context(route: str):
+    """라우팅 결정을 이후 LLM 호출 기록(llm_usage.route)에 남깁니다."""
+    usage_context.set({**usage_context.get(), "route": route})
+
+
+class BudgetExceededError(Exception):
+    pass
+
+
+def _database_url() -> str:
+    # database_manager는 import 시 테이블을 만들므로 DB가 필요할 때만 불러옴
+    from database_manager import DATABASE_URL
+    return DATABASE_URL
+
+
+class UsageTracker:
+    """LLM 호출별 토큰/지연시간/비용을 모아 배치로 llm_usage 테이블에 기록합니다."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(USAGE_CONFIG, **(settings or {}))
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_handle = None
+        self._day = date.today()
+        self._daily_tokens = None  # 오늘 전체 토큰 (첫 조회 시 DB에서 로드)
+        self._user_tokens = {}  # user_id: 오늘 토큰
+        self.totals = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "cost_usd": 0.0,
+            "latency_ms": 0,
+        }
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        prices = self.settings["model_prices"].get(model)
+        if not prices:
+            return 0.0
+        uncached = max(prompt_tokens - cached_tokens, 0)
+        return (
+            uncached * prices["prompt"]
+            + cached_tokens * prices["cached"]
+            + completion_tokens * prices["completion"]
+        ) / 1_000_000
+
+    def _roll_day(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._daily_tokens = None
+            self._user_tokens = {}
+
+    def _load_tokens_today(self, user_id: int = None) -> int:
+        try:
+            with psycopg2.connect(_database_url()) as conn:
+                with conn.cursor() as cursor:
+                    if user_id is None:
+                        cursor.execute('''
+                            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+                            FROM llm_usage WHERE created_at >= CURRENT_DATE
+                        ''')
+                    else:
+                        cursor.execute('''
+                            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+                            FROM llm_usage WHERE user_id = %s AND created_at >= CURRENT_DATE
+                        ''', (user_id,))
+                    return int(cursor.fetchone()[0])
+        except Exception as e:
+            print(f"Error loading token usage: {e}")
+            return 0
+
+    def check_budget(self, user_id: int = None):
+        """일일 예산을 넘었으면 BudgetExceededError를 발생시킵니다."""
+        self._roll_day()
+        daily_budget = self.settings["daily_token_budget"]
+        if daily_budget:
+            if self._daily_tokens is None:
+                self._daily_tokens = self._load_tokens_today()
+            if self._daily_tokens >= daily_budget:
+                raise BudgetExceededError(f"daily token budget exceeded ({self._daily_tokens}/{daily_budget})")
+        user_budget = self.settings["user_daily_token_budget"]
+        if user_budget and user_id is not None:
+            if user_id not in self._user_tokens:
+                self._user_tokens[user_id] = self._load_tokens_today(user_id)
+            if self._user_tokens[user_id] >= user_budget:
+                raise BudgetExceededError(f"user {user_id} daily token budget exceeded ({self._user_tokens[user_id]}/{user_budget})")
+
+    def record(self, model: str, purpose: str, prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int = 0, latency_ms: int = 0, user_id: int = None,
+               character_name: str = None, channel_id: int = None, route: str = None):
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        tokens = prompt_tokens + completion_tokens
+        self._roll_day()
+        if self._daily_tokens is not None:
+            self._daily_tokens += tokens
+        if user_id in self._user_tokens:
+            self._user_tokens[user_id] += tokens
+        self.totals["calls"] += 1
+        self.totals["prompt_tokens"] += prompt_tokens
+        self.totals["completion_tokens"] += completion_tokens
+        self.totals["cached_tokens"] += cached_tokens
+        self.totals["cost_usd"] += cost
+        self.totals["latency_ms"] += latency_ms
+        with self._lock:
+            self._buffer.append((
+                user_id, character_name, channel_id, purpose, model,
+                prompt_tokens, completion_tokens, cached_tokens, latency_ms, cost, route
+            ))
+            full = len(self._buffer) >= self.settings["batch_size"]
+        self._schedule_flush(immediate=full)
+
+    def _schedule_flush(self, immediate: bool = False):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if immediate:
+                self.flush()
+            return
+        if immediate:
+            loop.run_in_executor(None, self.flush)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.settings["flush_interval"], self._flush_in_executor, loop)
+
+    def _flush_in_executor(self, loop):
+        self._flush_handle = None
+        loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        """버퍼에 쌓인 기록을 한 번의 multi-row INSERT로 저장합니다."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            with psycopg2.connect(_database_url()) as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, '''
+                        INSERT INTO llm_usage
+                        (user_id, character_name, channel_id, purpose, model,
+                         prompt_tokens, completion_tokens, cached_tokens, latency_ms, cost_usd, route)
+                        VALUES %s
+                    ''', rows)
+                conn.commit()
+        except Exception as e:
+            print(f"Error flushing LLM usage ({len(rows)} rows): {e}")
+            # 실패한 기록은 다음 flush에서 다시 시도
+            with self._lock:
+                self._buffer = (rows + self._buffer)[-self.settings["batch_size"] * 20:]
+
+
+usage_tracker = UsageTracker()